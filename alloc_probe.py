@@ -0,0 +1,99 @@
+"""Heap allocation instrumentation per control-loop stage.
+
+With ``config.ALLOC_PROBE`` enabled, ``main`` wraps every stage
+(sensor, safety, MPPT, PWM, LCD) with :meth:`AllocProbe.wrap`, which
+records how many heap bytes the stage allocated each time it ran:
+
+* On MicroPython the difference of ``gc.mem_alloc()`` before and after
+  the stage.  A garbage collection inside the stage makes the
+  difference negative; such samples are counted in ``collections`` and
+  otherwise ignored.
+* On CPython (host) the ``tracemalloc`` peak above the level at the
+  start of the stage.  CPython allocates every int above 256, so a
+  stage that is allocation-free on the Pico still shows a few dozen
+  bytes here; see ``host/check_alloc.py``.
+
+Results live in preallocated arrays indexed like ``names``: ``last``,
+``peak`` and ``total`` bytes, plus ``runs``.  :meth:`AllocProbe.dump`
+prints them.  When the option is off nothing is wrapped and the loop
+pays nothing.
+"""
+
+import gc
+from array import array
+
+try:
+    _mem_alloc = gc.mem_alloc
+    _tracemalloc = None
+except AttributeError:  # CPython
+    import tracemalloc as _tracemalloc
+    _mem_alloc = None
+
+# main の各ステージ
+STAGES = ("sensor", "safety", "mppt", "pwm", "lcd")
+
+
+class AllocProbe:
+    """Per-stage allocation counters.
+
+    Args:
+        names: Stage names; ``wrap(i, fn)`` records into slot ``i``.
+    """
+
+    def __init__(self, names=STAGES):
+        n = len(names)
+        self.names = names
+        self.last = array("i", bytes(4 * n))
+        self.peak = array("i", bytes(4 * n))
+        self.total = array("i", bytes(4 * n))
+        self.runs = array("i", bytes(4 * n))
+        self.collections = 0
+        self._mark = 0
+        if _tracemalloc is not None and not _tracemalloc.is_tracing():
+            _tracemalloc.start()
+
+    def reset(self) -> None:
+        for i in range(len(self.names)):
+            self.last[i] = 0
+            self.peak[i] = 0
+            self.total[i] = 0
+            self.runs[i] = 0
+        self.collections = 0
+
+    def start(self) -> None:
+        if _mem_alloc is not None:
+            self._mark = _mem_alloc()
+        else:
+            self._mark = _tracemalloc.get_traced_memory()[0]
+            _tracemalloc.reset_peak()
+
+    def stop(self, i: int) -> None:
+        if _mem_alloc is not None:
+            used = _mem_alloc() - self._mark
+            if used < 0:
+                self.collections += 1
+                return
+        else:
+            used = _tracemalloc.get_traced_memory()[1] - self._mark
+        self.last[i] = used
+        if used > self.peak[i]:
+            self.peak[i] = used
+        self.total[i] += used
+        self.runs[i] += 1
+
+    def wrap(self, i: int, fn):
+        """Return ``fn`` wrapped so that its allocations go to slot ``i``."""
+        def probed(ctx):
+            self.start()
+            fn(ctx)
+            self.stop(i)
+        return probed
+
+    def dump(self) -> None:
+        print("stage     last   peak   mean  runs")
+        for i in range(len(self.names)):
+            runs = self.runs[i]
+            mean = self.total[i] // runs if runs else 0
+            print("%-7s %6d %6d %6d %5d" % (self.names[i], self.last[i], self.peak[i], mean, runs))
+        if self.collections:
+            print("gc during stage:", self.collections)
@@ -0,0 +1,113 @@
+"""Multi-point ADC calibration with precomputed lookup tables.
+
+A channel listed in ``config.SENSE_CALIBRATION`` is converted with a
+per-board curve instead of the single ``scale`` / ``offset`` of
+``config.SENSE_CHANNELS``.  The curve is given as calibration points
+``(raw, value)``: the trimmed mean in 16-bit ADC counts and the
+reference value in mV / mA, as fitted by ``host/calibrate.py``.
+
+At boot :func:`build_table` turns the points into a table of the value
+at every ``1 << SHIFT`` counts (65 ``int`` entries, 260 bytes per
+channel), linear between the points and extended with the end
+segments.  :func:`convert` is then an index by shift, a mask and one
+interpolation multiply, all small ints::
+
+    k = raw >> SHIFT
+    value = table[k] + ((table[k + 1] - table[k]) * (raw & MASK) + HALF) >> SHIFT
+
+``config.SENSE_TEMP_COEFF`` adds an offset that follows the RP2040 die
+temperature (ADC channel 4): ``coeff * (temp - temp_ref)`` is
+subtracted from the converted value.  The temperature is read every
+``config.SENSE_TEMP_EVERY`` acquisitions and the correction worked out
+then, so a normal acquisition only subtracts a precomputed integer.
+
+To calibrate a board, apply known voltages / currents and, for each,
+run :func:`dump_raw` from the REPL; add the reference value (mV / mA)
+to the printed rows and feed them to ``host/calibrate.py``.
+"""
+
+from array import array
+
+SHIFT = 10
+MASK = (1 << SHIFT) - 1
+HALF = 1 << (SHIFT - 1)
+SIZE = (65536 >> SHIFT) + 1
+
+
+def _interpolate(points, raw):
+    """Value of the piecewise-linear curve through ``points`` at ``raw`` (float)."""
+    k = 1
+    while k < len(points) - 1 and raw > points[k][0]:
+        k += 1
+    r0, v0 = points[k - 1]
+    r1, v1 = points[k]
+    return v0 + (v1 - v0) * (raw - r0) / (r1 - r0)
+
+
+def build_table(points) -> array:
+    """Table of the curve through ``points`` at every ``1 << SHIFT`` counts."""
+    points = sorted(points)
+    if len(points) < 2:
+        raise ValueError("calibration: need at least two points")
+    for k in range(1, len(points)):
+        if points[k][0] == points[k - 1][0]:
+            raise ValueError("calibration: duplicate raw value %d" % points[k][0])
+    table = array("i", bytes(4 * SIZE))
+    for k in range(SIZE):
+        v = _interpolate(points, k << SHIFT)
+        table[k] = int(v + (0.5 if v >= 0 else -0.5))
+    return table
+
+
+def convert(table, raw: int) -> int:
+    k = raw >> SHIFT
+    v = table[k]
+    return v + (((table[k + 1] - v) * (raw & MASK) + HALF) >> SHIFT)
+
+
+def raw_above(table, value: int) -> int:
+    """Smallest raw count that converts above ``value`` (``1 << 30`` if none).
+
+    Assumes the table increases, as a sensor curve does.
+    """
+    if convert(table, 65535) <= value:
+        return 1 << 30
+    lo = 0
+    hi = 65535
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        if convert(table, mid) > value:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def temp_decicelsius(raw: int) -> int:
+    """RP2040 die temperature [0.1 degC] from a ``read_u16`` of ADC channel 4.
+
+    27 degC at 0.706 V, -1.721 mV / degC (RP2040 datasheet).
+    """
+    mv = (raw * 3300 + 32768) >> 16
+    return 270 - (mv - 706) * 10000 // 1721
+
+
+def dump_raw(ctx, cycles=32) -> None:
+    """Print ``channel,raw,temp_c`` rows averaged over ``cycles`` acquisitions."""
+    from machine import ADC  # type: ignore
+    adc = ctx.hw_io.adc
+    temp_adc = adc.temp_adc if adc.temp_adc is not None else ADC(4)
+    totals = [0] * len(adc.channels)
+    temp = 0
+    for _ in range(cycles):
+        adc.acquire(ctx.buffer, ctx.state.meas)
+        for i, ch in enumerate(adc.channels):
+            totals[i] += ch.raw
+        temp += temp_decicelsius(temp_adc.read_u16())
+    for i, ch in enumerate(adc.channels):
+        print("%s,%d,%.1f" % (ch.name, (totals[i] + cycles // 2) // cycles, temp / cycles / 10))
+
+
+def temp_correction(coeff_q8: int, ref_dc: int, temp_dc: int) -> int:
+    """Offset [mV / mA] to subtract at ``temp_dc``; ``coeff_q8`` is per 0.1 degC * 256."""
+    return (coeff_q8 * (temp_dc - ref_dc) + 128) >> 8
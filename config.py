@@ -10,6 +10,17 @@ B_VOLT_RT = 25          # バッテリー分圧比
 # safety
 I_LIMIT =   100 #時間足りずこの値で実装
 BV_LIMIT = 15            # バッテリー電圧上限
+# 制御ループは mV / mA の整数で比べる（I_LIMIT_MA / BV_LIMIT_MV、derive() で換算する）
+
+# タイマー割り込みによる即時遮断（fast_trip.py）。メインループとは独立に動く
+# ADC をサンプリングと共有する（割り込みがマルチプレクサを切り替える）ので既定では使わない。
+# 使うときは TRIP_I_LIMIT / TRIP_BV_LIMIT を ADC で測れる値にしておくこと（範囲外は起動時にエラー）
+TRIP_ENABLE = False
+TRIP_FREQ_HZ = 1000      # 監視周期 [Hz]
+TRIP_COUNT = 5           # 連続で超えたら遮断する回数（ADC のスパイク除け。5 ms）
+TRIP_I_LIMIT = None      # パネル電流のハードリミット [A]（None なら I_LIMIT）
+TRIP_BV_LIMIT = None     # バッテリー電圧のハードリミット [V]（None なら BV_LIMIT）
+TRIP_RESET_COUNT = 100   # 遮断後、安全確認で値がリミット内の回数がこれだけ続いたら解除する（50 ms 周期で 5 秒）
 
 #--------------------------------------
 #PWMのPin番号
@@ -17,6 +28,40 @@ ADC_PIN_BATTERY = 26  # バッテリー電圧
 ADC_PIN_PANEL_V = 27  # パネル電圧
 ADC_PIN_PANEL_I = 28  # パネル電流
 
+#--------------------------------------
+# ADC サンプリング
+# (Measurements の属性名, ADCピン, サンプル数, 下側で捨てる数, 上側で捨てる数, 倍率, オフセット)
+# 値 = トリム平均 * 倍率 - オフセット（0 未満は 0 にする）。値は mV / mA の整数。
+# 倍率は起動時に整数の固定小数点に直すので、制御ループでは float を作らない。
+# 分圧比などから決まるので SENSE_CHANNELS は derive() で組み立てる。
+# チャネルを増やすときはそこに 1 行足して Measurements に属性を追加する。
+# 多点校正（calibration.py）: チャネル名: ((ADC の値 16bit, 値 [mV / mA]), ...)。
+# 書いたチャネルは上の倍率/オフセットの代わりに、この点を結ぶ折れ線で換算する（起動時に表にする）。
+# host/calibrate.py が基準器での測定から calib_site.py に書き出す
+SENSE_CALIBRATION = {}
+# 温度によるオフセットのずれ: チャネル名: (係数 [mV or mA / ℃], 基準温度 [℃])。
+# RP2040 の内蔵温度センサで測り、係数 * (温度 - 基準温度) を値から引く
+SENSE_TEMP_COEFF = {}
+SENSE_TEMP_EVERY = 20    # 温度を読むのは測定の何回に 1 回か（50 ms 周期なら 1 秒ごと）
+# 1 回の測定にかけてよい時間 [us]。超えそうなら全チャネルのサンプル数を同じ割合で減らす
+SENSE_BUDGET_US = 5000
+# 適応オーバーサンプリング: ノイズに合わせてサンプル数を増減する
+SENSE_ADAPTIVE = False
+# チャネル名: (最小サンプル数, 最大サンプル数, 平均値の目標標準誤差 [ADCカウント(16bit)])
+SENSE_ADAPT = {
+    "p_voltage_mv": (12, 64, 16),
+    "p_current_ma": (24, 160, 16),
+    "b_voltage_mv": (12, 64, 16),
+}
+# 測定値の履歴の件数（センサー周期ごとに 1 件。50 ms なら 256 件で約 13 秒）
+HISTORY_LEN = 256
+# 2 コア: 第 2 コアで測定を回し続け、制御ループは最新の測定結果を受け取るだけにする
+SENSE_DUAL_CORE = False
+# 第 2 コアで 1 回測定するごとに休む時間 [us]（0 なら休まず測り続ける）
+SENSE_WORKER_PAUSE_US = 0
+# 新しい測定結果が来ない読み出しがこの回数続いたら第 2 コアを諦めて第 1 コアで測る
+SENSE_STALE_LIMIT = 20
+
 #--------------------------------------
 #PWMのPin番号
 PWM_PIN = 21            # PWMの出力PIN
@@ -34,12 +79,116 @@ PWM_DUTY_U16_INIT = 0   # 初期デューティ
 
 MPPT_MIN_RATIO = 0.2
 MPPT_MAX_RATIO = 0.85
-# ユニット 0..65535 での境界値
-MPPT_MIN_DUTY = int(PWM_MAX * MPPT_MIN_RATIO)
-MPPT_MAX_DUTY = int(PWM_MAX * MPPT_MAX_RATIO)
+# ユニット 0..65535 での境界値 MPPT_MIN_DUTY / MPPT_MAX_DUTY は derive() で決める
 # ヒルクライムステップ幅（最小〜最大範囲から任意に調整）
 MPPT_STEP = 200
 
+# MPPT のアルゴリズム: "po_fixed"（固定ステップ山登り）/ "po_seek"（po_fixed + 低電力時の探索）
+#                     / "po_variable"（可変ステップ山登り）/ "inc_cond"（インクリメンタルコンダクタンス法）
+MPPT_STRATEGY = "po_fixed"
+# 可変ステップ: ステップ幅 = 係数 * |dP / dDuty| [W / duty カウント] を最小〜最大で制限
+MPPT_VS_GAIN = 100000.0
+MPPT_VS_MIN_STEP = 20
+MPPT_VS_MAX_STEP = 1500
+# この電力 [W] 未満では po_fixed 以外の戦略は duty を MPPT_VS_MAX_STEP ずつ上げて電流が流れる所を探す
+MPPT_SEEK_POWER = 0.5
+# IncCond: |dP/dV| が 電流 * この値 以下なら MPP とみなして duty を保持
+MPPT_IC_EPS = 0.02
+# 制御ループ用の整数版 MPPT_VS_GAIN_MW / MPPT_SEEK_POWER_MW / MPPT_IC_EPS_Q10 は derive() で決める
+
+# グローバルスキャン: 部分日陰でできる局所最大から抜けるため、duty を
+# MPPT_MIN_DUTY〜MPPT_MAX_DUTY で粗く掃引 → 最良点の周りを細かく掃引して
+# 最良点から山登りを再開する。1 制御周期に 1 点ずつ進む。
+MPPT_SCAN = False
+# 定期スキャンの間隔 [ms]
+MPPT_SCAN_INTERVAL_MS = 600000
+# 電力が平均からこの割合以上急に落ちたらスキャンする（0 で無効）
+MPPT_SCAN_DROP = 0.3
+# 電力低下によるスキャンの最小間隔 [ms]
+MPPT_SCAN_MIN_GAP_MS = 60000
+# 粗い掃引 / 細かい掃引の点数
+MPPT_SCAN_COARSE = 16
+MPPT_SCAN_FINE = 8
+
+#--------------------------------------
+# 起動シーケンス（sequence_first.py）
+# duty を段階的に上げる: (開始, 終了, 刻み, 1 刻みごとの待ち [s])
+STARTUP_STAGES = (
+    (0, 5000, 500, 0.06),
+    (5000, 10000, 500, 0.10),
+    (10000, 13000, 200, 0.09),
+)
+# "stages": STARTUP_STAGES の通りに上げる
+# "adaptive": 測定値の応答を見ながら刻みを変える（線形に応答する間は大きく、限界付近では小さく）
+STARTUP_MODE = "stages"
+# 以下は "adaptive" 用
+STARTUP_TARGET = None        # ここまで上げたら終了（None なら MPPT_MIN_DUTY。それより下にはしない）
+STARTUP_STEP_MIN = 200       # 刻みの最小 / 最大
+STARTUP_STEP_MAX = 2000
+STARTUP_SETTLE_MS = 10       # duty を変えてから測るまでの待ち [ms]
+STARTUP_FAST_SAMPLES = 24    # 1 刻みごとの測定の総サンプル数（通常は 136）
+# 応答の変化量が直前の刻みからの線形予測とこの割合以上ずれたら刻みを半分にする（ずれなければ倍）
+STARTUP_LINEAR_TOL = 0.25
+# この変化量 [mV / mA] 以下は測定ノイズとみなす
+STARTUP_NOISE_MV = 150
+STARTUP_NOISE_MA = 60
+# バッテリー電圧・パネル電流がリミットのこの割合を超えたら最小の刻みにする
+STARTUP_MARGIN = 0.9
+# 電力が MPPT_SEEK_POWER 以上で、1 刻みの変化がこの割合以下の状態が STARTUP_SETTLE_STEPS 回
+# 続いたら目標前でも終了して MPPT に任せる
+STARTUP_SETTLE_POWER = 0.02
+STARTUP_SETTLE_STEPS = 3
+# 制御ループ用の整数版（STARTUP_*_Q8 / STARTUP_*_MARGIN_*）は derive() で決める
+
+#--------------------------------------
+# スケジューラ（main.py）の周期 [ms]
+# ホストのシミュレーション（host/run.py）の速さはほぼ SCHED_CONTROL_MS で決まる（50 ms で x100、300 ms で x570）
+SCHED_CONTROL_MS = 50   # センサー → 安全確認 → PWM
+SCHED_MPPT_MS = 300     # MPPT
+SCHED_LCD_MS = 500      # LCD 表示
+# ステージごとのヒープ確保量を測る（alloc_probe.py）。ctx.probe に結果が入る
+ALLOC_PROBE = False
+# ステージごとの処理時間を ticks_us で測る（time_probe.py）。ctx.profile に結果が入る
+PROFILE_STAGES = False
+# 処理時間のヒストグラムの区切り [us]（最後の区切り以上は最後のビンに入る）
+PROFILE_BUCKETS_US = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000)
+# LCD に処理時間のページを出す長さ [ms]。通常のページと交互に表示する（0 で出さない）
+PROFILE_LCD_PAGE_MS = 0
+# main_async: 状態を print する周期 [ms]（0 で無効）
+ASYNC_TELEMETRY_MS = 0
+
+#--------------------------------------
+# データロガー（data_log.py）。固定長のバイナリレコードを RAM に溜めてブロック単位でフラッシュに書く
+LOG_ENABLE = False
+# 書き込み先。相対パス（Pico ではルートの下なので /log、ホストでは実行したディレクトリの下）
+LOG_DIR = "log"
+LOG_PERIOD_MS = 60000    # 1 レコードの間隔 [ms]（この間の平均を記録する）
+LOG_BLOCK_SIZE = 4096    # フラッシュへ書く単位 [bytes]（littlefs のブロックと同じ）
+LOG_FILE_BLOCKS = 12     # 1 ファイルのブロック数
+LOG_FILES = 16           # ローテーションするファイル数（60 s ごとなら約 4 週間分）
+# 満杯のブロックは制御周期の直後に少しずつ書く [bytes]（0 なら一度に書く）。
+# フラッシュ書き込み中は割り込みも第 2 コアも止まるので、1 回の停止をこの大きさの書き込みに抑える
+LOG_WRITE_CHUNK = 512
+
+#--------------------------------------
+# ウォームスタート（warm_start.py）。追従中の duty をバンドごとの表に覚えてフラッシュに残し、
+# 起動時はバッテリー電圧と開放電圧から近い値を選んでそこまで duty を上げる
+WARM_START = False
+WARM_PATH = "/warm.bin"
+# バンドの区切り [mV]（区切りの数 + 1 個のバンドになる）
+WARM_BV_BANDS_MV = (11800, 12200, 12600, 13000, 13400, 13800)
+WARM_PV_BANDS_MV = (14000, 15000, 16000, 17000, 18000, 19000, 20000)
+# 起動時は 開放電圧 * この割合 を MPP の電圧とみなす（結晶シリコンで 0.76〜0.85 程度）
+WARM_VMP_RATIO = 0.82
+WARM_SAMPLE_MS = 5000    # 動作点を表に取り込む周期 [ms]
+WARM_SAVE_MS = 600000    # フラッシュに書く最小の間隔 [ms]
+WARM_MIN_CHANGE = 300    # 保存済みの値からこれ以上変わったバンドがあるときだけ書く [duty]
+
+#--------------------------------------
+# バイナリテレメトリ（telemetry.py）。USB シリアルにフレームを送る周期 [ms]（0 で無効）
+# ホストが読んでいなければフレームは捨てる（制御ループは待たない）
+TELEMETRY_MS = 0
+
 #--------------------------------------
 # LEDのPin番号
 LED_PIN_ONBOARD = "LED"  # 基板上LED
@@ -53,3 +202,71 @@ LCD_I2C_NO  = 0     #バス番号
 LCD_SDA_PIN = 0     #SDA
 LCD_SCL_PIN = 1     #SCL
 LCD_ADDR    = 0x3C  #スレイブアドレス
+
+#--------------------------------------
+# 上書き
+# 基板ごとの校正値は host/calibrate.py が書き出す calib_site.py、
+# 現場ごとの調整値は host/autotune.py が書き出す config_site.py。あればこの順に上の値を上書きする。
+# 換算した値は上書きの後で derive() が決めるので、元の値（I_LIMIT など）を変えればそれに従う。
+# 換算した値そのもの（MPPT_MIN_DUTY など）を書いた場合はそちらが優先される。
+def _load_site(names) -> tuple:
+    """Copy the public names of the site modules that exist; returns the names set."""
+    g = globals()
+    out = ()
+    for site in names:
+        try:
+            module = __import__(site)
+        except ImportError:
+            continue
+        for name in dir(module):
+            if not name.startswith("_"):
+                g[name] = getattr(module, name)
+                out += (name,)
+    return out
+
+
+SITE_NAMES = _load_site(("calib_site", "config_site"))
+
+
+def derive(keep=()) -> None:
+    """Set the values worked out from the settings above.
+
+    Called once at the end of this file, after the site overrides, and
+    again by host tools that change a setting at run time.  Names in
+    ``keep`` and in ``SITE_NAMES`` (set by a site file) are left alone.
+    """
+    g = globals()
+
+    def put(name, value):
+        if name not in keep and name not in SITE_NAMES:
+            g[name] = value
+
+    # safety: 制御ループは mV / mA の整数で比べる
+    put("I_LIMIT_MA", int(I_LIMIT * 1000))
+    put("BV_LIMIT_MV", int(BV_LIMIT * 1000))
+    # ADC サンプリング
+    # (Measurements の属性名, ADCピン, サンプル数, 下側で捨てる数, 上側で捨てる数, 倍率, オフセット)
+    put("SENSE_CHANNELS", (
+        ("p_voltage_mv", ADC_PIN_PANEL_V, 26, 5, 5, 3300.0 * P_VOLT_RT / 65535.0, 0.0),
+        ("p_current_ma", ADC_PIN_PANEL_I, 84, 10, 10, 3300.0 * P_CURRENT / 65535.0,
+         P_CURRENT_REV * 1000),
+        ("b_voltage_mv", ADC_PIN_BATTERY, 26, 5, 5, 3300.0 * B_VOLT_RT / 65535.0, 0.0),
+    ))
+    # MPPT: duty の範囲（ユニット 0..65535）と整数版（電力は mW、割合は 1024 倍）
+    put("MPPT_MIN_DUTY", int(PWM_MAX * MPPT_MIN_RATIO))
+    put("MPPT_MAX_DUTY", int(PWM_MAX * MPPT_MAX_RATIO))
+    put("MPPT_VS_GAIN_MW", int(MPPT_VS_GAIN / 1000 + 0.5))
+    put("MPPT_SEEK_POWER_MW", int(MPPT_SEEK_POWER * 1000))
+    put("MPPT_IC_EPS_Q10", int(MPPT_IC_EPS * 1024 + 0.5))
+    # 電力低下スキャン: 平均のこの割合を下回ったらスキャンする
+    put("MPPT_SCAN_KEEP_Q10", int((1.0 - MPPT_SCAN_DROP) * 1024 + 0.5))
+    # 起動シーケンス（割合は 256 倍。マージンは換算済みのリミットから）
+    put("STARTUP_LINEAR_TOL_Q8", int(STARTUP_LINEAR_TOL * 256 + 0.5))
+    put("STARTUP_SETTLE_POWER_Q8", int(STARTUP_SETTLE_POWER * 256 + 0.5))
+    put("STARTUP_BV_MARGIN_MV", int(g["BV_LIMIT_MV"] * STARTUP_MARGIN))
+    put("STARTUP_I_MARGIN_MA", int(g["I_LIMIT_MA"] * STARTUP_MARGIN))
+    # ウォームスタート
+    put("WARM_VMP_RATIO_Q8", int(WARM_VMP_RATIO * 256 + 0.5))
+
+
+derive()
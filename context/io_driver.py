@@ -1,18 +1,21 @@
 from config import \
     PWM_PIN,PWM_FREQ_HZ,PWM_DUTY_U16_INIT,\
     LED_PIN_ONBOARD,LED_PIN_RED,LED_PIN_GREEN,\
-    LCD_I2C_NO,LCD_SDA_PIN,LCD_SCL_PIN,LCD_ADDR
+    LCD_I2C_NO,LCD_SDA_PIN,LCD_SCL_PIN,LCD_ADDR,\
+    SENSE_DUAL_CORE,TRIP_ENABLE
 from pwm_ctrl import PwmHardware
 from sensor_ctrl import AdcChannels
 from lcd_ctrl import LCDManager
 from machine import Pin
 
 class HardwareIO:
-    def __init__(self,pwm,adc,leds,lcd) -> None:
+    def __init__(self,pwm,adc,leds,lcd,sampler=None,trip=None) -> None:
         self.pwm    = pwm
         self.adc    = adc 
         self.leds   = leds 
         self.lcd    = lcd
+        self.sampler = sampler      # 第 2 コアの測定（使わなければ None）
+        self.trip   = trip          # タイマー割り込みの即時遮断（使わなければ None）
 
 class Leds:
     """
@@ -28,8 +31,17 @@ def create_instance_hardware():
 
     pwm   = PwmHardware(PWM_PIN,PWM_FREQ_HZ,PWM_DUTY_U16_INIT)
     adc   = AdcChannels()
+    trip  = None
+    if TRIP_ENABLE:
+        from fast_trip import FastTrip
+        trip = FastTrip(pwm,adc)
+        trip.start()                # 起動シーケンスより前から監視する
     leds  = Leds()
     lcd   = LCDManager(LCD_I2C_NO,LCD_SDA_PIN,LCD_SCL_PIN,LCD_ADDR)
+    sampler = None
+    if SENSE_DUAL_CORE:
+        from sensor_dual import DualCoreSampler
+        sampler = DualCoreSampler(adc)
 
-    hw_io = HardwareIO(pwm,adc,leds,lcd)
+    hw_io = HardwareIO(pwm,adc,leds,lcd,sampler,trip)
     return hw_io
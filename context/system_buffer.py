@@ -1,16 +1,40 @@
 # buffer.py などに置く想定
+from array import array
+
+import config
+
 
 class MeasureBuffer:
     """
     測定で使うメモリを確保しておくだけのクラス。
+
+    config.SENSE_CHANNELS の各チャネルに、サンプル数ぶんの
+    array('H') をチャネル名で用意する。適応オーバーサンプリングの
+    最大サンプル数の方が多ければそちらに合わせる（トリムはその回のサンプル数ぶんだけを見る）。
+    low / high はトリムで捨てる値を入れておく場所（捨てる数もサンプル数に比例して増える）。
     """
 
-    def __init__(self):
-        # PI: 電流測定用バッファ
-        self.pi_buffer = [0] * 84
+    def __init__(self, specs=None):
+        if specs is None:
+            specs = config.SENSE_CHANNELS
+        self.buffers = {}
+        self.low = {}
+        self.high = {}
+        for spec in specs:
+            count = spec[2]
+            n = count
+            bounds = config.SENSE_ADAPT.get(spec[0])
+            if bounds is not None and bounds[1] > n:
+                n = bounds[1]
+            self.buffers[spec[0]] = array("H", bytes(2 * n))
+            self.low[spec[0]] = array("H", bytes(2 * (spec[3] * n // count)))
+            self.high[spec[0]] = array("H", bytes(2 * (spec[4] * n // count)))
 
         # PV: 太陽電池電圧測定用バッファ
-        self.pv_buffer = [0] * 26
+        self.pv_buffer = self.buffers.get("p_voltage_mv")
+
+        # PI: 電流測定用バッファ
+        self.pi_buffer = self.buffers.get("p_current_ma")
 
         # BV: バッテリ電圧測定用バッファ
-        self.bv_buffer = [0] * 26
+        self.bv_buffer = self.buffers.get("b_voltage_mv")
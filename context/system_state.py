@@ -1,4 +1,6 @@
-from collections import deque
+from array import array
+
+import config
 
 
 class SafetyState:
@@ -6,11 +8,14 @@ class SafetyState:
 
     - status: One of "normal", "warning", or "shutdown".
     - overcurrent_count / overvoltage_count: Consecutive cycles exceeding limit.
+    - trip_cause: Cause latched by the timer trip (fast_trip.CAUSE_*), 0 if none.
+    - trip_clear_count: Consecutive checks within limits while the trip is latched.
 
     The safety module updates these counters and status based on measured values.
     """
 
-    __slots__ = ("status", "overcurrent_count", "overvoltage_count")
+    __slots__ = ("status", "overcurrent_count", "overvoltage_count", "trip_cause",
+                 "trip_clear_count")
 
     def __init__(self):
         # status begins in normal state
@@ -18,6 +23,8 @@ class SafetyState:
         # consecutive violation counters
         self.overcurrent_count: int = 0
         self.overvoltage_count: int = 0
+        self.trip_cause: int = 0
+        self.trip_clear_count: int = 0
 
 
 class MeasurementSample:
@@ -31,18 +38,170 @@ class MeasurementSample:
         self.p_power = float(p_power)
 
 
+class HistoryRing:
+    """測定値の履歴。フィールドごとの array('i') と書き込み位置だけのリングバッファ。
+
+    値は Measurements と同じ mV / mA / mW の整数。
+    最初に確保したら増えも減りもしないので push では何も確保しない。
+    添字は deque と同じく 0 が最古、-1 が最新。
+    window_* は最新 n 件（n が件数より多ければ全件）を対象にする。
+
+        ring.get(ring.p_power_mw, -1)        # 最新の電力
+        ring.window_max(ring.p_power_mw, 20) # 直近 20 件の最大
+    """
+    FIELDS = ("p_voltage_mv", "p_current_ma", "b_voltage_mv", "p_power_mw")
+
+    def __init__(self, length):
+        self.length = length
+        # 次に書く位置と、入っている件数
+        self.head = 0
+        self.count = 0
+        self.p_voltage_mv = array("i", bytes(4 * length))
+        self.p_current_ma = array("i", bytes(4 * length))
+        self.b_voltage_mv = array("i", bytes(4 * length))
+        self.p_power_mw = array("i", bytes(4 * length))
+        self.columns = (self.p_voltage_mv, self.p_current_ma, self.b_voltage_mv, self.p_power_mw)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self) -> None:
+        self.head = 0
+        self.count = 0
+
+    def push(self, p_voltage_mv, p_current_ma, b_voltage_mv, p_power_mw) -> None:
+        h = self.head
+        self.p_voltage_mv[h] = p_voltage_mv
+        self.p_current_ma[h] = p_current_ma
+        self.b_voltage_mv[h] = b_voltage_mv
+        self.p_power_mw[h] = p_power_mw
+        h += 1
+        if h == self.length:
+            h = 0
+        self.head = h
+        if self.count < self.length:
+            self.count += 1
+
+    def pos(self, i) -> int:
+        """i 番目の要素が入っている配列上の位置"""
+        n = self.count
+        if i < 0:
+            i += n
+        if i < 0 or i >= n:
+            raise IndexError("history index out of range")
+        p = self.head - n + i
+        if p < 0:
+            p += self.length
+        return p
+
+    def get(self, column, i):
+        return column[self.pos(i)]
+
+    def _start(self, n) -> int:
+        p = self.head - n
+        if p < 0:
+            p += self.length
+        return p
+
+    def window_min(self, column, n):
+        if n > self.count:
+            n = self.count
+        if n == 0:
+            return 0
+        p = self._start(n)
+        length = self.length
+        lo = column[p]
+        for _ in range(n - 1):
+            p += 1
+            if p == length:
+                p = 0
+            if column[p] < lo:
+                lo = column[p]
+        return lo
+
+    def window_max(self, column, n):
+        if n > self.count:
+            n = self.count
+        if n == 0:
+            return 0
+        p = self._start(n)
+        length = self.length
+        hi = column[p]
+        for _ in range(n - 1):
+            p += 1
+            if p == length:
+                p = 0
+            if column[p] > hi:
+                hi = column[p]
+        return hi
+
+    def window_mean(self, column, n):
+        if n > self.count:
+            n = self.count
+        if n == 0:
+            return 0
+        p = self._start(n)
+        length = self.length
+        total = 0
+        for _ in range(n):
+            total += column[p]
+            p += 1
+            if p == length:
+                p = 0
+        return total // n
+
+    def copy_window(self, column, n, out) -> int:
+        """最新 n 件を古い順に out へ写し、写した件数を返す"""
+        if n > self.count:
+            n = self.count
+        if n > len(out):
+            n = len(out)
+        p = self._start(n)
+        length = self.length
+        for k in range(n):
+            out[k] = column[p]
+            p += 1
+            if p == length:
+                p = 0
+        return n
+
+
 class Measurements:
-    """測定値を入れておくだけのクラス。直近 HISTORY_LEN 件まで履歴保持。"""
-    HISTORY_LEN = 5
+    """測定値を入れておくだけのクラス。直近 config.HISTORY_LEN 件まで履歴保持。
+
+    値は mV / mA / mW の整数（MicroPython の small int なのでヒープを使わない）。
+    制御ループはこちらだけを使う。p_voltage などの V / A / W の float は
+    表示用の読み取り専用ビューで、読むたびに float を作る。
+    """
 
     def __init__(self):
-        self.p_voltage: float = 0.0
-        self.p_current: float = 0.0
-        self.b_voltage: float = 0.0
-        self.p_power: float = 0.0
+        self.p_voltage_mv: int = 0
+        self.p_current_ma: int = 0
+        self.b_voltage_mv: int = 0
+        self.p_power_mw: int = 0
+
+        # チャネル名ごとの直近のサンプル数と推定ノイズ [ADCカウント]（sensor_ctrl が更新）
+        self.sample_count = {}
+        self.noise = {}
+
+        # 直近 HISTORY_LEN 件の履歴（古いものから上書きされる）
+        self.history = HistoryRing(config.HISTORY_LEN)
+
+    @property
+    def p_voltage(self) -> float:
+        return self.p_voltage_mv / 1000
 
-        # 直近 HISTORY_LEN 件の履歴（古いものから自動で捨てられる）
-        self.history = deque((), maxlen=self.HISTORY_LEN)
+    @property
+    def p_current(self) -> float:
+        return self.p_current_ma / 1000
+
+    @property
+    def b_voltage(self) -> float:
+        return self.b_voltage_mv / 1000
+
+    @property
+    def p_power(self) -> float:
+        return self.p_power_mw / 1000
 
     def snapshot(self) -> MeasurementSample:
         """現在値のスナップショットを作る"""
@@ -55,7 +214,7 @@ class Measurements:
 
     def push_history(self) -> None:
         """現在値を履歴に積む（sensor.py だけが呼ぶ想定）"""
-        self.history.append(self.snapshot())
+        self.history.push(self.p_voltage_mv, self.p_current_ma, self.b_voltage_mv, self.p_power_mw)
 
 
 class PwmState:
@@ -70,6 +229,46 @@ class PwmState:
         self.applied_duty_u16: int = 0
 
 
+class ScanState:
+    """グローバルスキャンの進行状況と、最後に取った P-duty 曲線。
+
+    書き込み権限:
+      - mppt_scan.py
+    読み取り専用:
+      - lcd.py など（表示/ログ用）
+
+    duty[0:count] / power[0:count] が最後のスキャンで測った点（測った順、電力は mW）。
+    """
+    # phase の値
+    IDLE = 0
+    COARSE = 1
+    FINE = 2
+
+    def __init__(self, points=None):
+        if points is None:
+            points = config.MPPT_SCAN_COARSE + config.MPPT_SCAN_FINE
+        self.phase: int = self.IDLE
+        # 今の段で次に指令する点の番号
+        self.index: int = 0
+        # 指令済みで未測定の点があるか
+        self.pending: bool = False
+        # 細かい掃引の範囲
+        self.fine_lo: int = 0
+        self.fine_hi: int = 0
+
+        self.duty = array("H", bytes(2 * points))
+        self.power = array("i", bytes(4 * points))
+        self.count: int = 0
+        self.best_duty: int = 0
+        self.best_power: int = 0
+
+        # トリガ判定用
+        self.last_scan_ms = None
+        self.ref_power: int = 0
+        self.scans: int = 0
+        self.aborts: int = 0
+
+
 class MpptState:
     """MPPT 制御用の変数を入れているだけのクラス。
 
@@ -82,9 +281,17 @@ class MpptState:
     """
     def __init__(self):
         self.c_step: int = 0
+        # 前回のステップ前の duty（可変ステップの dP/dDuty 用）
+        self.last_duty: int = 0
         self.direction: int = 1
-        # last measured power value used for hill climbing control
-        self.last_power: float = 0.0
+        # last measured power value used for hill climbing control [mW]
+        self.last_power_mw: int = 0
+        # 前回の MPPT ステップ時のパネル電圧/電流 [mV / mA]（IncCond 用）。
+        # センサーは MPPT より速く回るので履歴の 1 つ前とは限らない
+        self.last_voltage_mv: int = 0
+        self.last_current_ma: int = 0
+        # グローバルスキャン（mppt_scan.py）
+        self.scan = ScanState()
 
 
 class SystemState:
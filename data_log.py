@@ -0,0 +1,357 @@
+"""Binary data logger with flash-friendly rotation.
+
+With ``config.LOG_ENABLE`` the controller keeps a record of what it did.
+Every control cycle :meth:`DataLogger.accumulate` adds the measurements
+to running sums (a handful of integer additions); every
+``config.LOG_PERIOD_MS`` :meth:`DataLogger.record` packs one fixed-size
+record with ``struct.pack_into`` into a preallocated RAM block:
+
+====  ==============  =====================================================
+type  field           meaning
+====  ==============  =====================================================
+I     uptime_s        seconds since boot at the end of the period
+H     p_voltage_mv    mean panel voltage over the period [mV]
+H     p_current_ma    mean panel current [mA]
+H     b_voltage_mv    mean battery voltage [mV]
+I     p_power_mw      mean panel power [mW]
+H     duty            applied PWM duty at the end of the period
+b     direction       MPPT direction (-1 / 1)
+B     status          worst safety status in the period (0 normal,
+                      1 warning, 2 shutdown)
+B     trip_cause      ``safety.trip_cause`` (``fast_trip.CAUSE_*``)
+====  ==============  =====================================================
+
+A block is ``config.LOG_BLOCK_SIZE`` bytes, the littlefs block size, so
+one flash erase/program per block: a 16-byte header (magic, block
+sequence number, boot number, record count, CRC-32 of header and
+records) followed by up to 204 records of 20 bytes.  A full block is
+appended to the current file, which is closed again once the block is
+written so the filesystem commits it.  ``config.LOG_FILES`` files of
+``config.LOG_FILE_BLOCKS`` blocks are used in turn; the oldest file is
+truncated when its turn comes.  With the defaults (one record a
+minute) a block is written about every 3.4 hours, a file holds 1.7
+days and the 16 files about four weeks, in 768 KB of flash.
+
+Writing to flash stalls the RP2040: while a page is programmed or a
+sector erased, code cannot run from flash and MicroPython masks
+interrupts and pauses the other core, so the control loop, the
+``fast_trip`` timer and the dual-core sampler all wait.  A page program
+takes about 1 ms, a 4 KB sector erase typically 45 ms and up to 400 ms
+(W25Q16 datasheet); littlefs erases once per block.  A full block is
+therefore not written in one go from :meth:`DataLogger.record`: the
+block is handed to a second buffer and :meth:`DataLogger.write_step`,
+run by the scheduler right after a control cycle, appends
+``config.LOG_WRITE_CHUNK`` bytes per call (512 bytes, two pages, by
+default), so one stall is a chunk's programming plus, on the first
+chunk of a block, the erase.  With ``LOG_WRITE_CHUNK = 0`` the whole
+block is written at once as before.
+
+A power cut can at worst leave a short or half-written last block.
+On boot the logger checks the blocks of the newest file and, if the
+last one is incomplete or its CRC does not match, starts the next file
+instead of appending behind it; readers skip such blocks the same way.  The
+records of the period not yet flushed are lost.  :meth:`DataLogger.flush`
+writes a partial block, e.g. before a planned power-off.
+
+``read_blocks`` / ``iter_records`` decode the files; see also
+``host/log_decode.py`` for conversion to CSV.
+"""
+
+import os
+import struct
+import time
+
+try:
+    from binascii import crc32
+except ImportError:  # 古い MicroPython
+    from ubinascii import crc32
+
+import config
+
+MAGIC = b"MPL1"
+# magic, seq, boot, count, crc32
+HEADER = "<4sIHHI"
+HEADER_SIZE = 16
+RECORD = "<IHHHIHbBBx"
+RECORD_SIZE = 20
+FIELDS = ("uptime_s", "p_voltage_mv", "p_current_ma", "b_voltage_mv", "p_power_mw",
+          "duty", "direction", "status", "trip_cause")
+STATUS_NAMES = ("normal", "warning", "shutdown")
+_STATUS_CODES = {"normal": 0, "warning": 1, "shutdown": 2}
+
+
+def log_path(directory, i) -> str:
+    return "%s/log%02d.bin" % (directory, i)
+
+
+def _u16(x) -> int:
+    if x < 0:
+        return 0
+    if x > 65535:
+        return 65535
+    return x
+
+
+def _block_crc(block, count) -> int:
+    """ヘッダの CRC 欄の手前 12 バイトとレコード部の CRC-32"""
+    mv = memoryview(block)
+    crc = crc32(mv[0:12])
+    return crc32(mv[HEADER_SIZE:HEADER_SIZE + count * RECORD_SIZE], crc) & 0xFFFFFFFF
+
+
+def check_block(block):
+    """Return ``(seq, boot, count)`` of a valid block, ``None`` otherwise."""
+    if len(block) < HEADER_SIZE:
+        return None
+    magic, seq, boot, count, crc = struct.unpack_from(HEADER, block, 0)
+    if magic != MAGIC or HEADER_SIZE + count * RECORD_SIZE > len(block):
+        return None
+    if _block_crc(block, count) != crc:
+        return None
+    return seq, boot, count
+
+
+def read_blocks(path, block_size=None):
+    """Yield ``(seq, boot, block, count)`` for every valid block of one file."""
+    if block_size is None:
+        block_size = config.LOG_BLOCK_SIZE
+    block = bytearray(block_size)
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return
+    with f:
+        while True:
+            n = f.readinto(block)
+            if not n:
+                return
+            head = check_block(block if n == block_size else block[:n])
+            if head is not None:
+                yield head[0], head[1], block, head[2]
+
+
+def iter_records(directory=None, files=None, block_size=None):
+    """Yield ``(seq, boot, record_tuple)`` of every valid record, oldest first."""
+    if directory is None:
+        directory = config.LOG_DIR
+    if files is None:
+        files = config.LOG_FILES
+    blocks = []
+    for i in range(files):
+        for seq, boot, block, count in read_blocks(log_path(directory, i), block_size):
+            blocks.append((seq, boot, bytes(block[HEADER_SIZE:HEADER_SIZE + count * RECORD_SIZE])))
+    blocks.sort(key=lambda b: b[0])
+    for seq, boot, data in blocks:
+        for k in range(len(data) // RECORD_SIZE):
+            yield seq, boot, struct.unpack_from(RECORD, data, k * RECORD_SIZE)
+
+
+class DataLogger:
+    """Accumulates measurements and writes them as binary records.
+
+    Args:
+        directory / files / file_blocks / block_size / period_ms / chunk:
+            Default to the ``config.LOG_*`` values (``chunk`` is
+            ``LOG_WRITE_CHUNK``).
+    """
+
+    def __init__(self, directory=None, files=None, file_blocks=None, block_size=None,
+                 period_ms=None, chunk=None):
+        self.directory = config.LOG_DIR if directory is None else directory
+        self.files = config.LOG_FILES if files is None else files
+        self.file_blocks = config.LOG_FILE_BLOCKS if file_blocks is None else file_blocks
+        self.block_size = config.LOG_BLOCK_SIZE if block_size is None else block_size
+        self.period_ms = config.LOG_PERIOD_MS if period_ms is None else period_ms
+        self.capacity = (self.block_size - HEADER_SIZE) // RECORD_SIZE
+        if self.capacity < 1:
+            raise ValueError("DataLogger: block too small")
+
+        self._block = bytearray(self.block_size)
+        self.count = 0
+        # 書き出し中のブロック（record は次のブロックを _block に溜め続ける）
+        self.chunk = config.LOG_WRITE_CHUNK if chunk is None else chunk
+        self._out = bytearray(self.block_size)
+        self._out_pos = -1     # 書き出した位置（-1: 書き出し中のブロックなし）
+        self._out_file = None
+        # 次に書くファイル番号とその中のブロック位置
+        self.file_index = 0
+        self.file_block = 0
+        self.seq = 0
+        self.boot = 0
+        self.blocks_written = 0
+        self.write_errors = 0
+
+        # 周期内の合計
+        self._n = 0
+        self._pv = 0
+        self._pi = 0
+        self._bv = 0
+        self._pw = 0
+        self._worst = 0
+
+        # 起動からの秒数（ticks_ms は 2^30 で回るので自分で数える）
+        self.uptime_s = 0
+        self._ms = 0
+        self._last_ms = time.ticks_ms()
+
+        try:
+            os.mkdir(self.directory)
+        except OSError:
+            pass
+        self._resume()
+
+    def _resume(self) -> None:
+        """Continue after the newest valid block on flash."""
+        newest = -1
+        newest_file = -1
+        head = bytearray(HEADER_SIZE)
+        for i in range(self.files):
+            try:
+                with open(log_path(self.directory, i), "rb") as f:
+                    if f.readinto(head) != HEADER_SIZE:
+                        continue
+            except OSError:
+                continue
+            magic, seq, _, _, _ = struct.unpack_from(HEADER, head, 0)
+            if magic == MAGIC and seq > newest:
+                newest = seq
+                newest_file = i
+        if newest_file < 0:
+            return
+
+        # 最新ファイルの全ブロックを確かめ、最後まで有効なら続きに足す
+        path = log_path(self.directory, newest_file)
+        size = os.stat(path)[6]
+        blocks = size // self.block_size
+        valid = 0
+        for seq, boot, _, _ in read_blocks(path, self.block_size):
+            valid += 1
+            if seq > newest:
+                newest = seq
+            if boot >= self.boot:
+                self.boot = boot + 1
+        self.seq = newest + 1
+        if valid == blocks and size == blocks * self.block_size and blocks < self.file_blocks:
+            self.file_index = newest_file
+            self.file_block = blocks
+        else:
+            # 壊れた/満杯のファイルの後ろには足さず次のファイルへ
+            self.file_index = (newest_file + 1) % self.files
+            self.file_block = 0
+
+    def accumulate(self, ctx) -> None:
+        """Add the current measurements to the period sums (every control cycle)."""
+        state = ctx.state
+        meas = state.meas
+        self._n += 1
+        self._pv += meas.p_voltage_mv
+        self._pi += meas.p_current_ma
+        self._bv += meas.b_voltage_mv
+        self._pw += meas.p_power_mw
+        code = _STATUS_CODES.get(state.safety.status, 2)
+        if code > self._worst:
+            self._worst = code
+
+    def record(self, ctx) -> None:
+        """Pack one record for the period that just ended; write the block when full."""
+        now = time.ticks_ms()
+        self._ms += time.ticks_diff(now, self._last_ms)
+        self._last_ms = now
+        if self._ms >= 1000:
+            self.uptime_s += self._ms // 1000
+            self._ms %= 1000
+
+        state = ctx.state
+        n = self._n
+        if n == 0:
+            self.accumulate(ctx)
+            n = 1
+        pw = self._pw // n
+        if pw < 0:
+            pw = 0
+        struct.pack_into(RECORD, self._block, HEADER_SIZE + self.count * RECORD_SIZE,
+                         self.uptime_s,
+                         _u16(self._pv // n), _u16(self._pi // n), _u16(self._bv // n), pw,
+                         state.pwms.applied_duty_u16, state.mppts.direction,
+                         self._worst, state.safety.trip_cause)
+        self._n = 0
+        self._pv = 0
+        self._pi = 0
+        self._bv = 0
+        self._pw = 0
+        self._worst = 0
+
+        self.count += 1
+        if self.count >= self.capacity:
+            self._finish_block()
+
+    @property
+    def writing(self) -> bool:
+        """True while a finished block is still being written out."""
+        return self._out_pos >= 0
+
+    def flush(self) -> None:
+        """Write the current block (even if partial) right away, e.g. before power-off."""
+        self._finish_block()
+        self._drain()
+
+    def write_step(self, ctx=None) -> None:
+        """Write the next ``chunk`` bytes of the finished block, if any."""
+        if self._out_pos < 0:
+            return
+        block = self._out
+        end = self._out_pos + self.chunk if self.chunk > 0 else len(block)
+        if end > len(block):
+            end = len(block)
+        try:
+            if self._out_file is None:
+                self._out_file = open(log_path(self.directory, self.file_index),
+                                      "ab" if self.file_block else "wb")
+            self._out_file.write(memoryview(block)[self._out_pos:end])
+            self._out_pos = end
+            if end < len(block):
+                return
+            # 書き終えたらすぐ閉じてファイルシステムに確定させる
+            self._out_file.close()
+        except OSError:
+            # 途中まで書けたかもしれないファイルには足さない
+            self.write_errors += 1
+            self._close_out()
+            self.file_block = self.file_blocks
+        else:
+            self._out_file = None
+            self.blocks_written += 1
+            self.file_block += 1
+        self._out_pos = -1
+        if self.file_block >= self.file_blocks:
+            self.file_index = (self.file_index + 1) % self.files
+            self.file_block = 0
+
+    def _drain(self) -> None:
+        while self._out_pos >= 0:
+            self.write_step()
+
+    def _close_out(self) -> None:
+        if self._out_file is not None:
+            try:
+                self._out_file.close()
+            except OSError:
+                pass
+            self._out_file = None
+
+    def _finish_block(self) -> None:
+        """Seal ``_block`` and hand it to ``write_step`` (finishing the previous one first)."""
+        if self.count == 0:
+            return
+        # 前のブロックが書き終わっていなければ先に書き切る（record の周期なら普通は終わっている）
+        self._drain()
+        block = self._block
+        struct.pack_into(HEADER, block, 0, MAGIC, self.seq, self.boot, self.count, 0)
+        struct.pack_into("<I", block, 12, _block_crc(block, self.count))
+        self._block = self._out
+        self._out = block
+        self._out_pos = 0
+        self.seq += 1
+        self.count = 0
+        if self.chunk <= 0:
+            self._drain()
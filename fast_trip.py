@@ -0,0 +1,140 @@
+"""Timer-driven hard-limit trip, independent of the main loop.
+
+``safety_ctrl.safety_check`` runs once per control period on trimmed
+means and needs three consecutive violations, so its reaction time is
+a few control periods.  :class:`FastTrip` is the backstop for faults
+that must not wait that long: a ``machine.Timer`` reads the panel
+current and battery voltage ADC channels ``config.TRIP_FREQ_HZ`` times
+per second and, after ``config.TRIP_COUNT`` consecutive readings above
+the hard limit, sets the PWM duty to 0 right inside the callback.
+
+The callback compares raw ``read_u16`` counts against thresholds worked
+out once in ``__init__`` from the channel scale/offset (or by inverting
+the calibration table, ``calibration.raw_above``), so it does no
+float math and allocates nothing.  The trip is latched: ``tripped``
+stays True until :meth:`FastTrip.reset` is called.  ``safety_ctrl``
+turns it into the "shutdown" status and ``pwm_ctrl`` keeps the duty at
+0 while it is set, so the main loop cannot undo the trip between the
+interrupt and the next safety check.  ``safety_ctrl`` also clears the
+latch once the averaged values have stayed within the limits for
+``config.TRIP_RESET_COUNT`` safety checks.
+
+A limit beyond the ADC range (e.g. the placeholder ``I_LIMIT = 100``)
+would give a threshold above 65535, a channel that can never trip;
+``FastTrip`` raises ``ValueError`` for it instead of starting.  Set
+``config.TRIP_I_LIMIT`` / ``TRIP_BV_LIMIT`` to limits the divider can
+measure before enabling the trip.
+
+The RP2040 has one ADC behind an input mux, and ``read_u16`` selects
+the channel and then converts.  If the timer fires between the two in
+a read of the main loop, that read converts the channel the callback
+left selected: a single outlier, which the trimmed mean drops.  With
+``config.SENSE_DUAL_CORE`` the core 1 sampler reads at the same time as
+the callback, so the callback can also convert the wrong channel; it
+needs ``config.TRIP_COUNT`` consecutive readings above the limit, so a
+single wrong one does not trip.
+
+Because the callback shares the ADC with the sampler this way (and
+costs two conversions every millisecond), ``config.TRIP_ENABLE`` is
+off by default.
+"""
+
+from machine import Timer  # type: ignore
+
+import calibration
+import config
+
+# trip_cause の値
+CAUSE_NONE = 0
+CAUSE_OVERCURRENT = 1
+CAUSE_OVERVOLTAGE = 2
+
+
+def _raw_threshold(channel, limit) -> int:
+    """Smallest raw count whose converted value exceeds ``limit`` [A or V]."""
+    if channel.lut is not None:
+        # 多点校正の表を逆に引く（温度補正は起動時の値で固定）
+        return calibration.raw_above(channel.lut, int(limit * 1000) + channel.temp_corr)
+    if channel.scale <= 0:
+        return 1 << 30
+    # チャネルの値は mA / mV
+    return int((limit * 1000 + channel.offset) / channel.scale) + 1
+
+
+class FastTrip:
+    """ADC hard-limit monitor run from ``machine.Timer``.
+
+    Args:
+        pwm_hw: ``PwmHardware`` whose duty is forced to 0 on a trip.
+        adc: ``AdcChannels`` providing the ``p_current_ma`` and
+            ``b_voltage_mv`` channels.
+    """
+
+    def __init__(self, pwm_hw, adc):
+        self._pwm = pwm_hw
+        i_ch = adc.channel("p_current_ma")
+        v_ch = adc.channel("b_voltage_mv")
+        self._i_adc = i_ch.adc
+        self._v_adc = v_ch.adc
+        i_limit = config.TRIP_I_LIMIT if config.TRIP_I_LIMIT is not None else config.I_LIMIT
+        v_limit = config.TRIP_BV_LIMIT if config.TRIP_BV_LIMIT is not None else config.BV_LIMIT
+        self.i_threshold = _raw_threshold(i_ch, i_limit)
+        self.v_threshold = _raw_threshold(v_ch, v_limit)
+        # read_u16 は 65535 までなので、それより上の閾値では決して遮断しない
+        if self.i_threshold > 65535:
+            raise ValueError("FastTrip: current limit %r A is beyond the ADC range" % i_limit)
+        if self.v_threshold > 65535:
+            raise ValueError("FastTrip: voltage limit %r V is beyond the ADC range" % v_limit)
+        self._i_over = 0
+        self._v_over = 0
+        self.tripped = False
+        self.cause = CAUSE_NONE
+        self._timer = None
+        # コールバックの束縛メソッドは 1 回だけ作る
+        self._cb = self._irq
+
+    def start(self) -> None:
+        if self._timer is not None:
+            return
+        self._timer = Timer(-1)
+        try:
+            self._timer.init(freq=config.TRIP_FREQ_HZ, mode=Timer.PERIODIC,
+                             callback=self._cb, hard=True)
+        except TypeError:
+            # hard 引数のないファームウェア
+            self._timer.init(freq=config.TRIP_FREQ_HZ, mode=Timer.PERIODIC,
+                             callback=self._cb)
+
+    def stop(self) -> None:
+        if self._timer is not None:
+            self._timer.deinit()
+            self._timer = None
+
+    def reset(self) -> None:
+        """Clear the latch (the cause must have gone away first)."""
+        self._i_over = 0
+        self._v_over = 0
+        self.cause = CAUSE_NONE
+        self.tripped = False
+
+    def _irq(self, _timer) -> None:
+        # 割り込み内: 整数比較だけ、確保なし（増え続ける値は持たない。2^30 を超えると確保になる）
+        if self._i_adc.read_u16() >= self.i_threshold:
+            self._i_over += 1
+        else:
+            self._i_over = 0
+        if self._v_adc.read_u16() >= self.v_threshold:
+            self._v_over += 1
+        else:
+            self._v_over = 0
+        if self.tripped:
+            self._pwm.set_duty_u16(0)
+            return
+        if self._i_over >= config.TRIP_COUNT:
+            self.cause = CAUSE_OVERCURRENT
+        elif self._v_over >= config.TRIP_COUNT:
+            self.cause = CAUSE_OVERVOLTAGE
+        else:
+            return
+        self._pwm.set_duty_u16(0)
+        self.tripped = True
@@ -0,0 +1,95 @@
+"""Host (CPython) stand-ins for running the controller off the Pico.
+
+Typical use::
+
+    import host
+    board = host.install(host.Board(plant=host.Plant(irradiance=...)))
+    board.clock.run_for(3600)
+    import main
+    try:
+        main.main()
+    except host.SimulationEnd:
+        pass
+
+:func:`install` puts :mod:`host.machine` in ``sys.modules["machine"]``
+a virtual ``time`` module in ``sys.modules["time"]`` and a ``_thread``
+whose threads follow the same clock, so the firmware
+modules import them unchanged.  It must be called before any firmware
+module is imported; firmware modules imported under a previous board are
+dropped from ``sys.modules`` so they are re-imported against the new one.
+"""
+
+import os
+import sys
+
+from host import machine
+from host.mpthread import make_thread_module
+from host.board import Board
+from host.pv_model import Battery, BuckConverter, Plant, PvPanel
+from host.vclock import SimulationEnd, VirtualClock, make_time_module
+
+_REAL_TIME = sys.modules["time"]
+if getattr(_REAL_TIME, "real_time", None) is not None:
+    _REAL_TIME = _REAL_TIME.real_time
+_REAL_THREAD = sys.modules["_thread"]
+if getattr(_REAL_THREAD, "real_thread", None) is not None:
+    _REAL_THREAD = _REAL_THREAD.real_thread
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_HOST_DIR = os.path.join(REPO_ROOT, "host")
+
+
+def _is_firmware_module(mod) -> bool:
+    path = getattr(mod, "__file__", None)
+    if not path:
+        return False
+    path = os.path.abspath(path)
+    return path.startswith(REPO_ROOT + os.sep) and not path.startswith(_HOST_DIR + os.sep)
+
+
+def purge_firmware_modules() -> None:
+    """Forget every imported firmware module so the next import is fresh."""
+    for name, mod in list(sys.modules.items()):
+        if name != "config" and _is_firmware_module(mod):
+            del sys.modules[name]
+
+
+def install(board=None) -> Board:
+    """Activate ``board`` (or a default one) as the simulated hardware."""
+    if board is None:
+        board = Board()
+    purge_firmware_modules()
+    machine._attach(board)
+    sys.modules["machine"] = machine
+    sys.modules["time"] = make_time_module(board.clock, _REAL_TIME)
+    sys.modules["_thread"] = make_thread_module(board.clock, _REAL_THREAD)
+    return board
+
+
+def uninstall() -> None:
+    """Restore CPython's ``time``/``_thread`` and remove the ``machine`` stand-in."""
+    purge_firmware_modules()
+    sys.modules["time"] = _REAL_TIME
+    sys.modules["_thread"] = _REAL_THREAD
+    sys.modules.pop("machine", None)
+    machine._attach(None)
+
+
+def real_time():
+    """CPython's ``time`` module, regardless of what is installed."""
+    return _REAL_TIME
+
+
+__all__ = [
+    "Battery",
+    "Board",
+    "BuckConverter",
+    "Plant",
+    "PvPanel",
+    "SimulationEnd",
+    "VirtualClock",
+    "install",
+    "purge_firmware_modules",
+    "real_time",
+    "uninstall",
+]
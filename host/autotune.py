@@ -0,0 +1,372 @@
+"""Search the controller's tuning parameters on simulated scenarios.
+
+Every candidate parameter set runs the unmodified firmware
+(``main.main`` on a :class:`host.Board`, as ``host.run`` does) on each
+scenario of a small library -- morning, noon, passing clouds, partial
+shade -- for the chosen panel, and is scored on
+
+* tracking efficiency: harvested energy / energy at the true MPP,
+  averaged over the scenarios, and
+* ripple: mean change of panel power between samples 100 ms apart,
+  relative to the mean power, which is what the hill climbing costs
+  around the MPP.
+
+``score = 100 * efficiency - ripple_weight * 100 * ripple``.
+
+The search space (:data:`SPACE`) covers ``MPPT_STEP``, the duty bounds
+``MPPT_MIN_RATIO`` / ``MPPT_MAX_RATIO``, the sample and trim counts of
+``SENSE_CHANNELS`` (as a factor on the configured counts and a trim
+fraction) and the start-up ramp (named ``STARTUP_STAGES`` in
+:data:`RAMPS`, or ``STARTUP_MODE = "adaptive"``).  The
+current ``config`` is always evaluated as the baseline; ``--budget``
+picks that many other candidates from the grid at random (seeded).
+
+Runs are spread over a process pool and every finished run is appended
+to a cache file, keyed by candidate, scenario, duration, panel and a
+hash of the firmware sources, so an interrupted search resumes where it
+stopped and a second search with a wider space reuses what it can.
+Editing any firmware file or ``config.py`` invalidates the cache.
+
+The winner is written as ``config_site.py``, which ``config.py`` imports
+last; copy it to the Pico next to ``config.py``::
+
+    python -m host.autotune --panel 60cell --budget 80 --out config_site.py
+    python -m host.autotune --space MPPT_STEP=100,200,300 --set MPPT_STRATEGY="'inc_cond'"
+"""
+
+import argparse
+import ast
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+
+import host
+from host import pv_model, run
+
+# 探索する値。SENSE_SAMPLES / SENSE_TRIM / STARTUP_RAMP は config の名前ではなく expand() で展開する
+SPACE = {
+    "MPPT_STEP": (50, 100, 200, 400),
+    "MPPT_MIN_RATIO": (0.1, 0.2, 0.3),
+    "MPPT_MAX_RATIO": (0.85, 0.95),
+    "SENSE_SAMPLES": (0.5, 1.0, 2.0),   # 各チャネルのサンプル数の倍率
+    "SENSE_TRIM": (0.1, 0.2, 0.3),      # 片側で捨てる割合
+    "STARTUP_RAMP": ("config", "fast", "gentle", "adaptive"),
+}
+
+# 起動時の duty の上げ方（"config" は config.STARTUP_STAGES のまま、"adaptive" は STARTUP_MODE = "adaptive"）
+RAMPS = {
+    "fast": ((0, 13000, 1000, 0.03),),
+    "gentle": ((0, 5000, 250, 0.06), (5000, 13000, 250, 0.08)),
+}
+
+# シナリオ: build_board の引数
+SCENARIOS = {
+    "morning": dict(profile="clear", start_h=8.0),
+    "noon": dict(profile="clear", start_h=12.0),
+    "cloudy": dict(profile="cloudy", start_h=11.0, seed=1),
+    "shade": dict(profile="clear", start_h=13.0, shading=(1.0, 1.0, 0.4)),
+}
+
+RIPPLE_SAMPLE_MS = 100
+CACHE_VERSION = 1
+
+
+def baseline() -> dict:
+    """The current ``config`` expressed as a point of :data:`SPACE`."""
+    import config
+    return {
+        "MPPT_STEP": config.MPPT_STEP,
+        "MPPT_MIN_RATIO": config.MPPT_MIN_RATIO,
+        "MPPT_MAX_RATIO": config.MPPT_MAX_RATIO,
+        "SENSE_SAMPLES": 1.0,
+        "SENSE_TRIM": None,
+        "STARTUP_RAMP": "config",
+    }
+
+
+def _channels(factor, trim):
+    import config
+    out = []
+    for name, pin, count, low, high, scale, offset in config.SENSE_CHANNELS:
+        if factor != 1.0 or trim is not None:
+            count = max(4, int(count * factor + 0.5))
+            if trim is None:
+                low = int(low * factor + 0.5)
+                high = int(high * factor + 0.5)
+            else:
+                low = high = int(count * trim + 0.5)
+            if low + high >= count:
+                low = high = (count - 1) // 2
+        out.append((name, pin, count, low, high, scale, offset))
+    return tuple(out)
+
+
+def expand(candidate) -> dict:
+    """Candidate (a point of :data:`SPACE`) → ``config`` values to set."""
+    import config
+    c = dict(baseline())
+    c.update(candidate)
+    ramp = c["STARTUP_RAMP"]
+    stages = RAMPS.get(ramp, config.STARTUP_STAGES)
+    return {
+        "MPPT_STEP": c["MPPT_STEP"],
+        "MPPT_MIN_RATIO": c["MPPT_MIN_RATIO"],
+        "MPPT_MAX_RATIO": c["MPPT_MAX_RATIO"],
+        "MPPT_MIN_DUTY": int(config.PWM_MAX * c["MPPT_MIN_RATIO"]),
+        "MPPT_MAX_DUTY": int(config.PWM_MAX * c["MPPT_MAX_RATIO"]),
+        "SENSE_CHANNELS": _channels(c["SENSE_SAMPLES"], c["SENSE_TRIM"]),
+        "STARTUP_STAGES": tuple(stages),
+        "STARTUP_MODE": config.STARTUP_MODE if ramp == "config" else
+                        "adaptive" if ramp == "adaptive" else "stages",
+    }
+
+
+def candidates(space, budget, seed=0) -> list:
+    """Baseline first, then up to ``budget`` grid points in random order."""
+    names = sorted(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+    grid = [c for c in grid if c["MPPT_MIN_RATIO"] < c["MPPT_MAX_RATIO"]]
+    random.Random(seed).shuffle(grid)
+    if budget is not None:
+        grid = grid[:budget]
+    return [baseline()] + grid
+
+
+def firmware_hash() -> str:
+    """Hash of every firmware source (``config.py`` and ``config_site.py`` included)."""
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(host.REPO_ROOT)):
+        if name.endswith(".py"):
+            with open(os.path.join(host.REPO_ROOT, name), "rb") as f:
+                h.update(name.encode() + f.read())
+    ctx_dir = os.path.join(host.REPO_ROOT, "context")
+    for name in sorted(os.listdir(ctx_dir)):
+        if name.endswith(".py"):
+            with open(os.path.join(ctx_dir, name), "rb") as f:
+                h.update(name.encode() + f.read())
+    return h.hexdigest()[:16]
+
+
+def job_key(job) -> str:
+    text = json.dumps([CACHE_VERSION, job], sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:24]
+
+
+class RippleMeter:
+    """Samples the plant on a virtual-clock timer and sums the power changes."""
+
+    def __init__(self, board):
+        self.board = board
+        self.prev = None
+        self.change = 0.0
+        self.total = 0.0
+
+    def sample(self, key) -> None:
+        board = self.board
+        board.sync_plant()
+        p = board.plant.p_in
+        if self.prev is not None and board.plant.mpp_power > 0.0:
+            self.change += abs(p - self.prev)
+            self.total += p
+        self.prev = p
+
+    @property
+    def ripple(self) -> float:
+        return self.change / self.total if self.total > 0.0 else 0.0
+
+
+def evaluate(job) -> dict:
+    """Run one ``(candidate, scenario, seconds, panel, fixed, firmware)`` job.
+
+    Runs in a pool worker: the ``config`` values are set for the run
+    and restored afterwards so the worker can take the next job.
+    """
+    candidate, scenario, seconds, panel, fixed, _ = job
+    settings = dict(fixed)
+    settings.update(expand(candidate))
+    saved = run.apply_overrides(settings)
+    try:
+        sc = SCENARIOS[scenario]
+        board = run.build_board(sc["profile"], sc["start_h"], sc.get("seed", 0), sc.get("soc", 0.5),
+                                panel, sc.get("shading"))
+        meter = RippleMeter(board)
+        period_us = RIPPLE_SAMPLE_MS * 1000
+        board.clock.add_timer("autotune", period_us, period_us, meter.sample)
+        s = run.simulate(board, seconds)
+    finally:
+        run.restore_overrides(saved)
+        host.uninstall()
+    return {
+        "energy_wh": s["energy_wh"],
+        "energy_mpp_wh": s["energy_mpp_wh"],
+        "tracking_eff": s["tracking_eff"],
+        "ripple": meter.ripple,
+        "wall_s": s["wall_s"],
+    }
+
+
+def load_cache(path) -> dict:
+    cache = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # 中断で途中まで書かれた行
+                cache[entry["key"]] = entry["result"]
+    except OSError:
+        pass
+    return cache
+
+
+def search(cands, scenarios, seconds, panel, fixed=None, jobs=None, cache_path=None,
+           progress=None) -> dict:
+    """Evaluate every candidate on every scenario; returns ``{key: result}``."""
+    fixed = dict(fixed or {})
+    firmware = firmware_hash()
+    cache = load_cache(cache_path) if cache_path else {}
+    todo = {}
+    for c in cands:
+        for sc in scenarios:
+            job = (c, sc, seconds, panel, fixed, firmware)
+            key = job_key(job)
+            if key not in cache:
+                todo[key] = job
+    if progress:
+        progress("%d runs cached, %d to go" % (len(cands) * len(scenarios) - len(todo), len(todo)))
+    if not todo:
+        return cache
+
+    out = open(cache_path, "a") if cache_path else None
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(evaluate, job): key for key, job in todo.items()}
+            done = 0
+            for fut in concurrent.futures.as_completed(futures):
+                key = futures[fut]
+                cache[key] = result = fut.result()
+                done += 1
+                if out:
+                    # 1 件ごとに書いて中断しても終わった分は残す
+                    out.write(json.dumps({"key": key, "result": result}) + "\n")
+                    out.flush()
+                if progress:
+                    progress("%d/%d done" % (done, len(todo)))
+    finally:
+        if out:
+            out.close()
+    return cache
+
+
+def rank(cands, scenarios, seconds, panel, fixed, cache, ripple_weight) -> list:
+    """``[(score, efficiency, ripple, candidate), ...]`` best first."""
+    firmware = firmware_hash()
+    rows = []
+    for c in cands:
+        results = [cache[job_key((c, sc, seconds, panel, dict(fixed or {}), firmware))]
+                   for sc in scenarios]
+        eff = sum(r["tracking_eff"] for r in results) / len(results)
+        ripple = sum(r["ripple"] for r in results) / len(results)
+        rows.append((100.0 * eff - ripple_weight * 100.0 * ripple, eff, ripple, c))
+    rows.sort(key=lambda r: -r[0])
+    return rows
+
+
+def override_source(candidate, fixed=None, comment="") -> str:
+    """Text of a ``config_site.py`` that sets ``candidate`` (and ``fixed``)."""
+    values = dict(fixed or {})
+    values.update(expand(candidate))
+    lines = ["# host/autotune.py が生成した現場ごとの調整値（config.py の最後で読み込まれる）"]
+    if comment:
+        lines.append("# " + comment)
+    for name in sorted(values):
+        value = values[name]
+        if name in ("SENSE_CHANNELS", "STARTUP_STAGES"):
+            lines.append("%s = (" % name)
+            lines.extend("    %r," % (row,) for row in value)
+            lines.append(")")
+        else:
+            lines.append("%s = %r" % (name, value))
+    return "\n".join(lines) + "\n"
+
+
+def _describe(c) -> str:
+    return " ".join("%s=%s" % (k, c[k]) for k in sorted(c))
+
+
+def _value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text  # "fast" のような名前はそのまま
+
+
+def parse_space(items) -> dict:
+    """``["NAME=v1,v2", ...]`` (``--space`` arguments) → space entries."""
+    out = {}
+    for item in items:
+        name, _, values = item.partition("=")
+        name = name.strip()
+        if name not in SPACE:
+            raise SystemExit("autotune: unknown parameter %s (one of %s)" % (name, ", ".join(SPACE)))
+        out[name] = tuple(_value(v.strip()) for v in values.split(","))
+    return out
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--panel", choices=sorted(pv_model.PANELS), default="36cell")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS),
+                    help="comma separated names from: " + ", ".join(SCENARIOS))
+    ap.add_argument("--minutes", type=float, default=10.0, help="simulated time per scenario")
+    ap.add_argument("--budget", type=int, default=40, help="candidates besides the baseline (0: all)")
+    ap.add_argument("--seed", type=int, default=0, help="seed of the candidate order")
+    ap.add_argument("--space", action="append", default=[], metavar="NAME=V1,V2,...",
+                    help="replace the values searched for one parameter")
+    ap.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                    help="fixed config override for every run (also written to --out)")
+    ap.add_argument("--ripple-weight", type=float, default=0.1)
+    ap.add_argument("--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    ap.add_argument("--cache", default="autotune_cache.jsonl")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--out", default=None, help="write the winner as this config_site.py")
+    args = ap.parse_args(argv)
+
+    space = dict(SPACE)
+    space.update(parse_space(args.space))
+    scenarios = args.scenarios.split(",")
+    for sc in scenarios:
+        if sc not in SCENARIOS:
+            raise SystemExit("autotune: unknown scenario " + sc)
+    fixed = run.parse_overrides(args.set)
+    seconds = args.minutes * 60.0
+    cands = candidates(space, args.budget or None, args.seed)
+
+    t0 = time.perf_counter()
+    cache = search(cands, scenarios, seconds, args.panel, fixed, args.jobs, args.cache,
+                   progress=lambda msg: print(msg, flush=True))
+    rows = rank(cands, scenarios, seconds, args.panel, fixed, cache, args.ripple_weight)
+    print("%d candidates x %d scenarios in %.0f s" % (len(cands), len(scenarios),
+                                                     time.perf_counter() - t0))
+    print("%7s %7s %7s  %s" % ("score", "track", "ripple", "parameters"))
+    base = baseline()
+    for score, eff, ripple, c in rows[:args.top]:
+        mark = "  (current config)" if c == base else ""
+        print("%7.2f %6.2f%% %6.2f%%  %s%s" % (score, 100 * eff, 100 * ripple, _describe(c), mark))
+
+    score, eff, ripple, best = rows[0]
+    if args.out:
+        comment = "%s, %s, %.0f min each: tracking %.2f %%, ripple %.2f %%" % (
+            args.panel, "/".join(scenarios), args.minutes, 100 * eff, 100 * ripple)
+        with open(args.out, "w") as f:
+            f.write(override_source(best, fixed, comment))
+        print("wrote", args.out)
+
+
+if __name__ == "__main__":
+    main()
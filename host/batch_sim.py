@@ -0,0 +1,562 @@
+"""Batch simulation of the MPPT strategies with NumPy.
+
+``host.run`` simulates the whole firmware on one board, which is the
+right tool to check a change but far too slow to tune
+``config.MPPT_STEP`` / ``MPPT_MIN_RATIO`` / ``MPPT_MAX_RATIO`` over many
+days, panels and shading cases.  This module steps only the part that
+decides the harvest -- the MPPT strategy of ``mppt_control_step`` and
+the panel / converter / battery model of ``host.pv_model`` -- for
+thousands of independent lanes at once, every lane an array element:
+
+* a :class:`Scenario` is one irradiance profile, start time, panel,
+  shading and initial state of charge;
+* :class:`Params` is one strategy with its step and duty range;
+* :class:`BatchSim` runs every combination in lockstep, one MPPT step
+  (``config.SCHED_MPPT_MS``) per iteration.
+
+The model is the scalar one written with arrays, operation by
+operation, and the strategies are the integer mV / mA / mW code of
+``mppt_ctrl``.  :func:`run_scalar` runs one lane with the real
+``mppt_ctrl.mppt_control_step`` and ``pv_model.Plant`` and
+:func:`verify` checks that duty trajectory, energies and state of
+charge agree bit for bit.
+
+Left out on purpose: ADC noise and the sensor pipeline (measurements
+are the model values rounded to mV / mA), the safety layer, the global
+scan (``config.MPPT_SCAN``) and time-varying shading.  Use
+``host.run`` for those.
+
+NumPy's AVX-512 ``exp`` / ``log`` differ from libm in the last bit for
+a few percent of arguments, which is enough to move an integer
+measurement across a rounding boundary now and then.  This module
+therefore disables those kernels through ``NPY_DISABLE_CPU_FEATURES``
+unless NumPy is already imported; :func:`verify` reports any mismatch.
+
+Example (36 parameter sets on 4 scenarios, 144 lanes)::
+
+    python -m host.batch_sim --hours 12 --start 6 --profile clear,cloudy \\
+        --shade none,1:1:0.3 --step 50,100,200,400 --min-ratio 0.1,0.2,0.3 \\
+        --max-ratio 0.8,0.85,0.95 --verify 4
+"""
+
+import os
+import sys
+
+if "numpy" not in sys.modules:
+    # AVX-512 版の exp/log は libm と最下位ビットが違うことがあるので使わない
+    os.environ.setdefault("NPY_DISABLE_CPU_FEATURES", "X86_V4 AVX512_ICL AVX512_SPR")
+
+import argparse
+import csv
+import itertools
+import time
+from types import SimpleNamespace
+
+try:
+    import numpy as np
+except ImportError:  # ホスト専用ツールなので実行時にだけ要求する
+    np = None
+
+import config
+from host import pv_model
+
+STRATEGIES = ("po_fixed", "po_variable", "inc_cond", "po_seek")
+
+
+class Scenario:
+    """Operating conditions of one lane.
+
+    Args:
+        profile: Name in ``pv_model.PROFILES``.
+        start_h: Time of day at the start [h].
+        seed: Seed of the ``cloudy`` profile.
+        panel: Name in ``pv_model.PANELS``.
+        shading: Static per-substring factors, or ``None``.
+        soc: Initial battery state of charge.
+    """
+
+    def __init__(self, profile="clear", start_h=12.0, seed=0, panel="36cell",
+                 shading=None, soc=0.5):
+        self.profile = profile
+        self.start_h = start_h
+        self.seed = seed
+        self.panel = panel
+        self.shading = None if shading is None else tuple(shading)
+        self.soc = soc
+
+    @property
+    def name(self) -> str:
+        shade = "-" if self.shading is None else ":".join("%g" % f for f in self.shading)
+        return "%s@%gh/%s/%s" % (self.profile, self.start_h, self.panel, shade)
+
+    def irradiance(self):
+        if self.profile == "cloudy":
+            return pv_model.cloudy(seed=self.seed)
+        return pv_model.PROFILES[self.profile]()
+
+    def plant(self):
+        """Scalar plant of this scenario, as ``host.run.build_board`` makes it."""
+        return pv_model.Plant(panel=pv_model.PvPanel(**pv_model.PANELS[self.panel]),
+                              irradiance=self.irradiance(),
+                              battery=pv_model.Battery(soc=self.soc),
+                              start_s=self.start_h * 3600.0, shading=self.shading)
+
+
+class Params:
+    """Controller settings of one lane (``config.MPPT_*``)."""
+
+    def __init__(self, strategy=None, step=None, min_ratio=None, max_ratio=None):
+        self.strategy = config.MPPT_STRATEGY if strategy is None else strategy
+        self.step = config.MPPT_STEP if step is None else step
+        self.min_ratio = config.MPPT_MIN_RATIO if min_ratio is None else min_ratio
+        self.max_ratio = config.MPPT_MAX_RATIO if max_ratio is None else max_ratio
+        if self.strategy not in STRATEGIES:
+            raise ValueError("batch_sim: unknown strategy %r" % self.strategy)
+
+    @property
+    def min_duty(self) -> int:
+        return int(config.PWM_MAX * self.min_ratio)
+
+    @property
+    def max_duty(self) -> int:
+        return int(config.PWM_MAX * self.max_ratio)
+
+    @property
+    def name(self) -> str:
+        return "%s step=%d duty=%g..%g" % (self.strategy, self.step, self.min_ratio, self.max_ratio)
+
+
+def _step_s() -> float:
+    return config.SCHED_MPPT_MS / 1000
+
+
+def _tables(scenario, steps, dt):
+    """Irradiance and MPP power at every step, evaluated like ``Plant._solve``."""
+    profile = scenario.irradiance()
+    panel = pv_model.PvPanel(**pv_model.PANELS[scenario.panel])
+    panel.shading = scenario.shading
+    start_s = scenario.start_h * 3600.0
+    irr = np.empty(steps)
+    mpp = np.empty(steps)
+    cache = {}
+    for k in range(steps):
+        g = profile(start_s + k * dt)
+        if g < 0.0:
+            g = 0.0
+        key = round(g, 3)
+        p = cache.get(key)
+        if p is None:
+            p = cache[key] = panel.mpp(key)[2]
+        irr[k] = g
+        mpp[k] = p
+    return irr, mpp
+
+
+class BatchSim:
+    """Every ``scenario x params`` combination as one array lane.
+
+    Args:
+        scenarios: List of :class:`Scenario`.
+        params: List of :class:`Params`.
+        seconds: Simulated duration.
+    """
+
+    def __init__(self, scenarios, params, seconds):
+        if np is None:
+            raise SystemExit("batch_sim: NumPy is required (pip install numpy)")
+        self.scenarios = list(scenarios)
+        self.params = list(params)
+        self.dt = _step_s()
+        if self.dt < 0.01:
+            # Plant の settle_s より短いと MPPT の周期ごとに解き直さない
+            raise ValueError("batch_sim: SCHED_MPPT_MS below Plant.settle_s")
+        self.steps = int(seconds / self.dt)
+        self.lanes = [(s, p) for s in range(len(self.scenarios)) for p in range(len(self.params))]
+        n = len(self.lanes)
+        scen = np.array([s for s, _ in self.lanes], dtype=np.intp)
+        par = [self.params[p] for _, p in self.lanes]
+
+        tables = [_tables(s, self.steps, self.dt) for s in self.scenarios]
+        self._irr = np.array([t[0] for t in tables]).reshape(len(tables), self.steps)
+        self._mpp = np.array([t[1] for t in tables]).reshape(len(tables), self.steps)
+        self._scen = scen
+
+        # パネル（シェーディングはシナリオごとに固定）
+        panels = [pv_model.PvPanel(**pv_model.PANELS[s.panel]) for s in self.scenarios]
+        groups = max(p.substrings for p in panels)
+        shade = np.zeros((len(panels), groups))
+        used = np.zeros((len(panels), groups), dtype=bool)
+        for k, (p, s) in enumerate(zip(panels, self.scenarios)):
+            if s.shading is not None:
+                if len(s.shading) != p.substrings:
+                    raise ValueError("batch_sim: %s needs %d shading factors" % (s.name, p.substrings))
+                shade[k, :p.substrings] = s.shading
+                used[k, :p.substrings] = True
+        uniform = np.array([p._uniform() if s.shading is None else
+                            all(f == s.shading[0] for f in s.shading)
+                            for p, s in zip(panels, self.scenarios)])
+        factor = np.array([1.0 if s.shading is None else s.shading[0] for s in self.scenarios])
+
+        def per_lane(values, dtype=float):
+            return np.array(values, dtype=dtype)[scen]
+
+        self.isc = per_lane([p.isc for p in panels])
+        self.a = per_lane([p._a for p in panels])
+        self.i0 = per_lane([p._i0 for p in panels])
+        self.uniform = per_lane(uniform, bool)
+        self.factor = per_lane(factor)
+        # 部分影のレーンだけ取り出しておく（バイパス中の群は -BYPASS_V、無い群は 0）
+        sh = np.nonzero(~self.uniform)[0]
+        self._shaded = sh
+        self._sh_isc = self.isc[sh]
+        self._sh_i0 = self.i0[sh, None]
+        self._sh_a = per_lane([p._a / p.substrings for p in panels])[sh, None]
+        self._sh_shade = shade[scen][sh]
+        self._sh_bypass = np.where(used[scen][sh], -pv_model.PvPanel.BYPASS_V, 0.0)
+        self._sh_max = per_lane([0.0 if s.shading is None else max(s.shading)
+                                 for s in self.scenarios])[sh]
+
+        conv = pv_model.BuckConverter()
+        bats = [pv_model.Battery(soc=s.soc) for s in self.scenarios]
+        self.eff = np.full(n, conv.efficiency)
+        self.v_empty = per_lane([b.v_empty for b in bats])
+        self.v_full = per_lane([b.v_full for b in bats])
+        self.r_int = per_lane([b.r_int for b in bats])
+        self.capacity = per_lane([b.capacity_ah for b in bats])
+        self.soc = per_lane([b.soc for b in bats])
+
+        # 制御器（整数）
+        i64 = np.int64
+        self.strategy = np.array([STRATEGIES.index(p.strategy) for p in par], dtype=i64)
+        self.mppt_step = np.array([p.step for p in par], dtype=i64)
+        self.min_duty = np.array([p.min_duty for p in par], dtype=i64)
+        self.max_duty = np.array([p.max_duty for p in par], dtype=i64)
+        self.c_step = self.min_duty.copy()
+        self.last_duty = np.zeros(n, dtype=i64)
+        self.direction = np.ones(n, dtype=i64)
+        self.last_power = np.zeros(n, dtype=i64)
+        self.last_v = np.zeros(n, dtype=i64)
+        self.last_i = np.zeros(n, dtype=i64)
+
+        # プラント
+        self.duty_u16 = np.zeros(n, dtype=i64)
+        self.bat_v = self._ocv()
+        self.pv_v = np.zeros(n)
+        self.pv_i = np.zeros(n)
+        self.bat_i = np.zeros(n)
+        self.energy_in_wh = np.zeros(n)
+        self.energy_mpp_wh = np.zeros(n)
+        self.trace_lanes = []
+        self.duty_trace = None
+
+    # -- panel / converter / battery (pv_model の式をそのまま配列で) ----------
+
+    def _ocv(self):
+        return self.v_empty + (self.v_full - self.v_empty) * self.soc
+
+    def _string_voltage(self, iph, i):
+        """``PvPanel._string_voltage`` of the shaded lanes; ``iph`` is lanes x groups."""
+        drop = self._sh_a * np.log((iph - i) / self._sh_i0 + 1.0)
+        terms = np.where(i < iph, drop, self._sh_bypass)
+        # 群の順に足す（スカラー版と同じ丸め）
+        v = terms[:, 0]
+        for g in range(1, terms.shape[1]):
+            v = v + terms[:, g]
+        return v
+
+    def _photo_current(self, irr):
+        return (self._sh_isc * irr[self._shaded])[:, None] * self._sh_shade
+
+    def _voc(self, irr):
+        voc = self.a * np.log(self.isc * irr * self.factor / self.i0 + 1.0)
+        if len(self._shaded):
+            voc[self._shaded] = np.maximum(0.0, self._string_voltage(self._photo_current(irr), 0.0))
+        return np.where(irr > 0.0, voc, 0.0)
+
+    def _current(self, v, irr):
+        i = self.isc * irr * self.factor - self.i0 * (np.exp(v / self.a) - 1.0)
+        i = np.where(i > 0.0, i, 0.0)
+        idx = self._shaded
+        if len(idx):
+            vs = v[idx]
+            iph = self._photo_current(irr)
+            lo = np.zeros(len(idx))
+            hi = self._sh_isc * irr[idx] * self._sh_max
+            # V(I) は単調減少なので二分法（PvPanel.current と同じ 48 回）
+            for _ in range(48):
+                mid = 0.5 * (lo + hi)
+                up = self._string_voltage(iph, mid[:, None]) > vs
+                lo = np.where(up, mid, lo)
+                hi = np.where(up, hi, mid)
+            open_ = vs >= self._string_voltage(iph, 0.0)
+            i[idx] = np.where(open_, 0.0, 0.5 * (lo + hi))
+        return np.where(irr > 0.0, i, 0.0)
+
+    def _solve(self, irr):
+        """``Plant._solve`` for every lane; returns ``(pv_v, pv_i, bat_v, bat_i)``."""
+        duty = self.duty_u16 / 65535.0
+        voc = self._voc(irr)
+        eff = self.eff
+        bat_v = self.bat_v
+        v = voc
+        i = np.zeros(len(irr))
+        ocv = self._ocv()
+        for _ in range(3):
+            v = np.divide(bat_v, duty, out=np.full(len(irr), np.inf), where=duty > 0.0)
+            open_ = v >= voc
+            v = np.where(open_, voc, v)
+            i = np.where(open_, 0.0, self._current(v, irr))
+            bat_v = 0.5 * (ocv + np.sqrt(ocv * ocv + 4.0 * self.r_int * (eff * v * i)))
+        return v, i, bat_v, eff * v * i / bat_v
+
+    def _update(self, dt, irr, mpp_prev):
+        """``Plant.update``: integrate over ``dt``, then re-solve."""
+        self.energy_in_wh += self.pv_v * self.pv_i * dt / 3600.0
+        self.energy_mpp_wh += mpp_prev * dt / 3600.0
+        self.soc = np.clip(self.soc + self.bat_i * dt / 3600.0 / self.capacity, 0.0, 1.0)
+        self.pv_v, self.pv_i, self.bat_v, self.bat_i = self._solve(irr)
+
+    # -- controller (mppt_ctrl の整数演算をそのまま配列で) ---------------------
+
+    def _mppt(self, mv, ma, pw):
+        c = self.c_step
+        d = self.direction
+        seek = pw < config.MPPT_SEEK_POWER_MW
+
+        # po_fixed / po_seek
+        fixed_dir = np.where(pw > self.last_power, d, -d)
+        fixed = c + self.mppt_step * fixed_dir
+
+        # po_variable
+        d_power = pw - self.last_power
+        d_duty = c - self.last_duty
+        var_dir = np.where(d_power <= 0, -d, d)
+        step = config.MPPT_VS_GAIN_MW * np.abs(d_power) // np.where(d_duty == 0, 1, np.abs(d_duty))
+        step = np.clip(step, config.MPPT_VS_MIN_STEP, config.MPPT_VS_MAX_STEP)
+        step = np.where(d_duty == 0, config.MPPT_VS_MIN_STEP, step)
+        variable = c + step * var_dir
+
+        # inc_cond
+        dv = mv - self.last_v
+        di = ma - self.last_i
+        s = ma * dv + mv * di
+        tol = (config.MPPT_IC_EPS_Q10 * ma >> 10) * np.abs(dv)
+        hold = np.where(dv == 0, di == 0, (-tol <= s) & (s <= tol))
+        ic_dir = np.where(dv == 0, np.where(di > 0, -1, 1),
+                          np.where((s > 0) == (dv > 0), -1, 1))
+        ic_dir = np.where(hold, d, ic_dir)
+        inc = np.where(hold, c, c + self.mppt_step * ic_dir)
+
+        strat = self.strategy
+        new = np.where(strat == 1, variable, np.where(strat == 2, inc, fixed))
+        new_dir = np.where(strat == 1, var_dir, np.where(strat == 2, ic_dir, fixed_dir))
+        # po_fixed だけは低電力でも探さない
+        seek &= strat != 0
+        new = np.where(seek, c + config.MPPT_VS_MAX_STEP, new)
+        self.direction = np.where(seek, 1, new_dir)
+
+        self.last_duty = c
+        self.c_step = np.clip(new, self.min_duty, self.max_duty)
+        self.last_power = pw
+        self.last_v = mv
+        self.last_i = ma
+
+    def run(self, trace=()):
+        """Run all steps; keep the duty of every step for the lanes in ``trace``."""
+        steps = self.steps
+        trace = list(trace)
+        self.trace_lanes = trace
+        self.duty_trace = np.empty((steps, len(trace)), dtype=np.int64)
+        scen = self._scen
+        with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+            self.pv_v, self.pv_i, self.bat_v, self.bat_i = self._solve(self._irr[:, 0][scen])
+            t_prev = 0.0
+            for k in range(steps):
+                t = k * self.dt
+                irr = self._irr[:, k][scen]
+                if k:
+                    self._update(t - t_prev, irr, self._mpp[:, k - 1][scen])
+                mv = (self.pv_v * 1000.0 + 0.5).astype(np.int64)
+                ma = (self.pv_i * 1000.0 + 0.5).astype(np.int64)
+                self._mppt(mv, ma, (mv * ma + 500) // 1000)
+                changed = self.c_step != self.duty_u16
+                if changed.any():
+                    self.duty_u16 = self.c_step.copy()
+                    v, i, bv, bi = self._solve(irr)
+                    self.pv_v = np.where(changed, v, self.pv_v)
+                    self.pv_i = np.where(changed, i, self.pv_i)
+                    self.bat_v = np.where(changed, bv, self.bat_v)
+                    self.bat_i = np.where(changed, bi, self.bat_i)
+                if trace:
+                    self.duty_trace[k] = self.c_step[trace]
+                t_prev = t
+        return self.results()
+
+    def results(self) -> list:
+        out = []
+        for n, (s, p) in enumerate(self.lanes):
+            e = float(self.energy_in_wh[n])
+            m = float(self.energy_mpp_wh[n])
+            out.append({
+                "scenario": self.scenarios[s].name,
+                "params": self.params[p].name,
+                "energy_wh": e,
+                "energy_mpp_wh": m,
+                "tracking_eff": e / m if m > 0 else 0.0,
+                "soc": float(self.soc[n]),
+                "duty_u16": int(self.c_step[n]),
+            })
+        return out
+
+
+def run_scalar(scenario, params, seconds, trace=False) -> dict:
+    """One lane with ``mppt_ctrl.mppt_control_step`` and ``pv_model.Plant``."""
+    import mppt_ctrl
+    from context.system_state import (Measurements, MpptState, PwmState, SafetyState,
+                                      SystemState)
+
+    names = ("MPPT_STRATEGY", "MPPT_STEP", "MPPT_MIN_DUTY", "MPPT_MAX_DUTY", "MPPT_SCAN")
+    saved = {name: getattr(config, name) for name in names}
+    config.MPPT_STRATEGY = params.strategy
+    config.MPPT_STEP = params.step
+    config.MPPT_MIN_DUTY = params.min_duty
+    config.MPPT_MAX_DUTY = params.max_duty
+    config.MPPT_SCAN = False
+    try:
+        state = SystemState(Measurements(), PwmState(), MpptState(), SafetyState())
+        ctx = SimpleNamespace(state=state)
+        meas = state.meas
+        mppt = state.mppts
+        mppt.c_step = params.min_duty
+        plant = scenario.plant()
+        dt = _step_s()
+        duties = []
+        for k in range(int(seconds / dt)):
+            t = k * dt
+            plant.update(t)
+            meas.p_voltage_mv = int(plant.pv_v * 1000.0 + 0.5)
+            meas.p_current_ma = int(plant.pv_i * 1000.0 + 0.5)
+            meas.p_power_mw = (meas.p_voltage_mv * meas.p_current_ma + 500) // 1000
+            mppt_ctrl.mppt_control_step(ctx)
+            plant.set_duty(t, mppt.c_step)
+            if trace:
+                duties.append(mppt.c_step)
+    finally:
+        for name, value in saved.items():
+            setattr(config, name, value)
+    return {
+        "energy_wh": plant.energy_in_wh,
+        "energy_mpp_wh": plant.energy_mpp_wh,
+        "soc": plant.battery.soc,
+        "duty_u16": mppt.c_step,
+        "duties": duties,
+    }
+
+
+def verify(sim, seconds) -> list:
+    """Compare the traced lanes of a :class:`BatchSim` run with :func:`run_scalar`.
+
+    Returns a list of mismatch descriptions (empty when all agree exactly).
+    """
+    problems = []
+    for col, n in enumerate(sim.trace_lanes):
+        s, p = sim.lanes[n]
+        ref = run_scalar(sim.scenarios[s], sim.params[p], seconds, trace=True)
+        vec = sim.duty_trace[:, col].tolist()
+        name = "%s | %s" % (sim.scenarios[s].name, sim.params[p].name)
+        if vec != ref["duties"]:
+            k = next(k for k, (a, b) in enumerate(zip(vec, ref["duties"])) if a != b)
+            problems.append("%s: duty differs from step %d (%d vs %d)"
+                            % (name, k, vec[k], ref["duties"][k]))
+            continue
+        for key, arr in (("energy_wh", sim.energy_in_wh), ("energy_mpp_wh", sim.energy_mpp_wh),
+                         ("soc", sim.soc)):
+            if float(arr[n]) != ref[key]:
+                problems.append("%s: %s %r vs %r" % (name, key, float(arr[n]), ref[key]))
+    return problems
+
+
+def rank(results) -> list:
+    """Parameter sets by mean tracking efficiency over all scenarios, best first."""
+    by = {}
+    for r in results:
+        by.setdefault(r["params"], []).append(r["tracking_eff"])
+    return sorted(((sum(v) / len(v), min(v), k) for k, v in by.items()), reverse=True)
+
+
+def _floats(text):
+    return [float(x) for x in text.split(",")]
+
+
+def _shades(text):
+    out = []
+    for item in text.split(","):
+        out.append(None if item == "none" else tuple(float(f) for f in item.split(":")))
+    return out
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--hours", type=float, default=1.0, help="simulated duration per lane")
+    ap.add_argument("--profile", default="clear", help="comma separated pv_model.PROFILES")
+    ap.add_argument("--start", default="12", help="comma separated start times [h]")
+    ap.add_argument("--seed", default="0", help="comma separated seeds (cloudy)")
+    ap.add_argument("--panel", default="36cell", help="comma separated pv_model.PANELS")
+    ap.add_argument("--shade", default="none", metavar="F:F:F,...",
+                    help="comma separated shading cases, 'none' for unshaded")
+    ap.add_argument("--soc", type=float, default=0.5)
+    ap.add_argument("--strategy", default=config.MPPT_STRATEGY, help="comma separated")
+    ap.add_argument("--step", default=str(config.MPPT_STEP), help="comma separated MPPT_STEP")
+    ap.add_argument("--min-ratio", default=str(config.MPPT_MIN_RATIO))
+    ap.add_argument("--max-ratio", default=str(config.MPPT_MAX_RATIO))
+    ap.add_argument("--csv", default=None, help="write every lane to this file")
+    ap.add_argument("--verify", type=int, default=0, metavar="N",
+                    help="check N lanes against the scalar implementation")
+    args = ap.parse_args(argv)
+
+    scenarios = [Scenario(profile, start, int(seed), panel, shade, args.soc)
+                 for profile, start, seed, panel, shade in itertools.product(
+                     args.profile.split(","), _floats(args.start), args.seed.split(","),
+                     args.panel.split(","), _shades(args.shade))]
+    params = [Params(strategy, int(step), lo, hi)
+              for strategy, step, lo, hi in itertools.product(
+                  args.strategy.split(","), _floats(args.step),
+                  _floats(args.min_ratio), _floats(args.max_ratio))
+              if lo < hi]
+    seconds = args.hours * 3600.0
+
+    t0 = time.perf_counter()
+    sim = BatchSim(scenarios, params, seconds)
+    lanes = []
+    if args.verify:
+        # 先頭から末尾まで均等に選ぶ
+        count = min(args.verify, len(sim.lanes))
+        lanes = sorted({round(k * (len(sim.lanes) - 1) / max(1, count - 1)) for k in range(count)})
+    results = sim.run(trace=lanes)
+    wall = time.perf_counter() - t0
+    print("%d lanes (%d scenarios x %d parameter sets), %d steps in %.1f s"
+          % (len(sim.lanes), len(scenarios), len(params), sim.steps, wall))
+    print("%8s %8s  %s" % ("mean", "worst", "parameters"))
+    for mean, worst, name in rank(results)[:20]:
+        print("%7.2f%% %7.2f%%  %s" % (mean * 100, worst * 100, name))
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=list(results[0]))
+            w.writeheader()
+            w.writerows(results)
+
+    if lanes:
+        t0 = time.perf_counter()
+        problems = verify(sim, seconds)
+        print("verify: %d lane(s) against the scalar code in %.1f s"
+              % (len(lanes), time.perf_counter() - t0))
+        for p in problems:
+            print("MISMATCH", p)
+        if problems:
+            raise SystemExit(1)
+        print("verify: identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Simulated Pico board: pins, ADC front end, PWM and I2C devices.
+
+:class:`Board` is the single piece of state behind the :mod:`host.machine`
+classes.  It owns the :class:`~host.vclock.VirtualClock`, the
+:class:`~host.pv_model.Plant` and the devices on the I2C buses, and
+translates between them and the firmware's view of the hardware:
+
+* ``ADC.read_u16`` on the pins listed in ``config`` returns the plant's
+  panel voltage, panel current and battery voltage through the same
+  divider/sensor ratios the firmware uses to convert them back, plus
+  12-bit quantisation and noise.
+* ``PWM.duty_u16`` on ``config.PWM_PIN`` drives the plant's converter.
+* ``I2C`` writes to ``config.LCD_ADDR`` land in a
+  :class:`~host.lcd_model.So1602aModel`.
+
+Each peripheral access advances the clock by its modelled cost so that
+the firmware's ``ticks_us`` measurements mean something on the host.
+"""
+
+import errno
+import random
+import threading
+
+import config
+from host.lcd_model import So1602aModel
+from host.pv_model import Plant
+from host.vclock import VirtualClock
+
+ADC_VREF = 3.3
+# RP2040 内蔵温度センサ（ADC チャネル 4）
+TEMP_SENSOR_CH = 4
+
+
+class Board:
+    """Everything the firmware can observe through ``machine``.
+
+    Args:
+        plant: Plant model; a default panel/battery at full sun if omitted.
+        clock: Virtual clock; a fresh one starting at 0 if omitted.
+        seed: Seed for the ADC noise generator.
+        adc_noise_lsb: Gaussian noise on every conversion [12-bit LSB].
+        ripple_lsb_per_a: Extra noise per ampere of panel current, which
+            models switching ripple coupling into the sense lines.
+        spike_prob: Probability that a conversion is an outlier.
+        spike_lsb: Magnitude of outliers [12-bit LSB].
+        adc_read_us: Time one ``read_u16`` takes.
+        die_temp_c: RP2040 die temperature reported on ADC channel 4.
+        front_end: ``(gpio, volts, die_temp_c) -> volts`` applied to the
+            ideal ADC input voltage: board-specific divider nonlinearity
+            and offset drift (see ``host/calibrate.py``).  None: ideal.
+    """
+
+    def __init__(self, plant=None, clock=None, seed=0, adc_noise_lsb=2.0,
+                 ripple_lsb_per_a=1.5, spike_prob=0.01, spike_lsb=150,
+                 adc_read_us=4, die_temp_c=27.0, front_end=None):
+        self.clock = clock if clock is not None else VirtualClock()
+        self.plant = plant if plant is not None else Plant()
+        self.rng = random.Random(seed)
+        self.adc_noise_lsb = adc_noise_lsb
+        self.ripple_lsb_per_a = ripple_lsb_per_a
+        self.spike_prob = spike_prob
+        self.spike_lsb = spike_lsb
+        self.adc_read_us = adc_read_us
+        self.die_temp_c = die_temp_c
+        self.front_end = front_end
+
+        # 第 2 コアのスレッドと main からの plant 更新を直列にする
+        self._plant_lock = threading.Lock()
+
+        self.pin_values = {}
+        self.pwm_duty = {}
+        self.pwm_freq = {}
+        self.i2c_devices = {}
+
+        self.adc_reads = 0
+        self.i2c_bytes = 0
+
+        self.lcd = So1602aModel()
+        self.attach_i2c(config.LCD_I2C_NO, config.LCD_ADDR, self.lcd)
+
+    # ------------------------------------------------------------------
+    # time
+
+    def now_s(self) -> float:
+        return self.clock.now_s()
+
+    def sync_plant(self) -> None:
+        with self._plant_lock:
+            self.plant.update(self.clock.now_s())
+
+    # ------------------------------------------------------------------
+    # ADC
+
+    def adc_volts(self, gpio: int) -> float:
+        """Noise-free voltage at the ADC input for ``gpio``."""
+        plant = self.plant
+        if gpio == config.ADC_PIN_PANEL_V:
+            return plant.pv_v / config.P_VOLT_RT
+        if gpio == config.ADC_PIN_PANEL_I:
+            return (plant.pv_i + config.P_CURRENT_REV) / config.P_CURRENT
+        if gpio == config.ADC_PIN_BATTERY:
+            return plant.bat_v / config.B_VOLT_RT
+        if gpio == TEMP_SENSOR_CH:
+            return 0.706 - (self.die_temp_c - 27.0) * 0.001721
+        return 0.0
+
+    def adc_read_u16(self, gpio: int) -> int:
+        with self._plant_lock:
+            # 動作点は settle_s ごとにしか変わらないので、変換ごとに積分しない
+            self.plant.poll(self.clock.now_s())
+            self.adc_reads += 1
+            volts = self.adc_volts(gpio)
+            if self.front_end is not None:
+                volts = self.front_end(gpio, volts, self.die_temp_c)
+            raw = volts / ADC_VREF * 4095.0
+            sigma = self.adc_noise_lsb + self.ripple_lsb_per_a * self.plant.pv_i
+            if sigma > 0.0:
+                raw += self.rng.gauss(0.0, sigma)
+            if self.spike_prob and self.rng.random() < self.spike_prob:
+                raw += self.spike_lsb if self.rng.random() < 0.5 else -self.spike_lsb
+        raw = int(raw + 0.5)
+        if raw < 0:
+            raw = 0
+        elif raw > 4095:
+            raw = 4095
+        self.clock.advance_us(self.adc_read_us)
+        # MicroPython と同じ 12bit → 16bit 変換
+        return (raw << 4) | (raw >> 8)
+
+    # ------------------------------------------------------------------
+    # PWM
+
+    def set_pwm_duty(self, pin, duty_u16: int) -> None:
+        self.pwm_duty[pin] = duty_u16
+        if pin == config.PWM_PIN:
+            with self._plant_lock:
+                self.plant.set_duty(self.clock.now_s(), duty_u16)
+
+    # ------------------------------------------------------------------
+    # I2C
+
+    def attach_i2c(self, bus: int, addr: int, device) -> None:
+        self.i2c_devices[(bus, addr)] = device
+
+    def detach_i2c(self, bus: int, addr: int) -> None:
+        self.i2c_devices.pop((bus, addr), None)
+
+    def i2c_write(self, bus: int, addr: int, payload, freq: int) -> None:
+        """Deliver ``payload`` to the device and charge the bus time."""
+        byte_us = 9_000_000 / freq
+        # START + アドレス + ペイロード + STOP
+        cost = (len(payload) + 1) * byte_us + 2 * 1_000_000 / freq
+        device = self.i2c_devices.get((bus, addr))
+        if device is None:
+            self.clock.advance_us(byte_us)
+            raise OSError(errno.EIO)
+        device.i2c_write(payload, self.clock.now_us(), byte_us)
+        self.i2c_bytes += len(payload)
+        self.clock.advance_us(cost)
+
+    def i2c_scan(self, bus: int):
+        return sorted(a for (b, a) in self.i2c_devices if b == bus)
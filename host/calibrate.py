@@ -0,0 +1,269 @@
+"""Fit per-board ADC calibration curves from reference measurements.
+
+Input is a CSV file with one row per reference point::
+
+    channel,raw,temp_c,reference
+    p_voltage_mv,10422,24.8,12010
+    p_current_ma,3391,24.8,1000
+    ...
+
+``raw`` and ``temp_c`` are what ``calibration.dump_raw(ctx)`` prints on
+the Pico while a known voltage / current is applied, ``reference`` is
+the value read from the reference meter [mV / mA].  For every channel a
+polynomial of ``--degree`` in the raw count is fitted by least squares;
+for the channels in ``--temp`` whose points span at least
+:data:`MIN_TEMP_SPAN` degC a linear temperature drift of the offset is
+fitted with it.  The curve is reduced to ``--points`` calibration
+points over the measured range, the form ``config.SENSE_CALIBRATION``
+takes, and the error of the firmware's integer conversion (the real
+``sensor_ctrl.SampleChannel`` with the table built as at boot) is
+reported next to the error of the plain linear conversion.
+
+``--out`` writes ``calib_site.py``, which ``config.py`` imports; copy
+it to the Pico next to ``config.py``::
+
+    python -m host.calibrate refs.csv --out calib_site.py
+
+``--sim`` takes the reference session on a simulated board whose front
+end has a nonlinear divider and a temperature-dependent current offset
+(:class:`DemoFrontEnd`), at two temperatures, and checks the result on a
+second session at other temperatures::
+
+    python -m host.calibrate --sim
+"""
+
+import argparse
+import csv
+import random
+
+try:
+    import numpy as np
+except ImportError:  # ホスト専用ツールなので実行時にだけ要求する
+    np = None
+
+import calibration
+import config
+import sensor_ctrl
+
+# これより温度の幅が狭いデータからはドリフトを求めない [degC]
+MIN_TEMP_SPAN = 5.0
+SPECS = {spec[0]: spec for spec in config.SENSE_CHANNELS}
+
+
+def read_rows(path) -> list:
+    """``(channel, raw, temp_c, reference)`` tuples from a CSV file."""
+    rows = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            rows.append((row["channel"].strip(), int(row["raw"]), float(row["temp_c"]),
+                         float(row["reference"])))
+    return rows
+
+
+def fit_channel(rows, degree=2, temp=False, points=9) -> dict:
+    """Fit one channel's rows; returns ``{"points", "temp_coeff"}``.
+
+    ``temp_coeff`` is ``(coeff, ref_c)`` for ``config.SENSE_TEMP_COEFF``
+    or None.
+    """
+    raw = np.array([r[1] for r in rows], dtype=float)
+    temp_c = np.array([r[2] for r in rows], dtype=float)
+    ref = np.array([r[3] for r in rows], dtype=float)
+    if len(set(raw.tolist())) <= degree:
+        raise SystemExit("calibrate: %s needs more than %d distinct points" % (rows[0][0], degree))
+    x = raw / 65535.0
+    cols = [x ** k for k in range(degree + 1)]
+    use_temp = temp and temp_c.max() - temp_c.min() >= MIN_TEMP_SPAN
+    ref_c = float(round(temp_c.mean())) if use_temp else 0.0
+    if use_temp:
+        # 値 = 多項式(raw) - 係数 * (温度 - 基準温度)
+        cols.append(-(temp_c - ref_c))
+    sol = np.linalg.lstsq(np.stack(cols, axis=1), ref, rcond=None)[0]
+    poly = sol[:degree + 1]
+    lo = int(raw.min())
+    hi = int(raw.max())
+    at = np.unique(np.linspace(lo, hi, points).round().astype(int))
+    values = sum(c * (at / 65535.0) ** k for k, c in enumerate(poly))
+    return {
+        "points": tuple((int(r), int(round(v))) for r, v in zip(at, values)),
+        "temp_coeff": (round(float(sol[-1]), 4), ref_c) if use_temp else None,
+    }
+
+
+def fit(rows, degree=2, temp_channels=("p_current_ma",), points=9) -> dict:
+    """Channel name → :func:`fit_channel` result for every channel in ``rows``."""
+    by_channel = {}
+    for row in rows:
+        if row[0] not in SPECS:
+            raise SystemExit("calibrate: unknown channel %r" % row[0])
+        by_channel.setdefault(row[0], []).append(row)
+    return {name: fit_channel(r, degree, name in temp_channels, points)
+            for name, r in sorted(by_channel.items())}
+
+
+def channel(name, result=None):
+    """The firmware's ``SampleChannel`` for ``name``, calibrated with ``result`` if given."""
+    ch = sensor_ctrl.SampleChannel(name, None, *SPECS[name][2:])
+    if result is not None:
+        ch.set_calibration(result["points"])
+        if result["temp_coeff"] is not None:
+            ch.set_temp_coeff(*result["temp_coeff"])
+    return ch
+
+
+def firmware_value(ch, raw, temp_c) -> int:
+    """What the firmware reports for ``raw`` at ``temp_c``."""
+    if ch.temp_coeff_q8:
+        ch.temp_corr = calibration.temp_correction(ch.temp_coeff_q8, ch.temp_ref_dc,
+                                                   int(round(temp_c * 10)))
+    return ch.convert(raw)
+
+
+def errors(rows, results) -> dict:
+    """Channel → ``(linear max, linear rms, calibrated max, calibrated rms)`` [mV / mA]."""
+    out = {}
+    for name in sorted({r[0] for r in rows}):
+        lin = channel(name)
+        cal = channel(name, results.get(name))
+        e_lin = [firmware_value(lin, raw, t) - ref for n, raw, t, ref in rows if n == name]
+        e_cal = [firmware_value(cal, raw, t) - ref for n, raw, t, ref in rows if n == name]
+        out[name] = (max(abs(e) for e in e_lin), (sum(e * e for e in e_lin) / len(e_lin)) ** 0.5,
+                     max(abs(e) for e in e_cal), (sum(e * e for e in e_cal) / len(e_cal)) ** 0.5)
+    return out
+
+
+def site_source(results, comment="") -> str:
+    """Text of a ``calib_site.py`` for ``results``."""
+    lines = ["# host/calibrate.py が生成した基板ごとの校正値（config.py の最後で読み込まれる）"]
+    if comment:
+        lines.append("# " + comment)
+    lines.append("SENSE_CALIBRATION = {")
+    for name, r in results.items():
+        lines.append("    %r: (" % name)
+        lines.extend("        %r," % (p,) for p in r["points"])
+        lines.append("    ),")
+    lines.append("}")
+    lines.append("SENSE_TEMP_COEFF = {")
+    for name, r in results.items():
+        if r["temp_coeff"] is not None:
+            lines.append("    %r: %r," % (name, r["temp_coeff"]))
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+class DemoFrontEnd:
+    """A plausible badly-behaved front end for ``host.Board(front_end=...)``.
+
+    Panel and battery dividers with gain error and bow (input loading
+    that grows with the voltage), and a current sensor with a gain error
+    and an offset of ``offset_ma`` at 25 degC drifting by
+    ``drift_ma_per_c``.
+    """
+
+    def __init__(self, offset_ma=50.0, drift_ma_per_c=2.0):
+        self.offset_ma = offset_ma
+        self.drift_ma_per_c = drift_ma_per_c
+
+    def __call__(self, gpio, volts, temp_c):
+        if gpio == config.ADC_PIN_PANEL_V:
+            return volts * (1.02 - 0.03 * volts / 3.3) + 0.004
+        if gpio == config.ADC_PIN_BATTERY:
+            return volts * (0.99 + 0.02 * volts / 3.3) - 0.002
+        if gpio == config.ADC_PIN_PANEL_I:
+            offset_a = (self.offset_ma + self.drift_ma_per_c * (temp_c - 25.0)) / 1000
+            return volts * 1.01 + offset_a / config.P_CURRENT
+        return volts
+
+
+class _Bench:
+    """Plant stand-in holding fixed reference values."""
+
+    def __init__(self):
+        self.pv_v = 0.0
+        self.pv_i = 0.0
+        self.bat_v = 0.0
+
+    def update(self, t_s) -> None:
+        pass
+
+
+# --sim で基準器が出す値の範囲 [mV / mA]
+SIM_RANGES = {
+    "p_voltage_mv": (1000, 26000),
+    "p_current_ma": (100, 8000),
+    "b_voltage_mv": (10000, 15500),
+}
+
+
+def sim_rows(front_end, temps, levels=12, seed=0, samples=256) -> list:
+    """Reference session on a simulated board: ``levels`` points per channel and temperature."""
+    from host.board import TEMP_SENSOR_CH, Board
+
+    rng = random.Random(seed)
+    bench = _Bench()
+    rows = []
+    for temp_c in temps:
+        board = Board(plant=bench, seed=rng.randrange(1 << 30), die_temp_c=temp_c,
+                      front_end=front_end)
+        for name, (lo, hi) in SIM_RANGES.items():
+            pin = SPECS[name][1]
+            for k in range(levels):
+                ref = lo + (hi - lo) * (k + rng.random() * 0.5) / (levels - 0.5)
+                bench.pv_v = ref / 1000 if name == "p_voltage_mv" else 18.0
+                bench.pv_i = ref / 1000 if name == "p_current_ma" else 0.0
+                bench.bat_v = ref / 1000 if name == "b_voltage_mv" else 12.5
+                reads = sorted(board.adc_read_u16(pin) for _ in range(samples))
+                cut = samples // 10
+                kept = reads[cut:samples - cut]
+                raw = (sum(kept) + len(kept) // 2) // len(kept)
+                t_raw = sum(board.adc_read_u16(TEMP_SENSOR_CH) for _ in range(8)) >> 3
+                rows.append((name, raw, calibration.temp_decicelsius(t_raw) / 10, round(ref)))
+    return rows
+
+
+def print_errors(title, errs) -> None:
+    print(title)
+    print("  channel        linear max   rms   calibrated max   rms")
+    for name, (lm, lr, cm, cr) in errs.items():
+        print("  %-14s %10.0f %5.0f %16.0f %5.0f" % (name, lm, lr, cm, cr))
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("csv", nargs="?", help="reference measurements")
+    ap.add_argument("--sim", action="store_true", help="calibrate a simulated board instead")
+    ap.add_argument("--degree", type=int, default=2, help="polynomial degree")
+    ap.add_argument("--points", type=int, default=9, help="calibration points per channel")
+    ap.add_argument("--temp", default="p_current_ma",
+                    help="comma-separated channels to fit a temperature drift for")
+    ap.add_argument("--out", default=None, help="write calib_site.py here")
+    args = ap.parse_args(argv)
+    if (args.csv is None) == (not args.sim):
+        ap.error("give a CSV file or --sim")
+    if np is None:
+        raise SystemExit("calibrate: NumPy is required (pip install numpy)")
+    temp_channels = tuple(n for n in args.temp.split(",") if n)
+
+    if args.sim:
+        front_end = DemoFrontEnd()
+        rows = sim_rows(front_end, temps=(10.0, 40.0))
+        source = "simulated board, DemoFrontEnd"
+    else:
+        rows = read_rows(args.csv)
+        source = args.csv
+    results = fit(rows, args.degree, temp_channels, args.points)
+    print_errors("fit (%d reference points) [mV / mA]:" % len(rows), errors(rows, results))
+    if args.sim:
+        check = sim_rows(front_end, temps=(20.0, 50.0), seed=1)
+        print_errors("check session at 20 / 50 degC:", errors(check, results))
+    for name, r in results.items():
+        if r["temp_coeff"] is not None:
+            print("%s: offset drift %.3f per degC around %.0f degC" % ((name,) + r["temp_coeff"]))
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(site_source(results, "from " + source))
+        print("wrote %s" % args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""Check that the steady-state control loop does not allocate.
+
+Runs the startup sequence, warms the loop up, then runs the sensor ->
+safety -> MPPT -> PWM -> LCD stages and fails if any stage allocates.
+Peripheral stand-ins are replaced by allocation-free ones
+(:class:`QuietBoard`) so only firmware code is measured.
+
+CPython is not MicroPython, so "allocates" needs a host definition.
+CPython boxes every int above 256, so integer arithmetic the Pico does
+for free (ADC sums, ``ticks_us`` values, duty counts) shows up as
+short-lived objects.  A peak byte count per stage cannot tell those
+from a real allocation, so the stages are also run under
+:class:`OpcodeTracer`, which attributes every change of the traced heap
+to the bytecode instruction that made it and sorts it:
+
+* Int boxes: made by an instruction that computes an int
+  (:data:`_INT_OPS`: arithmetic, indexing an array, or a call of
+  ``abs`` / ``int`` / ``min`` / ``max`` / ``len``) and a whole number
+  of :data:`INT_BOX` bytes, the size of one int below 2^30 (measured
+  at import with a baseline that only boxes ints).  Below 2^30 is
+  exactly the MicroPython small-int range; a larger int is bigger and
+  is not counted as a box.  The size alone is not enough: a bound
+  method from ``LOAD_ATTR`` is 64 bytes, two boxes' worth.
+* Loop iterators: ``GET_ITER`` and the ``range`` object of a
+  ``for ... in range(...)``.  MicroPython keeps both on the C stack.
+* Everything else -- a string, bytes, list, a tuple or dict built by a
+  ``BUILD_*`` instruction, a closure, a bound method, an int of 2^30 or
+  more, anything from an instruction not in :data:`_INT_OPS` -- is an
+  allocation and fails the check, with its file, line and
+  instruction.
+
+Tuples and floats that CPython takes from a free list do not show in
+the traced heap; tuples are still caught by their ``BUILD_TUPLE``, but
+a float is invisible here, although it is a heap object on the Pico.
+The hot path works on integer mV / mA / mW values; only the float
+display views of ``Measurements`` make floats, and the loop does not
+read them.  Finally, nothing may survive a stage: the retained size
+must return to the starting level every iteration.
+
+The table printed is :class:`alloc_probe.AllocProbe` (the ``tracemalloc``
+peak, int boxes included) next to the boxes per run the tracer counted.
+On the Pico set ``config.ALLOC_PROBE = True`` and call
+``ctx.probe.dump()`` from the REPL for ``gc.mem_alloc()`` based numbers.
+
+    python -m host.check_alloc
+    python -m host.check_alloc --profile    # with the time_probe stage timing
+"""
+
+import dis
+import os
+import sys
+import tracemalloc
+from array import array
+
+import host
+from host.board import TEMP_SENSOR_CH, Board
+
+_HOST_DIR = os.path.dirname(os.path.abspath(host.__file__)) + os.sep
+# int を計算する命令。CPython ではここで箱が作られるが、Pico では small int なので確保ではない
+_INT_OPS = frozenset(("BINARY_OP", "BINARY_SUBSCR", "UNARY_NEGATIVE", "UNARY_INVERT",
+                      "FOR_ITER"))
+# 呼び出しのうち int を返す組み込み関数（同じ行で読まれていれば CALL も _INT_OPS 扱い）
+_INT_BUILTINS = frozenset(("abs", "int", "min", "max", "len"))
+
+
+def _int_box_size(base) -> int:
+    """Traced bytes of one int near ``base`` (baseline that only boxes ints)."""
+    was = tracemalloc.is_tracing()
+    if not was:
+        tracemalloc.start()
+    n = 64
+    slots = [None] * n
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(n):
+        slots[i] = base + i
+    size = (tracemalloc.get_traced_memory()[0] - before) // n
+    del slots
+    if not was:
+        tracemalloc.stop()
+    return size
+
+
+# small int（2^30 未満）1 個 / 2^30 以上の int 1 個の大きさ [bytes]
+INT_BOX = _int_box_size(1000)
+RANGE_SIZE = sys.getsizeof(range(1))
+if _int_box_size(1 << 30) == INT_BOX:
+    raise SystemExit("check_alloc: cannot tell ints from 2^30 up from small ints here")
+
+
+class OpcodeTracer:
+    """Attributes heap changes of traced code to bytecode instructions.
+
+    ``run(fn, ctx)`` calls ``fn(ctx)`` with ``sys.settrace`` and
+    per-instruction events for all code outside ``host/``.  Between two
+    events only one instruction of firmware code ran, so the change of
+    ``tracemalloc``'s traced size is that instruction's.  An instruction
+    that called into ``host/`` (``time.ticks_us`` and the other
+    stand-ins for the Pico's C functions) is not counted: the stand-in's
+    own int churn is not the firmware's, and anything the firmware builds
+    to pass to it is caught at its ``BUILD_*``.  Frame objects the tracer forces into
+    existence are kept alive until the run ends and their size is taken
+    off, so they neither count nor show up as frees later.  The first
+    call of a function under the tracer is not counted either: CPython
+    builds the function's line table for tracing then.
+    """
+
+    def __init__(self, max_frames=4096):
+        self._frames = [None] * max_frames
+        self._n = 0
+        self._mark = array("q", [0])
+        self._lasti = array("q", [-1])
+        self._fresh = array("b", [0])
+        self._host = array("b", [0])
+        self._code = [None]
+        self._ops = {}
+        self._local_cb = self._local
+        self._global_cb = self._global
+        self.boxes = 0
+        self.other = []
+
+    def run(self, fn, ctx) -> None:
+        self._code[0] = None
+        self._mark[0] = tracemalloc.get_traced_memory()[0]
+        sys.settrace(self._global_cb)
+        try:
+            fn(ctx)
+        finally:
+            sys.settrace(None)
+            for k in range(self._n):
+                self._frames[k] = None
+            self._n = 0
+
+    def _global(self, frame, event, arg):
+        if frame.f_code.co_filename.startswith(_HOST_DIR):
+            self._host[0] = 1
+            return None
+        d = tracemalloc.get_traced_memory()[0] - self._mark[0] - sys.getsizeof(frame)
+        if self._n == len(self._frames):
+            raise RuntimeError("check_alloc: too many calls in one stage")
+        self._frames[self._n] = frame
+        self._n += 1
+        # 最初の call はステージの入口（settrace と呼び出し自体の分）なので数えない。
+        # 初めての関数は最初の行のイベントまでにトレース用の行番号表が作られるので、そこまで数えない
+        if frame.f_code in self._ops:
+            if d > 0 and self._code[0] is not None and not self._host[0]:
+                self._note(d)
+        else:
+            self._instructions(frame.f_code)
+            self._fresh[0] = 1
+        del d
+        self._host[0] = 0
+        frame.f_trace_opcodes = True
+        self._mark[0] = tracemalloc.get_traced_memory()[0]
+        return self._local_cb
+
+    def _local(self, frame, event, arg):
+        d = tracemalloc.get_traced_memory()[0] - self._mark[0]
+        if self._fresh[0]:
+            self._fresh[0] = 0
+        elif d > 0 and not self._host[0]:
+            self._note(d)
+        del d
+        self._host[0] = 0
+        if event == "opcode":
+            self._code[0] = frame.f_code
+            self._lasti[0] = frame.f_lasti
+        self._mark[0] = tracemalloc.get_traced_memory()[0]
+        return self._local_cb
+
+    def _instructions(self, code) -> dict:
+        """offset → (opname, next opname, line, ``range`` called on that line, makes an int)."""
+        ops = self._ops.get(code)
+        if ops is None:
+            ins = [i for i in dis.get_instructions(code) if i.opname != "CACHE"]
+            ranges = {i.positions.lineno for i in ins
+                      if i.opname == "LOAD_GLOBAL" and i.argval == "range"}
+            int_calls = {i.positions.lineno for i in ins
+                         if i.opname == "LOAD_GLOBAL" and i.argval in _INT_BUILTINS}
+            ops = {}
+            for k, i in enumerate(ins):
+                nxt = ins[k + 1].opname if k + 1 < len(ins) else ""
+                line = i.positions.lineno
+                makes_int = i.opname in _INT_OPS or (i.opname == "CALL" and line in int_calls)
+                ops[i.offset] = (i.opname, nxt, line, line in ranges, makes_int)
+            self._ops[code] = ops
+        return ops
+
+    def _note(self, d) -> None:
+        code = self._code[0]
+        if code is None:
+            self.other.append(("?", 0, "?", d))
+            return
+        op, nxt, line, has_range, makes_int = self._instructions(code).get(
+            self._lasti[0], ("?", "", 0, False, False))
+        if op == "GET_ITER" or (op == "CALL" and nxt == "GET_ITER" and has_range
+                                and d == RANGE_SIZE):
+            return
+        if makes_int and d % INT_BOX == 0:
+            self.boxes += d // INT_BOX
+            return
+        self.other.append((os.path.basename(code.co_filename), line, op, d))
+
+
+class _Sink:
+    """I2C device that accepts and drops everything."""
+
+    def i2c_write(self, payload, start_us, byte_us):
+        pass
+
+
+class QuietBoard(Board):
+    """Board whose peripherals allocate nothing on the CPython heap.
+
+    ADC reads cycle through precomputed values of a fixed operating point;
+    PWM and I2C writes are only recorded.  The clock does not move.
+    """
+
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self._values = {}
+        self._pos = 0
+        self.sync_plant()
+        for gpio in (TEMP_SENSOR_CH, 26, 27, 28, 29):
+            base = int(self.adc_volts(gpio) / 3.3 * 4095.0)
+            row = []
+            for k in range(64):
+                raw = base + (k * 37) % 7 - 3
+                if raw < 0:
+                    raw = 0
+                elif raw > 4095:
+                    raw = 4095
+                row.append((raw << 4) | (raw >> 8))
+            self._values[gpio] = row
+        import config
+        self.i2c_devices.clear()
+        self.attach_i2c(config.LCD_I2C_NO, config.LCD_ADDR, _Sink())
+
+    def adc_read_u16(self, gpio):
+        self._pos = (self._pos + 1) & 63
+        return self._values[gpio][self._pos]
+
+    def set_pwm_duty(self, pin, duty_u16):
+        self.pwm_duty[pin] = duty_u16
+
+    def i2c_write(self, bus, addr, payload, freq):
+        device = self.i2c_devices.get((bus, addr))
+        if device is None:
+            raise OSError(5)
+        device.i2c_write(payload, 0, 0)
+
+
+def run(warmup=300, cycles=200, traced=5, strategy=None, profile=False):
+    """Return ``(probe, tracers, retained)``.
+
+    After ``warmup`` iterations every stage is run ``traced`` times
+    under its own :class:`OpcodeTracer` (``tracers``, in stage order),
+    then ``warmup`` + ``cycles`` iterations under
+    :class:`alloc_probe.AllocProbe`, of which the last ``cycles`` count.
+    With ``profile`` the stages are also timed by
+    ``time_probe.TimeProbe`` (inside the allocation probe, as ``main``
+    does), so its bookkeeping and the LCD timing page are checked too.
+    """
+    board = QuietBoard()
+    host.install(board)
+    import config
+    saved = (config.TRIP_ENABLE, config.SENSE_DUAL_CORE, config.MPPT_STRATEGY)
+    config.TRIP_ENABLE = False
+    config.SENSE_DUAL_CORE = False
+    if strategy is not None:
+        config.MPPT_STRATEGY = strategy
+    try:
+        import main
+        from alloc_probe import AllocProbe
+        from context import factory_instance
+
+        ctx = factory_instance.first_create()
+        ctx.state.mppts.c_step = (config.MPPT_MIN_DUTY + config.MPPT_MAX_DUTY) // 2
+        if profile:
+            import lcd_ctrl
+            from time_probe import TimeProbe
+            timer = TimeProbe()
+            main.instrument(timer)
+            lcd_ctrl.show_profile(timer, 1)
+        probe = AllocProbe()
+        # 周期ごとに 1 ずつ増える統計用カウンタ（AdcChannels.cycles など）は 256 を越えた時点で
+        # CPython では箱になって 1 個残る。Pico では small int なので、越えてから測る
+        for _ in range(warmup):
+            main.control_task(ctx)
+            main.mppt_task(ctx)
+            main.update_lcd(ctx)
+
+        # main.instrument と同じ順のステージ（profile なら TimeProbe で包まれたもの）
+        stages = (main.read_sensor_data, main.safety_check, main.mppt_control_step,
+                  main.pwm_control, main.update_lcd)
+        tracers = tuple(OpcodeTracer() for _ in stages)
+        # 1 回目はトレース下での初回の分（特殊化された命令の準備など）が混ざるので捨てる
+        for i in range(traced + 1):
+            for tracer, stage in zip(tracers, stages):
+                tracer.run(stage, ctx)
+                if i == 0:
+                    tracer.boxes = 0
+                    del tracer.other[:]
+            main.apply_duty(ctx)
+
+        main.instrument(probe)
+        retained = 0
+        for i in range(warmup + cycles):
+            if i == warmup:
+                probe.reset()
+            before = tracemalloc.get_traced_memory()[0]
+            main.control_task(ctx)
+            main.mppt_task(ctx)
+            main.update_lcd(ctx)
+            if i >= warmup:
+                retained += tracemalloc.get_traced_memory()[0] - before
+        return probe, tracers, retained
+    finally:
+        config.TRIP_ENABLE, config.SENSE_DUAL_CORE, config.MPPT_STRATEGY = saved
+        host.uninstall()
+
+
+def check(probe, tracers, retained) -> list:
+    problems = []
+    for name, tracer in zip(probe.names, tracers):
+        for file, line, op, size in tracer.other:
+            problems.append("%s: %d bytes at %s:%d (%s)" % (name, size, file, line, op))
+    if retained > 0:
+        problems.append("%d bytes retained over the measured cycles" % retained)
+    return problems
+
+
+def main(argv=None) -> None:
+    import argparse
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--cycles", type=int, default=200)
+    ap.add_argument("--traced", type=int, default=5, help="runs of each stage under the tracer")
+    ap.add_argument("--strategy", default=None, help="MPPT strategy to exercise")
+    ap.add_argument("--profile", action="store_true",
+                    help="also time the stages with time_probe (config.PROFILE_STAGES)")
+    args = ap.parse_args(argv)
+
+    probe, tracers, retained = run(cycles=args.cycles, traced=args.traced,
+                                   strategy=args.strategy, profile=args.profile)
+    probe.dump()
+    print("int boxes per run (%d bytes each):" % INT_BOX)
+    for name, tracer in zip(probe.names, tracers):
+        print("  %-7s %6.1f" % (name, tracer.boxes / args.traced))
+    problems = check(probe, tracers, retained)
+    for p in problems:
+        print("FAIL", p)
+    if problems:
+        raise SystemExit(1)
+    print("OK: no stage allocates anything but CPython int boxes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Behavioural model of the SO1602A character OLED on the I2C bus.
+
+Only the parts of the instruction set used by ``so1602a`` are modelled:
+clear, return home, display on/off and set DDRAM address, plus data
+writes with address auto-increment.  Every I2C transfer starts with a
+control byte (``0x00`` command stream, ``0x40`` data stream, bit 7 set
+for a single-byte "continuation" control byte).
+
+The model also keeps the statistics needed to evaluate driver changes:
+number of transfers, payload bytes and writes that arrived while the
+controller was still busy with the previous instruction.
+"""
+
+# 命令の実行時間 [us]（HD44780 互換タイミング）
+CLEAR_US = 1520
+HOME_US = 1520
+CMD_US = 37
+DATA_US = 41
+
+ROW_ADDR = (0x00, 0x20)
+COLS = 16
+
+_DECODE = {0x5c: "¥", 0x7e: "→", 0x7f: "←"}
+
+
+class So1602aModel:
+    """DDRAM image and timing bookkeeping for one SO1602A."""
+
+    def __init__(self):
+        self.ddram = bytearray(b" " * 0x80)
+        self.addr = 0
+        self.display_on = False
+        self.busy_until_us = 0
+
+        self.transfers = 0
+        self.data_bytes = 0
+        self.command_bytes = 0
+        self.busy_violations = 0
+
+    def reset_stats(self) -> None:
+        self.transfers = 0
+        self.data_bytes = 0
+        self.command_bytes = 0
+        self.busy_violations = 0
+
+    def i2c_write(self, payload, start_us: int, byte_us: float) -> None:
+        """Consume one I2C write (control byte followed by payload bytes).
+
+        Args:
+            payload: Bytes after the slave address.
+            start_us: Time the address byte was sent.
+            byte_us: Bus time per byte (9 clocks).
+        """
+        self.transfers += 1
+        data = bytes(payload)
+        i = 0
+        n = len(data)
+        while i < n:
+            ctrl = data[i]
+            i += 1
+            continuation = ctrl & 0x80
+            is_data = ctrl & 0x40
+            if continuation:
+                # Co=1: 1 バイトだけ処理して次の制御バイトへ
+                if i < n:
+                    self._exec(data[i], is_data, start_us + (i + 2) * byte_us)
+                    i += 1
+                continue
+            while i < n:
+                self._exec(data[i], is_data, start_us + (i + 2) * byte_us)
+                i += 1
+
+    def _exec(self, byte: int, is_data, now: float) -> None:
+        if now < self.busy_until_us:
+            self.busy_violations += 1
+        if is_data:
+            self.data_bytes += 1
+            self.ddram[self.addr & 0x7f] = byte
+            self.addr = (self.addr + 1) & 0x7f
+            self.busy_until_us = now + DATA_US
+            return
+        self.command_bytes += 1
+        if byte & 0x80:
+            self.addr = byte & 0x7f
+            self.busy_until_us = now + CMD_US
+        elif byte == 0x01:
+            for k in range(len(self.ddram)):
+                self.ddram[k] = 0x20
+            self.addr = 0
+            self.busy_until_us = now + CLEAR_US
+        elif byte & 0xfe == 0x02:
+            self.addr = 0
+            self.busy_until_us = now + HOME_US
+        else:
+            if byte & 0xf8 == 0x08:
+                self.display_on = bool(byte & 0x04)
+            self.busy_until_us = now + CMD_US
+
+    def row_codes(self, row: int) -> bytes:
+        base = ROW_ADDR[row]
+        return bytes(self.ddram[base:base + COLS])
+
+    def text(self, row: int) -> str:
+        """Visible characters of ``row`` decoded back to a string (ASCII only)."""
+        out = []
+        for b in self.row_codes(row):
+            c = _DECODE.get(b)
+            if c is None:
+                c = chr(b) if 0x20 <= b < 0x7f else "?"
+            out.append(c)
+        return "".join(out)
@@ -0,0 +1,99 @@
+"""Decode the binary logs written by ``data_log.DataLogger``.
+
+Copy the log directory off the Pico (``mpremote cp -r :log .``), then::
+
+    python -m host.log_decode log --csv log.csv
+
+prints a summary (records, boots, time covered, energy, time in
+warning/shutdown) and optionally writes every record as CSV with the
+values in V / A / W.  Blocks that fail the CRC check (torn by a power
+cut) are skipped and counted.
+"""
+
+import argparse
+import csv
+import os
+import sys
+
+import data_log
+
+
+def count_bad_blocks(directory, files, block_size) -> int:
+    bad = 0
+    for i in range(files):
+        path = data_log.log_path(directory, i)
+        if not os.path.exists(path):
+            continue
+        size = os.path.getsize(path)
+        total = (size + block_size - 1) // block_size
+        good = sum(1 for _ in data_log.read_blocks(path, block_size))
+        bad += total - good
+    return bad
+
+
+def load(directory, files=None, block_size=None) -> list:
+    """Return ``[(seq, boot, record_tuple), ...]`` oldest first."""
+    return list(data_log.iter_records(directory, files, block_size))
+
+
+def summarize(rows) -> dict:
+    """Energy and status times, integrating each record over its period."""
+    energy_j = 0.0
+    seconds = 0
+    status_s = [0, 0, 0]
+    boots = set()
+    prev = None
+    for _, boot, rec in rows:
+        boots.add(boot)
+        uptime = rec[0]
+        if prev is not None and prev[0] == boot and uptime > prev[1]:
+            dt = uptime - prev[1]
+            seconds += dt
+            energy_j += rec[4] / 1000 * dt
+            status_s[rec[7]] += dt
+        prev = (boot, uptime)
+    return {
+        "records": len(rows),
+        "boots": len(boots),
+        "covered_s": seconds,
+        "energy_wh": energy_j / 3600,
+        "warning_s": status_s[1],
+        "shutdown_s": status_s[2],
+    }
+
+
+def write_csv(rows, out) -> None:
+    w = csv.writer(out)
+    w.writerow(("seq", "boot", "uptime_s", "p_voltage", "p_current", "b_voltage",
+                "p_power", "duty", "direction", "status", "trip_cause"))
+    for seq, boot, rec in rows:
+        w.writerow((seq, boot, rec[0], rec[1] / 1000, rec[2] / 1000, rec[3] / 1000,
+                    rec[4] / 1000, rec[5], rec[6], data_log.STATUS_NAMES[rec[7]], rec[8]))
+
+
+def main(argv=None) -> None:
+    import config
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("directory", help="directory holding log00.bin ...")
+    ap.add_argument("--files", type=int, default=config.LOG_FILES)
+    ap.add_argument("--block-size", type=int, default=config.LOG_BLOCK_SIZE)
+    ap.add_argument("--csv", default=None, help="write records to this file ('-' for stdout)")
+    args = ap.parse_args(argv)
+
+    rows = load(args.directory, args.files, args.block_size)
+    s = summarize(rows)
+    bad = count_bad_blocks(args.directory, args.files, args.block_size)
+    print("records    : %d in %d boot(s), %d bad block(s) skipped" % (s["records"], s["boots"], bad))
+    print("covered    : %.2f h" % (s["covered_s"] / 3600))
+    print("energy     : %.3f Wh" % s["energy_wh"])
+    print("warning    : %d s, shutdown: %d s" % (s["warning_s"], s["shutdown_s"]))
+    if args.csv == "-":
+        write_csv(rows, sys.stdout)
+    elif args.csv:
+        with open(args.csv, "w", newline="") as f:
+            write_csv(rows, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Host stand-in for MicroPython's ``machine`` module.
+
+Only the classes the firmware uses are provided: :class:`Pin`,
+:class:`ADC`, :class:`PWM`, :class:`I2C` and :class:`Timer`.  All of them forward to the
+active :class:`host.board.Board` set up by :func:`host.install`.
+"""
+
+from host import board as _board_mod
+
+_board = None
+
+
+def _attach(board) -> None:
+    global _board
+    _board = board
+
+
+def _current():
+    if _board is None:
+        raise RuntimeError("host.machine used before host.install()")
+    return _board
+
+
+def _pin_id(pin):
+    return pin.id() if isinstance(pin, Pin) else pin
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self._id = id
+        self._mode = mode
+        if value is not None:
+            self.value(value)
+
+    def id(self):
+        return self._id
+
+    def init(self, mode=-1, pull=-1, value=None):
+        self._mode = mode
+        if value is not None:
+            self.value(value)
+
+    def value(self, x=None):
+        values = _current().pin_values
+        if x is None:
+            return values.get(self._id, 0)
+        values[self._id] = 1 if x else 0
+        return None
+
+    __call__ = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def toggle(self):
+        self.value(0 if self.value() else 1)
+
+    def __repr__(self):
+        return "Pin(%r)" % (self._id,)
+
+
+class ADC:
+    CORE_TEMP = _board_mod.TEMP_SENSOR_CH
+
+    def __init__(self, pin):
+        pin = _pin_id(pin)
+        # チャネル番号 0..3 は GPIO26..29 と同じ
+        if isinstance(pin, int) and 0 <= pin <= 3:
+            pin += 26
+        self._gpio = pin
+
+    def read_u16(self):
+        return _current().adc_read_u16(self._gpio)
+
+
+class PWM:
+    def __init__(self, pin, freq=None, duty_u16=None):
+        self._pin = _pin_id(pin)
+        self._duty = 0
+        self._freq = 0
+        if freq is not None:
+            self.freq(freq)
+        if duty_u16 is not None:
+            self.duty_u16(duty_u16)
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = int(value)
+        _current().pwm_freq[self._pin] = self._freq
+        return None
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty
+        value = int(value)
+        if value < 0 or value > 65535:
+            raise ValueError("duty_u16 out of range")
+        self._duty = value
+        _current().set_pwm_duty(self._pin, value)
+        return None
+
+    def deinit(self):
+        self.duty_u16(0)
+
+
+class Timer:
+    """Periodic/one-shot callback on the board's virtual clock."""
+
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self._id = id
+        self._clock = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None, tick_hz=1000, hard=False):
+        self.deinit()
+        if freq > 0:
+            period_us = 1_000_000 / freq
+        elif period >= 0:
+            period_us = period * 1_000_000 / tick_hz
+        else:
+            raise ValueError("period or freq required")
+        if callback is None:
+            return
+        self._clock = _current().clock
+        self._clock.add_timer(self, period_us, period_us if mode == Timer.PERIODIC else 0,
+                              callback)
+
+    def deinit(self):
+        if self._clock is not None:
+            self._clock.remove_timer(self)
+            self._clock = None
+
+
+class I2C:
+    def __init__(self, id, scl=None, sda=None, freq=400000, timeout=50000):
+        self._id = id
+        self._freq = freq
+
+    def scan(self):
+        return _current().i2c_scan(self._id)
+
+    def writeto(self, addr, buf, stop=True):
+        # コピーしない（check_alloc でファームウェア側の確保だけを見るため）
+        _current().i2c_write(self._id, addr, buf, self._freq)
+        return len(buf)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        payload = bytes((memaddr & 0xff,)) + bytes(buf)
+        _current().i2c_write(self._id, addr, payload, self._freq)
+
+    def writevto(self, addr, vector, stop=True):
+        payload = b"".join(bytes(b) for b in vector)
+        _current().i2c_write(self._id, addr, payload, self._freq)
+        return len(payload)
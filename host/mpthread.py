@@ -0,0 +1,53 @@
+"""MicroPython ``_thread`` stand-in that keeps threads on the virtual clock.
+
+Only ``start_new_thread`` is replaced; everything else (locks,
+``get_ident``, ...) is CPython's ``_thread``.  A started thread gets
+its own position on the :class:`~host.vclock.VirtualClock` and runs in
+lockstep with the main thread, which is how the RP2040's second core is
+modelled.  When the simulation ends the thread stops at its next sleep
+or peripheral access.
+"""
+
+import sys
+import types
+
+from host.vclock import SimulationEnd
+
+
+def make_thread_module(clock, real_thread=None) -> types.ModuleType:
+    """Build a module object for ``sys.modules["_thread"]``."""
+    if real_thread is None:
+        real_thread = sys.modules["_thread"]
+
+    mod = types.ModuleType("_thread")
+    mod.__doc__ = "MicroPython _thread stand-in driven by host.vclock.VirtualClock"
+
+    def start_new_thread(fn, args, kwargs=None):
+        if kwargs is None:
+            kwargs = {}
+
+        def body():
+            clock.thread_enter()
+            try:
+                fn(*args, **kwargs)
+            except SimulationEnd:
+                pass
+            finally:
+                clock.thread_exit()
+
+        clock.thread_starting()
+        try:
+            return real_thread.start_new_thread(body, ())
+        except BaseException:
+            clock.thread_enter()
+            clock.thread_exit()
+            raise
+
+    mod.start_new_thread = start_new_thread
+    mod.real_thread = real_thread
+
+    def __getattr__(name):
+        return getattr(real_thread, name)
+
+    mod.__getattr__ = __getattr__
+    return mod
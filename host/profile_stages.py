@@ -0,0 +1,76 @@
+"""Time the control-loop stages on the simulated board.
+
+Runs the startup sequence and then ``main``'s scheduler for the given
+virtual time with every stage wrapped by :class:`time_probe.TimeProbe`,
+exactly as ``config.PROFILE_STAGES`` does on the Pico, and prints the
+probe's table and the LCD timing page.
+
+The host clock only moves where the board models time (ADC conversions,
+I2C transfers, sleeps), so the numbers show how the modelled I/O splits
+the cycle, not CPython speed.  On the Pico set
+``config.PROFILE_STAGES = True`` and call ``ctx.profile.dump()``.
+
+    python -m host.profile_stages --seconds 60
+    python -m host.profile_stages --set SENSE_ADAPTIVE=True
+"""
+
+import argparse
+
+import host
+from host import run
+
+
+def profile(seconds=30.0, overrides=None, page_updates=1, **board_kw):
+    """Return ``(probe, page)`` after ``seconds`` of scheduled operation.
+
+    ``page`` is the two lines of the LCD timing page for the result.
+    """
+    settings = {"PROFILE_STAGES": True, "TRIP_ENABLE": False}
+    if overrides:
+        settings.update(overrides)
+    saved = run.apply_overrides(settings)
+    board = run.build_board(**board_kw)
+    host.install(board)
+    try:
+        import lcd_ctrl
+        import main
+        from context import factory_instance
+        from sequence_first import handle_startup_sequence
+        from time_probe import TimeProbe
+
+        ctx = factory_instance.first_create()
+        if not handle_startup_sequence(ctx):
+            raise SystemExit("profile_stages: startup sequence failed")
+        probe = TimeProbe()
+        main.instrument(probe)
+        lcd_ctrl.show_profile(probe, page_updates)
+        board.clock.run_for(seconds)
+        try:
+            main.build_scheduler(ctx).run()
+        except host.SimulationEnd:
+            pass
+        lcd_ctrl.format_profile_into(probe, lcd_ctrl.PROF0, lcd_ctrl.PROF1)
+        return probe, (lcd_ctrl.PROF0.decode(), lcd_ctrl.PROF1.decode())
+    finally:
+        run.restore_overrides(saved)
+        host.uninstall()
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--seconds", type=float, default=30.0, help="simulated time")
+    ap.add_argument("--profile", default="clear", help="irradiance profile")
+    ap.add_argument("--start", type=float, default=12.0, help="time of day at start [h]")
+    ap.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                    help="override a config value")
+    args = ap.parse_args(argv)
+
+    probe, page = profile(args.seconds, run.parse_overrides(args.set),
+                           profile=args.profile, start_h=args.start)
+    probe.dump()
+    print("LCD page   : |%s|" % page[0])
+    print("             |%s|" % page[1])
+
+
+if __name__ == "__main__":
+    main()
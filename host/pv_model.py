@@ -0,0 +1,395 @@
+"""Solar panel, buck converter and battery model for host simulation.
+
+The model is deliberately simple but reproduces the behaviour the MPPT
+controller cares about:
+
+* :class:`PvPanel` is an ideal single-diode module.  Photo current scales
+  with irradiance, so the P-V curve has a single maximum whose position
+  moves with the sun.  With partial shading (one factor per bypass-diode
+  group) the curve gets several local maxima.
+* :class:`BuckConverter` is an ideal CCM buck with a constant efficiency.
+  The battery clamps the output, so the duty sets the panel voltage to
+  ``V_bat / D``.  Below ``V_bat / Voc`` no current flows.
+* :class:`Battery` is an open-circuit voltage that rises with state of
+  charge plus an internal resistance.
+
+:class:`Plant` ties the three together and integrates energy and state of
+charge lazily whenever simulated time moves, so the cost of the model
+does not depend on how often the firmware samples it.
+
+Irradiance is supplied as a callable ``profile(t_s) -> G`` where ``t_s``
+is the time of day in seconds and ``G`` is irradiance normalised to
+1000 W/m^2.  A few ready-made profiles and panel types live at the
+bottom of this file.
+"""
+
+import math
+import random
+
+# 熱電圧 kT/q (25 ℃)
+_VT_25C = 0.025693
+
+
+class PvPanel:
+    """Single-diode PV module without series/shunt resistance.
+
+    The cells are split into ``substrings`` groups, each with its own
+    bypass diode.  While ``shading`` is ``None`` every group sees the
+    same irradiance and the closed-form single-diode equation is used.
+    Setting ``shading`` to one factor per group (e.g. ``(1.0, 1.0,
+    0.3)``) models partial shading: shaded groups are bypassed at high
+    current, which gives the P-V curve several local maxima.
+
+    Args:
+        isc: Short-circuit current at G = 1 [A].
+        voc: Open-circuit voltage at G = 1 [V].
+        cells: Number of series cells.
+        ideality: Diode ideality factor.
+        substrings: Number of bypass-diode groups.
+        shading: Per-group irradiance factors, or ``None``.
+    """
+
+    # バイパスダイオードの順方向電圧 [V]
+    BYPASS_V = 0.5
+
+    def __init__(self, isc=5.5, voc=21.6, cells=36, ideality=1.3, substrings=3, shading=None):
+        self.isc = isc
+        self.voc_stc = voc
+        self.cells = cells
+        self.ideality = ideality
+        self.substrings = substrings
+        self.shading = shading
+        self._a = cells * ideality * _VT_25C
+        self._i0 = isc / (math.exp(voc / self._a) - 1.0)
+
+    def _uniform(self) -> bool:
+        sh = self.shading
+        if sh is None:
+            return True
+        for f in sh:
+            if f != sh[0]:
+                return False
+        return True
+
+    def _factor(self) -> float:
+        return 1.0 if self.shading is None else self.shading[0]
+
+    def _string_voltage(self, i: float, irr: float) -> float:
+        """Terminal voltage at current ``i`` with per-group bypass diodes."""
+        a = self._a / self.substrings
+        v = 0.0
+        for f in self.shading:
+            iph = self.isc * irr * f
+            if i < iph:
+                v += a * math.log((iph - i) / self._i0 + 1.0)
+            else:
+                v -= self.BYPASS_V
+        return v
+
+    def current(self, v: float, irr: float) -> float:
+        """Panel current at terminal voltage ``v`` and irradiance ``irr``."""
+        if irr <= 0.0:
+            return 0.0
+        if self._uniform():
+            i = self.isc * irr * self._factor() - self._i0 * (math.exp(v / self._a) - 1.0)
+            return i if i > 0.0 else 0.0
+        if v >= self._string_voltage(0.0, irr):
+            return 0.0
+        # V(I) は単調減少なので二分法
+        lo = 0.0
+        hi = self.isc * irr * max(self.shading)
+        for _ in range(48):
+            mid = 0.5 * (lo + hi)
+            if self._string_voltage(mid, irr) > v:
+                lo = mid
+            else:
+                hi = mid
+        return 0.5 * (lo + hi)
+
+    def voc(self, irr: float) -> float:
+        """Open-circuit voltage at irradiance ``irr``."""
+        if irr <= 0.0:
+            return 0.0
+        if self._uniform():
+            return self._a * math.log(self.isc * irr * self._factor() / self._i0 + 1.0)
+        return max(0.0, self._string_voltage(0.0, irr))
+
+    def mpp(self, irr: float):
+        """Return ``(v, i, p)`` at the maximum power point.
+
+        A coarse scan is refined with a golden-section search around the
+        best coarse point, which also copes with multi-peak curves.
+        """
+        voc = self.voc(irr)
+        if voc <= 0.0:
+            return 0.0, 0.0, 0.0
+        n = 64
+        best_v = 0.0
+        best_p = -1.0
+        for k in range(n + 1):
+            v = voc * k / n
+            p = v * self.current(v, irr)
+            if p > best_p:
+                best_p = p
+                best_v = v
+        lo = max(0.0, best_v - voc / n)
+        hi = min(voc, best_v + voc / n)
+        g = 0.6180339887498949
+        for _ in range(40):
+            a = hi - g * (hi - lo)
+            b = lo + g * (hi - lo)
+            if a * self.current(a, irr) > b * self.current(b, irr):
+                hi = b
+            else:
+                lo = a
+        v = (lo + hi) * 0.5
+        i = self.current(v, irr)
+        return v, i, v * i
+
+
+class Battery:
+    """Lead-acid style battery: linear OCV(SoC) plus internal resistance.
+
+    Args:
+        capacity_ah: Capacity [Ah].
+        soc: Initial state of charge (0..1).
+        v_empty: Open-circuit voltage at SoC 0 [V].
+        v_full: Open-circuit voltage at SoC 1 [V].
+        r_int: Internal resistance [ohm].
+    """
+
+    def __init__(self, capacity_ah=20.0, soc=0.5, v_empty=11.8, v_full=12.9, r_int=0.05):
+        self.capacity_ah = capacity_ah
+        self.soc = soc
+        self.v_empty = v_empty
+        self.v_full = v_full
+        self.r_int = r_int
+
+    def ocv(self) -> float:
+        return self.v_empty + (self.v_full - self.v_empty) * self.soc
+
+    def terminal_voltage(self, p_in: float) -> float:
+        """Terminal voltage while absorbing ``p_in`` watts.
+
+        Solves ``V = OCV + R * P / V`` for V.
+        """
+        ocv = self.ocv()
+        return 0.5 * (ocv + math.sqrt(ocv * ocv + 4.0 * self.r_int * p_in))
+
+    def charge(self, current_a: float, dt_s: float) -> None:
+        soc = self.soc + current_a * dt_s / 3600.0 / self.capacity_ah
+        self.soc = 0.0 if soc < 0.0 else 1.0 if soc > 1.0 else soc
+
+
+class BuckConverter:
+    """Ideal continuous-conduction buck converter.
+
+    Args:
+        efficiency: Output power / input power.
+    """
+
+    def __init__(self, efficiency=0.95):
+        self.efficiency = efficiency
+
+    def panel_voltage(self, duty: float, v_out: float) -> float:
+        """Input (panel) voltage the converter imposes at ``duty``."""
+        if duty <= 0.0:
+            return math.inf
+        return v_out / duty
+
+
+class Plant:
+    """Panel + converter + battery driven by the applied PWM duty.
+
+    Args:
+        panel: :class:`PvPanel` instance.
+        battery: :class:`Battery` instance.
+        converter: :class:`BuckConverter` instance.
+        irradiance: Callable ``profile(t_s) -> G``.
+        start_s: Time of day at simulation time 0 [s].
+        settle_s: Operating point is recomputed at most this often
+            while the duty is unchanged.
+        shading: Per-substring shading factors, or a callable
+            ``shading(t_s) -> factors`` for shading that moves during
+            the day.  ``None`` leaves ``panel.shading`` alone.
+    """
+
+    def __init__(self, panel=None, battery=None, converter=None,
+                 irradiance=None, start_s=12 * 3600.0, settle_s=0.01, shading=None):
+        self.panel = panel if panel is not None else PvPanel()
+        self.battery = battery if battery is not None else Battery()
+        self.converter = converter if converter is not None else BuckConverter()
+        self.irradiance = irradiance if irradiance is not None else constant(1.0)
+        self.start_s = start_s
+        self.settle_s = settle_s
+        self.shading = shading
+
+        self.duty_u16 = 0
+        self.irr = 0.0
+        self.pv_v = 0.0
+        self.pv_i = 0.0
+        self.bat_v = self.battery.ocv()
+        self.bat_i = 0.0
+
+        # 積算値
+        self.energy_in_wh = 0.0
+        self.energy_mpp_wh = 0.0
+        self.elapsed_s = 0.0
+
+        self._t_s = 0.0
+        self._t_solved = -math.inf
+        self._mpp_p = 0.0
+        self._mpp_cache = {}
+        self._solve()
+
+    @property
+    def p_in(self) -> float:
+        return self.pv_v * self.pv_i
+
+    @property
+    def mpp_power(self) -> float:
+        """Available power at the true MPP for the current irradiance."""
+        return self._mpp_p
+
+    def set_duty(self, t_s: float, duty_u16: int) -> None:
+        """Apply a new duty at simulated time ``t_s``."""
+        self.update(t_s)
+        if duty_u16 != self.duty_u16:
+            self.duty_u16 = duty_u16
+            self._solve()
+
+    def poll(self, t_s: float) -> None:
+        """:meth:`update` if the operating point is due to be re-solved.
+
+        Between two solves the panel power and battery current are
+        constant, so integrating the whole span at the next
+        :meth:`update` gives the same energy as integrating it in small
+        pieces.  Call :meth:`update` before reading the integrals.
+        """
+        if t_s - self._t_solved >= self.settle_s:
+            self.update(t_s)
+
+    def update(self, t_s: float) -> None:
+        """Integrate energy/charge up to ``t_s`` and refresh the operating point."""
+        dt = t_s - self._t_s
+        if dt <= 0.0:
+            return
+        self.energy_in_wh += self.p_in * dt / 3600.0
+        self.energy_mpp_wh += self._mpp_p * dt / 3600.0
+        self.battery.charge(self.bat_i, dt)
+        self.elapsed_s += dt
+        self._t_s = t_s
+        if t_s - self._t_solved >= self.settle_s:
+            self._solve()
+
+    def _solve(self) -> None:
+        t = self._t_s
+        self._t_solved = t
+        irr = self.irradiance(self.start_s + t)
+        if irr < 0.0:
+            irr = 0.0
+        self.irr = irr
+        if self.shading is not None:
+            sh = self.shading(self.start_s + t) if callable(self.shading) else self.shading
+            self.panel.shading = tuple(sh)
+
+        key = (round(irr, 3), self.panel.shading)
+        mpp = self._mpp_cache.get(key)
+        if mpp is None:
+            if len(self._mpp_cache) > 4096:
+                self._mpp_cache.clear()
+            mpp = self.panel.mpp(key[0])[2]
+            self._mpp_cache[key] = mpp
+        self._mpp_p = mpp
+
+        duty = self.duty_u16 / 65535.0
+        voc = self.panel.voc(irr)
+        eff = self.converter.efficiency
+        bat_v = self.bat_v
+        v = voc
+        i = 0.0
+        # 電池電圧と動作点が互いに依存するので数回だけ固定点反復する
+        for _ in range(3):
+            v = self.converter.panel_voltage(duty, bat_v)
+            if v >= voc:
+                v = voc
+                i = 0.0
+            else:
+                i = self.panel.current(v, irr)
+            bat_v = self.battery.terminal_voltage(eff * v * i)
+        self.pv_v = v
+        self.pv_i = i
+        self.bat_v = bat_v
+        self.bat_i = eff * v * i / bat_v
+
+
+# ---------------------------------------------------------------------------
+# Irradiance profiles
+
+
+def constant(level: float):
+    """Fixed irradiance."""
+    def profile(t_s):
+        return level
+    return profile
+
+
+def clear_sky(sunrise_h=6.0, sunset_h=18.0, peak=1.0):
+    """Half-sine day between ``sunrise_h`` and ``sunset_h``."""
+    rise = sunrise_h * 3600.0
+    span = (sunset_h - sunrise_h) * 3600.0
+
+    def profile(t_s):
+        x = ((t_s % 86400.0) - rise) / span
+        if x <= 0.0 or x >= 1.0:
+            return 0.0
+        return peak * math.sin(math.pi * x)
+    return profile
+
+
+def cloudy(base=None, seed=0, depth=0.7, mean_gap_s=120.0, mean_len_s=40.0):
+    """Overlay passing clouds on ``base``.
+
+    Clouds arrive at random (exponential gaps) and attenuate the base
+    profile by up to ``depth`` with soft edges.  The sequence is
+    deterministic for a given ``seed``.
+    """
+    if base is None:
+        base = clear_sky()
+    rng = random.Random(seed)
+    events = []
+    horizon = [0.0]
+
+    def extend(t_s):
+        while horizon[0] <= t_s:
+            start = horizon[0] + rng.expovariate(1.0 / mean_gap_s)
+            length = rng.expovariate(1.0 / mean_len_s) + 5.0
+            events.append((start, start + length, depth * rng.uniform(0.4, 1.0)))
+            horizon[0] = start + length
+
+    def profile(t_s):
+        extend(t_s)
+        g = base(t_s)
+        for start, end, d in reversed(events):
+            if end < t_s:
+                break
+            if start <= t_s:
+                edge = min(t_s - start, end - t_s, 5.0) / 5.0
+                g *= 1.0 - d * edge
+                break
+        return g
+    return profile
+
+
+# パネルの型
+PANELS = {
+    "36cell": dict(isc=5.5, voc=21.6, cells=36, substrings=3),
+    "60cell": dict(isc=9.0, voc=37.5, cells=60, substrings=3),
+}
+
+
+PROFILES = {
+    "constant": lambda: constant(1.0),
+    "clear": clear_sky,
+    "cloudy": cloudy,
+}
@@ -0,0 +1,400 @@
+"""Replay recorded measurement traces through the control chain.
+
+Feeds recorded panel voltage, panel current and battery voltage back
+into the unmodified ``read_sensor_data -> safety_check ->
+mppt_control_step -> pwm_control`` chain (``main.control_task`` /
+``main.mppt_task``) on the virtual clock, so a change to ``mppt_ctrl``
+or ``safety_ctrl`` can be checked against field data without a board or
+the weather.  Two modes:
+
+``raw``
+    Open loop.  :class:`ReplayBoard` answers every ``ADC.read_u16``
+    with the count that converts back to the recorded value, whatever
+    duty the controller applies.  One control cycle runs per trace row
+    (or every ``step_ms`` with the row held), MPPT on its own period.
+    This is the fast mode for safety and decision regressions: a day
+    of 1 s data runs in seconds.  The energy is the recorded one; the
+    summary also gives the part of it that fell in time the controller
+    spent in "shutdown".
+``plant``
+    Closed loop.  The irradiance is reconstructed from each recorded
+    (V, I) pair with the single-diode panel model (or taken from an
+    ``irradiance`` column) and drives the simulated plant, so the
+    controller's duty changes the measurements again.  This gives
+    tracking efficiency and time at the MPP, at the normal simulator
+    speed.
+
+Traces are CSV files or ``data_log`` directories.  CSV needs a time
+column (``t_s``, ``time_s`` or ``uptime_s``) and, for every channel in
+``config.SENSE_CHANNELS``, either its name (``p_voltage_mv``, in
+mV/mA) or the name without the unit (``p_voltage``, in V/A), which is
+what ``host/log_decode.py --csv`` writes.  A ``boot`` column, when
+present, keeps the time monotonic across reboots.
+
+The fast timer trip, the dual-core sampler and the data logger are
+switched off during a replay; use ``--set`` to change any other
+``config`` value::
+
+    python -m host.replay field/*.csv --set MPPT_STRATEGY="'inc_cond'"
+    python -m host.replay log/ --mode plant
+"""
+
+import argparse
+import bisect
+import csv
+import math
+import os
+
+import host
+from host import pv_model
+from host.board import Board
+from host.run import apply_overrides, parse_overrides, restore_overrides
+
+# リプレイ中は常に切る設定
+_FORCED = {"TRIP_ENABLE": False, "SENSE_DUAL_CORE": False, "LOG_ENABLE": False}
+# この割合以上の電力なら MPP にいるとみなす
+MPP_BAND = 0.98
+_TIME_COLUMNS = ("t_s", "time_s", "uptime_s")
+
+
+def _channel_names():
+    import config
+    return [spec[0] for spec in config.SENSE_CHANNELS]
+
+
+class Trace:
+    """Recorded measurements: ``values[channel][k]`` in mV / mA at ``t_s[k]``.
+
+    Args:
+        name: Label used in the summaries.
+        t_s: Increasing sample times [s].
+        values: Channel name (``config.SENSE_CHANNELS``) → list of values.
+        irradiance: Optional list of irradiance values for plant mode.
+    """
+
+    def __init__(self, name, t_s, values, irradiance=None):
+        if not t_s:
+            raise ValueError("Trace %s: no samples" % name)
+        self.name = name
+        self.t_s = t_s
+        self.values = values
+        self.irradiance = irradiance
+
+    def __len__(self):
+        return len(self.t_s)
+
+    @property
+    def duration_s(self) -> float:
+        return self.t_s[-1] - self.t_s[0]
+
+    def index(self, t_s: float) -> int:
+        """Row in effect at ``t_s`` (rows are held until the next one)."""
+        k = bisect.bisect_right(self.t_s, t_s) - 1
+        return k if k > 0 else 0
+
+    def power_w(self, k: int) -> float:
+        v = self.values.get("p_voltage_mv")
+        i = self.values.get("p_current_ma")
+        if v is None or i is None:
+            return 0.0
+        return v[k] * i[k] / 1e6
+
+    def irradiance_profile(self, panel):
+        """``profile(t_s)`` for :class:`host.Plant`, held between rows."""
+        irr = self.irradiance
+        if irr is None:
+            irr = [estimate_irradiance(panel, self.values["p_voltage_mv"][k] / 1000,
+                                       self.values["p_current_ma"][k] / 1000)
+                   for k in range(len(self))]
+        t0 = self.t_s[0]
+
+        def profile(t_s):
+            return irr[self.index(t0 + t_s)]
+        return profile
+
+
+def estimate_irradiance(panel, v: float, i: float) -> float:
+    """Irradiance at which the (unshaded) panel delivers ``i`` at ``v``."""
+    if v <= 0.0 and i <= 0.0:
+        return 0.0
+    # I = Isc * G - I0 * (exp(V / a) - 1) を G について解く
+    g = (i + panel._i0 * (math.exp(v / panel._a) - 1.0)) / panel.isc
+    return g if g > 0.0 else 0.0
+
+
+def load_csv(path) -> Trace:
+    names = _channel_names()
+    t_s = []
+    values = {n: [] for n in names}
+    irradiance = []
+    offset = 0.0
+    boot = None
+    last = None
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        fields = reader.fieldnames or ()
+        tcol = next((c for c in _TIME_COLUMNS if c in fields), None)
+        if tcol is None:
+            raise ValueError("%s: no time column (%s)" % (path, ", ".join(_TIME_COLUMNS)))
+        cols = {}
+        for n in names:
+            if n in fields:
+                cols[n] = (n, 1.0)
+            elif n.rsplit("_", 1)[0] in fields:
+                cols[n] = (n.rsplit("_", 1)[0], 1000.0)
+            else:
+                raise ValueError("%s: no column for %s" % (path, n))
+        has_irr = "irradiance" in fields
+        for row in reader:
+            t = float(row[tcol])
+            if "boot" in row and row["boot"] != boot:
+                # 再起動で時刻が 0 に戻るので前のブートの続きにする
+                if last is not None:
+                    offset = last + 1.0 - t
+                boot = row["boot"]
+            t += offset
+            if last is not None and t <= last:
+                continue
+            last = t
+            t_s.append(t)
+            for n, (col, scale) in cols.items():
+                values[n].append(int(round(float(row[col]) * scale)))
+            if has_irr:
+                irradiance.append(float(row["irradiance"]))
+    return Trace(os.path.basename(path), t_s, values, irradiance if has_irr else None)
+
+
+def load_log(directory) -> Trace:
+    """Trace from a directory of ``data_log`` files."""
+    import data_log
+    names = _channel_names()
+    t_s = []
+    values = {n: [] for n in names}
+    offset = 0.0
+    boot = None
+    last = None
+    for _, b, rec in data_log.iter_records(directory):
+        t = float(rec[0])
+        if b != boot:
+            if last is not None:
+                offset = last + 1.0 - t
+            boot = b
+        t += offset
+        if last is not None and t <= last:
+            continue
+        last = t
+        t_s.append(t)
+        row = dict(zip(data_log.FIELDS, rec))
+        for n in names:
+            values[n].append(row.get(n, 0))
+    return Trace(os.path.basename(os.path.normpath(directory)), t_s, values)
+
+
+def load(path) -> Trace:
+    return load_log(path) if os.path.isdir(path) else load_csv(path)
+
+
+class ReplayBoard(Board):
+    """Board whose ADC returns the counts of the current trace row.
+
+    The counts are 16-bit values that the firmware's channel conversion
+    maps back to the recorded mV / mA, without 12-bit quantisation or
+    noise, so the trimmed mean reproduces the recording.  PWM writes
+    are only stored; there is no plant in the loop.
+    """
+
+    def __init__(self, trace, **kw):
+        kw.setdefault("adc_read_us", 0)
+        super().__init__(**kw)
+        import config
+        self.trace = trace
+        self._specs = [(spec[0], spec[1], spec[5], spec[6]) for spec in config.SENSE_CHANNELS]
+        self._raw = {}
+        self.row = -1
+        self.show(0)
+
+    def show(self, k: int) -> None:
+        if k == self.row:
+            return
+        self.row = k
+        for name, pin, scale, offset in self._specs:
+            column = self.trace.values.get(name)
+            value = column[k] if column is not None else 0
+            raw = int(round((value + offset) / scale)) if scale > 0 else 0
+            self._raw[pin] = 0 if raw < 0 else 65535 if raw > 65535 else raw
+
+    def adc_read_u16(self, gpio):
+        return self._raw.get(gpio, 0)
+
+    def set_pwm_duty(self, pin, duty_u16):
+        self.pwm_duty[pin] = duty_u16
+
+    def sync_plant(self):
+        pass
+
+
+def _plant_board(trace, panel, seed):
+    pv = host.PvPanel(**pv_model.PANELS[panel])
+    bat = host.Battery()
+    bv = trace.values["b_voltage_mv"][0] / 1000
+    bat.soc = min(1.0, max(0.0, (bv - bat.v_empty) / (bat.v_full - bat.v_empty)))
+    plant = host.Plant(panel=pv, battery=bat, irradiance=trace.irradiance_profile(pv), start_s=0.0)
+    return Board(plant=plant, seed=seed)
+
+
+def replay(trace, mode="raw", overrides=None, step_ms=None, panel="36cell", seed=0) -> dict:
+    """Run ``trace`` through the control chain and return a summary dict."""
+    import config
+    settings = dict(_FORCED)
+    if overrides:
+        settings.update(overrides)
+    saved = apply_overrides(settings)
+    try:
+        if mode == "raw":
+            board = ReplayBoard(trace, seed=seed)
+        elif mode == "plant":
+            board = _plant_board(trace, panel, seed)
+            if step_ms is None:
+                step_ms = config.SCHED_CONTROL_MS
+        else:
+            raise ValueError("unknown replay mode " + mode)
+        return _run(trace, board, mode, step_ms)
+    finally:
+        restore_overrides(saved)
+        host.uninstall()
+
+
+def _times(trace, step_ms):
+    """Trace-relative times of the control cycles."""
+    if step_ms is None:
+        t0 = trace.t_s[0]
+        for t in trace.t_s:
+            yield t - t0
+        return
+    n = int(trace.duration_s * 1000 // step_ms)
+    for k in range(n + 1):
+        yield k * step_ms / 1000
+
+
+def _run(trace, board, mode, step_ms) -> dict:
+    real_time = host.real_time()
+    host.install(board)
+    import config
+    import main
+    from context import factory_instance
+    from sequence_first import handle_startup_sequence
+
+    wall0 = real_time.perf_counter()
+    ctx = factory_instance.first_create()
+    started = handle_startup_sequence(ctx)
+    clock = board.clock
+    start_us = clock.now_us()
+    safety = ctx.state.safety
+    raw = mode == "raw"
+
+    s = {
+        "trace": trace.name, "mode": mode, "started": started, "cycles": 0,
+        "sim_s": 0.0, "energy_wh": 0.0, "energy_mpp_wh": None, "tracking_eff": None,
+        "mpp_time": None, "shutdown_lost_wh": 0.0, "warning_s": 0.0, "shutdown_s": 0.0,
+        "trips": 0, "duty_u16": 0,
+    }
+    if started:
+        t0 = trace.t_s[0]
+        mppt_period = config.SCHED_MPPT_MS / 1000
+        mppt_due = 0.0
+        prev_t = None
+        prev_status = safety.status
+        prev_power = 0.0
+        at_mpp = 0.0
+        daylight = 0.0
+        for t in _times(trace, step_ms):
+            if prev_t is not None:
+                dt = t - prev_t
+                if prev_status == "warning":
+                    s["warning_s"] += dt
+                elif prev_status == "shutdown":
+                    s["shutdown_s"] += dt
+                if raw:
+                    s["energy_wh"] += prev_power * dt / 3600
+                    if prev_status == "shutdown":
+                        s["shutdown_lost_wh"] += prev_power * dt / 3600
+            target = start_us + int(t * 1_000_000)
+            if target > clock.now_us():
+                clock.advance_us(target - clock.now_us())
+            if raw:
+                board.show(trace.index(t0 + t))
+            main.control_task(ctx)
+            if t >= mppt_due:
+                main.mppt_task(ctx)
+                mppt_due += mppt_period
+                if mppt_due <= t:
+                    mppt_due = t + mppt_period
+            if safety.status == "shutdown" and prev_status != "shutdown":
+                s["trips"] += 1
+            prev_status = safety.status
+            if raw:
+                prev_power = trace.power_w(board.row)
+            else:
+                plant = board.plant
+                plant.update(clock.now_s())
+                if prev_t is not None and plant.mpp_power > 0.0:
+                    daylight += t - prev_t
+                    if plant.p_in >= MPP_BAND * plant.mpp_power:
+                        at_mpp += t - prev_t
+            prev_t = t
+            s["cycles"] += 1
+        s["sim_s"] = prev_t or 0.0
+        if not raw:
+            plant = board.plant
+            s["energy_wh"] = plant.energy_in_wh
+            s["energy_mpp_wh"] = plant.energy_mpp_wh
+            s["tracking_eff"] = (plant.energy_in_wh / plant.energy_mpp_wh
+                                 if plant.energy_mpp_wh > 0 else 0.0)
+            s["mpp_time"] = at_mpp / daylight if daylight > 0 else 0.0
+    s["duty_u16"] = ctx.state.pwms.applied_duty_u16
+    s["wall_s"] = real_time.perf_counter() - wall0
+    return s
+
+
+HEADER = "%-20s %5s %8s %7s %9s %7s %7s %6s %9s %5s" % (
+    "trace", "mode", "sim [h]", "x", "E [Wh]", "track", "at MPP", "warn", "shut [s]", "trips")
+
+
+def format_row(s) -> str:
+    if not s["started"]:
+        return "%-20s %5s  startup failed (shutdown before the ramp)" % (s["trace"][:20], s["mode"])
+
+    def pct(x):
+        return "%6.1f%%" % (100 * x) if x is not None else "    n/a"
+    speed = s["sim_s"] / s["wall_s"] if s["wall_s"] > 0 else float("inf")
+    return "%-20s %5s %8.2f %7.0f %9.3f %7s %7s %6.0f %9.0f %5d" % (
+        s["trace"][:20], s["mode"], s["sim_s"] / 3600, speed, s["energy_wh"],
+        pct(s["tracking_eff"]), pct(s["mpp_time"]), s["warning_s"], s["shutdown_s"], s["trips"])
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("traces", nargs="+", help="CSV files or data_log directories")
+    ap.add_argument("--mode", choices=("raw", "plant"), default="raw")
+    ap.add_argument("--step-ms", type=float, default=None,
+                    help="control period (raw default: one cycle per trace row)")
+    ap.add_argument("--panel", choices=sorted(pv_model.PANELS), default="36cell",
+                    help="panel model for --mode plant")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                    help="override a config value for the replay")
+    args = ap.parse_args(argv)
+
+    overrides = parse_overrides(args.set)
+    print(HEADER)
+    lost = 0.0
+    for path in args.traces:
+        s = replay(load(path), args.mode, overrides, args.step_ms, args.panel, args.seed)
+        lost += s["shutdown_lost_wh"]
+        print(format_row(s))
+    if args.mode == "raw" and lost:
+        print("recorded energy in shutdown time: %.3f Wh" % lost)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Run the unmodified firmware against the simulated board.
+
+Example::
+
+    python -m host.run --hours 4 --profile cloudy --start 10
+
+prints how much energy the controller harvested compared with what was
+available at the true maximum power point, plus the final LCD contents.
+
+Speed: sleeps cost nothing, but the firmware and the simulated
+peripherals are ordinary Python.  Every ADC conversion is a call into
+:class:`host.Board` (plant, noise, clock), about 2 700 per simulated
+second with the default sample counts, and they take most of the wall
+time.  ``python -m host.run --hours 0.2`` runs at about x100, some 35 s
+of wall time per simulated hour on a desktop CPU.  The count follows
+the scheduler's control period: the sensor task runs every
+``config.SCHED_CONTROL_MS`` (50 ms), six times as often as the old
+300 ms loop, and ``--set SCHED_CONTROL_MS=300`` runs at about x570.  The timer trip
+(``config.TRIP_ENABLE``) adds 2 000 conversions per second (about x45),
+and the dual-core sampler runs at about real time (see
+``host/vclock.py``).  For parameter studies over whole days use
+``host/batch_sim.py``.
+
+With the default ``MPPT_STRATEGY = "po_fixed"`` the clear-sky run
+harvests 0 %.  The board starts at ``MPPT_MIN_DUTY``, and the modelled
+buck converter conducts only above about ``V_bat / V_oc`` (0.57 with a
+12.4 V battery on a 21.6 V panel).  Below that the panel delivers no
+power, so the original hill climbing sees no power change and only
+dithers around its start.  ``po_seek``, ``po_variable`` and
+``inc_cond`` first walk the duty up into the conducting range (98.5 %
+on the same run with ``po_seek``).
+"""
+
+import argparse
+import ast
+
+import host
+from host import pv_model, vloop
+
+
+def build_board(profile="clear", start_h=12.0, seed=0, soc=0.5, panel="36cell",
+                shading=None, **board_kw):
+    """Board with the named irradiance profile starting at ``start_h`` o'clock.
+
+    ``panel`` names an entry of ``pv_model.PANELS``; ``shading`` gives
+    one irradiance factor per bypass-diode group.
+    """
+    irradiance = pv_model.PROFILES[profile]()
+    plant = host.Plant(panel=host.PvPanel(**pv_model.PANELS[panel]),
+                       irradiance=irradiance, battery=host.Battery(soc=soc),
+                       start_s=start_h * 3600.0, shading=shading)
+    return host.Board(plant=plant, seed=seed, **board_kw)
+
+
+def simulate(board, seconds: float, entry=None) -> dict:
+    """Run ``entry`` (default ``main.main``) for ``seconds`` of simulated time.
+
+    ``entry="async"`` runs ``main_async`` on a virtual-time event loop.
+
+    Returns:
+        Summary dictionary (energy, tracking efficiency, timing).
+    """
+    real_time = host.real_time()
+    host.install(board)
+    if entry is None:
+        import main
+        entry = main.main
+    elif entry == "async":
+        import main_async
+
+        def entry():
+            vloop.run(main_async.start(), board.clock)
+    board.clock.run_for(seconds)
+    wall0 = real_time.perf_counter()
+    try:
+        entry()
+    except host.SimulationEnd:
+        pass
+    wall = real_time.perf_counter() - wall0
+    board.sync_plant()
+    return summarize(board, wall)
+
+
+def summarize(board, wall_s: float) -> dict:
+    plant = board.plant
+    sim_s = board.clock.now_s()
+    mpp_wh = plant.energy_mpp_wh
+    return {
+        "sim_s": sim_s,
+        "wall_s": wall_s,
+        "speedup": sim_s / wall_s if wall_s > 0 else float("inf"),
+        "energy_wh": plant.energy_in_wh,
+        "energy_mpp_wh": mpp_wh,
+        "tracking_eff": plant.energy_in_wh / mpp_wh if mpp_wh > 0 else 0.0,
+        "soc": plant.battery.soc,
+        "duty_u16": plant.duty_u16,
+        "adc_reads": board.adc_reads,
+        "i2c_bytes": board.i2c_bytes,
+        "lcd": (board.lcd.text(0), board.lcd.text(1)),
+    }
+
+
+def format_summary(s: dict) -> str:
+    lines = [
+        "simulated  : %.1f s in %.2f s wall (x%.0f)" % (s["sim_s"], s["wall_s"], s["speedup"]),
+        "energy     : %.3f Wh of %.3f Wh available (%.1f %%)"
+        % (s["energy_wh"], s["energy_mpp_wh"], 100.0 * s["tracking_eff"]),
+        "battery SoC: %.3f" % s["soc"],
+        "final duty : %d" % s["duty_u16"],
+        "ADC reads  : %d, I2C bytes: %d" % (s["adc_reads"], s["i2c_bytes"]),
+        "LCD        : |%s|" % s["lcd"][0],
+        "             |%s|" % s["lcd"][1],
+    ]
+    return "\n".join(lines)
+
+
+def parse_overrides(items) -> dict:
+    """``["NAME=VALUE", ...]`` (``--set`` arguments) → ``{NAME: value}``."""
+    out = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        out[name.strip()] = ast.literal_eval(value.strip())
+    return out
+
+
+# 上書き前に無かった名前の印
+_MISSING = object()
+
+
+def apply_overrides(settings) -> dict:
+    """Set ``settings`` (``{NAME: value}``) on ``config`` and re-derive the rest.
+
+    ``config.derive`` works the converted values (``I_LIMIT_MA``,
+    ``SENSE_CHANNELS``, ...) out again from the new settings; a name
+    given directly in ``settings`` is kept as given.
+
+    Returns:
+        The previous values, for :func:`restore_overrides`.
+    """
+    import config
+    saved = {name: getattr(config, name, _MISSING) for name in settings}
+    for name, value in settings.items():
+        setattr(config, name, value)
+    config.derive(tuple(settings))
+    return saved
+
+
+def restore_overrides(saved) -> None:
+    """Undo :func:`apply_overrides`."""
+    import config
+    for name, value in saved.items():
+        if value is _MISSING:
+            delattr(config, name)
+        else:
+            setattr(config, name, value)
+    config.derive(tuple(saved))
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--hours", type=float, default=1.0, help="simulated duration")
+    ap.add_argument("--profile", choices=sorted(pv_model.PROFILES), default="clear")
+    ap.add_argument("--start", type=float, default=12.0, help="time of day at start [h]")
+    ap.add_argument("--soc", type=float, default=0.5, help="initial battery state of charge")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--panel", choices=sorted(pv_model.PANELS), default="36cell")
+    ap.add_argument("--shade", default=None, metavar="F,F,...",
+                    help="per-substring irradiance factors, e.g. 1,1,0.3")
+    ap.add_argument("--async", dest="use_async", action="store_true",
+                    help="run main_async instead of main")
+    ap.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                    help="override a config value, e.g. --set SENSE_DUAL_CORE=True")
+    args = ap.parse_args(argv)
+
+    apply_overrides(parse_overrides(args.set))
+
+    shading = None
+    if args.shade:
+        shading = tuple(float(x) for x in args.shade.split(","))
+    board = build_board(args.profile, args.start, args.seed, args.soc, args.panel, shading)
+    entry = "async" if args.use_async else None
+    print(format_summary(simulate(board, args.hours * 3600.0, entry)))
+
+
+if __name__ == "__main__":
+    main()
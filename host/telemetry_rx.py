@@ -0,0 +1,328 @@
+"""Receive the binary telemetry stream of ``telemetry.Telemetry``.
+
+Reads the USB serial port (or any file descriptor: a pty, a pipe),
+finds frames by sync bytes and CRC, and keeps the latest frames in a
+rolling NumPy buffer (:class:`Rolling`) and optionally a CSV file with
+the values in V / A / W.  Bytes that are not part of a valid frame
+(``print`` output, a frame cut short) are skipped and counted; gaps in
+the frame counter are counted as lost frames -- either dropped on the
+Pico because nobody was reading or lost on the way.
+
+Set ``config.TELEMETRY_MS`` (e.g. 50) on the Pico, then::
+
+    python -m host.telemetry_rx /dev/ttyACM0 --csv tele.csv
+
+Without hardware, ``--sim SECONDS`` runs the firmware on the simulated
+board with its ``sys.stdout`` on a pty and receives from the other end
+of it, with the same code path::
+
+    python -m host.telemetry_rx --sim 60 --set TELEMETRY_MS=50 --csv tele.csv
+"""
+
+import argparse
+import csv
+import os
+import select
+import sys
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # ホスト専用ツールなので実行時にだけ要求する
+    np = None
+
+import telemetry
+
+_TYPES = {"direction": "i1", "status": "u1", "trip_cause": "u1", "seq": "u1",
+          "ticks_ms": "u4", "p_power_mw": "u4"}
+# ticks_ms は 2^30 で回る
+_TICKS_PERIOD = 1 << 30
+
+
+class Decoder:
+    """Splits a byte stream into frames.
+
+    ``feed(data)`` returns the frames completed by ``data`` as tuples
+    ordered like ``telemetry.FIELDS`` plus the unwrapped time ``t_s``.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self.frames = 0
+        self.lost = 0
+        self.skipped = 0
+        self._seq = None
+        self._ticks = None
+        self._t_offset = 0
+
+    def feed(self, data) -> list:
+        buf = self._buf
+        buf += data
+        out = []
+        pos = 0
+        size = telemetry.FRAME_SIZE
+        while True:
+            j = buf.find(telemetry.SYNC, pos)
+            if j < 0:
+                # 末尾の 1 バイトは次の sync の前半かもしれない
+                keep = len(buf) - 1 if buf[-1:] == telemetry.SYNC[:1] else len(buf)
+                self.skipped += keep - pos
+                pos = keep
+                break
+            self.skipped += j - pos
+            pos = j
+            if len(buf) - j < size:
+                break
+            values = telemetry.check_frame(buf, j)
+            if values is None:
+                # sync に見えただけのバイトを捨てて探し直す
+                self.skipped += 1
+                pos = j + 1
+                continue
+            out.append(self._accept(values))
+            pos = j + size
+        del buf[:pos]
+        return out
+
+    def _accept(self, values) -> tuple:
+        seq, ticks = values[0], values[1]
+        if self._seq is not None:
+            self.lost += (seq - self._seq - 1) & 0xFF
+        self._seq = seq
+        if self._ticks is not None and ticks < self._ticks - _TICKS_PERIOD // 2:
+            self._t_offset += _TICKS_PERIOD
+        self._ticks = ticks
+        self.frames += 1
+        return tuple(values) + ((ticks + self._t_offset) / 1000,)
+
+
+def dtype():
+    fields = [(name, _TYPES.get(name, "u2")) for name in telemetry.FIELDS]
+    return np.dtype(fields + [("t_s", "f8")])
+
+
+class Rolling:
+    """The last ``capacity`` frames as a NumPy structured array."""
+
+    def __init__(self, capacity=10000):
+        if np is None:
+            raise SystemExit("telemetry_rx: NumPy is required (pip install numpy)")
+        self.data = np.zeros(capacity, dtype=dtype())
+        self.capacity = capacity
+        self.count = 0
+
+    def extend(self, frames) -> None:
+        if not frames:
+            return
+        rows = np.array(frames, dtype=self.data.dtype)
+        if len(rows) > self.capacity:
+            rows = rows[-self.capacity:]
+        start = self.count % self.capacity
+        first = min(len(rows), self.capacity - start)
+        self.data[start:start + first] = rows[:first]
+        self.data[:len(rows) - first] = rows[first:]
+        self.count += len(rows)
+
+    def view(self):
+        """Frames held, oldest first (a copy)."""
+        if self.count <= self.capacity:
+            return self.data[:self.count].copy()
+        start = self.count % self.capacity
+        return np.concatenate((self.data[start:], self.data[:start]))
+
+
+CSV_COLUMNS = ("t_s", "seq", "p_voltage", "p_current", "b_voltage", "p_power", "duty", "c_step",
+               "direction", "status", "trip_cause", "overcurrent", "overvoltage", "dropped",
+               "sensor_us", "safety_us", "mppt_us", "pwm_us", "lcd_us")
+_STATUS_NAMES = ("normal", "warning", "shutdown")
+
+
+def csv_row(frame) -> tuple:
+    f = dict(zip(telemetry.FIELDS + ("t_s",), frame))
+    return ("%.3f" % f["t_s"], f["seq"], f["p_voltage_mv"] / 1000, f["p_current_ma"] / 1000,
+            f["b_voltage_mv"] / 1000, f["p_power_mw"] / 1000, f["duty"], f["c_step"],
+            f["direction"], _STATUS_NAMES[f["status"]] if f["status"] < 3 else f["status"],
+            f["trip_cause"], f["overcurrent"], f["overvoltage"], f["dropped"],
+            f["sensor_us"], f["safety_us"], f["mppt_us"], f["pwm_us"], f["lcd_us"])
+
+
+def open_port(path) -> int:
+    """Open a serial device (raw mode) or any readable file; returns the fd."""
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOCTTY", 0))
+    if os.isatty(fd):
+        import tty
+        tty.setraw(fd)
+    return fd
+
+
+def receive(fd, decoder, rolling=None, writer=None, stop=None, seconds=None, report=None) -> None:
+    """Read ``fd`` until EOF, ``seconds`` or ``stop`` (a ``threading.Event``) is set."""
+    end = None if seconds is None else time.monotonic() + seconds
+    next_report = time.monotonic() + 1.0
+    while True:
+        if stop is not None and stop.is_set():
+            timeout = 0.0
+        else:
+            timeout = 0.1
+        ready, _, _ = select.select([fd], [], [], timeout)
+        if ready:
+            try:
+                data = os.read(fd, 4096)
+            except OSError:  # pty の相手が閉じた
+                data = b""
+            if not data:
+                return
+            frames = decoder.feed(data)
+            if rolling is not None:
+                rolling.extend(frames)
+            if writer is not None:
+                writer.writerows(csv_row(f) for f in frames)
+        elif stop is not None and stop.is_set():
+            return
+        now = time.monotonic()
+        if report is not None and now >= next_report:
+            report(decoder, rolling)
+            next_report = now + 1.0
+        if end is not None and now >= end:
+            return
+
+
+def status_line(decoder, rolling) -> str:
+    text = "frames %d, lost %d, skipped %d bytes" % (decoder.frames, decoder.lost, decoder.skipped)
+    if rolling is not None and rolling.count:
+        last = rolling.data[(rolling.count - 1) % rolling.capacity]
+        text += " | P %.1f V %.2f A duty %d %s" % (
+            last["p_voltage_mv"] / 1000, last["p_current_ma"] / 1000, last["duty"],
+            _STATUS_NAMES[min(int(last["status"]), 2)])
+    return text
+
+
+class _PtyStdout:
+    """``sys.stdout`` stand-in whose ``buffer`` is the non-blocking pty side."""
+
+    def __init__(self, raw):
+        self.buffer = raw
+
+    def write(self, text):
+        try:
+            return self.buffer.write(text.encode())
+        except OSError:
+            return 0
+
+    def flush(self):
+        pass
+
+
+def simulate(seconds, overrides=None, on_stream=None) -> dict:
+    """Run the firmware with its stdout on a pty; ``on_stream(fd)`` reads the other end.
+
+    ``on_stream`` runs in a thread and gets the master fd; it is joined
+    after the simulation.  Returns ``host.run.simulate``'s summary plus
+    the firmware's ``sent`` / ``dropped`` counters.
+    """
+    import fcntl
+    import pty
+    import tty
+
+    import host
+    from host import run
+
+    settings = {"TELEMETRY_MS": 50}
+    if overrides:
+        settings.update(overrides)
+    saved = run.apply_overrides(settings)
+
+    master, slave = pty.openpty()
+    # 行規約の改行変換などを切り、書けなければ待たずに EAGAIN にする
+    tty.setraw(slave)
+    fcntl.fcntl(slave, fcntl.F_SETFL, fcntl.fcntl(slave, fcntl.F_GETFL) | os.O_NONBLOCK)
+    raw = os.fdopen(slave, "wb", buffering=0)
+    stop = threading.Event()
+    reader = None
+    if on_stream is not None:
+        reader = threading.Thread(target=on_stream, args=(master, stop), daemon=True)
+        reader.start()
+    counters = {}
+    real_stdout = sys.stdout
+    sys.stdout = _PtyStdout(raw)
+    def entry():
+        import main as firmware_main
+        original = firmware_main.build_scheduler
+
+        def build_scheduler(ctx):
+            counters["sender"] = ctx.telemetry
+            return original(ctx)
+        firmware_main.build_scheduler = build_scheduler
+        firmware_main.main()
+
+    try:
+        summary = run.simulate(run.build_board(), seconds, entry)
+    finally:
+        sys.stdout = real_stdout
+        run.restore_overrides(saved)
+        host.uninstall()
+        stop.set()
+        if reader is not None:
+            reader.join()
+        raw.close()
+        os.close(master)
+    sender = counters.get("sender")
+    summary["sent"] = sender.sent if sender else 0
+    summary["dropped"] = sender.dropped if sender else 0
+    return summary
+
+
+def main(argv=None) -> None:
+    from host.run import parse_overrides
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("port", nargs="?", help="serial device, pty or file to read")
+    ap.add_argument("--sim", type=float, default=None, metavar="SECONDS",
+                    help="receive from the firmware running on the simulated board")
+    ap.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                    help="config override for --sim")
+    ap.add_argument("--seconds", type=float, default=None, help="stop after this long")
+    ap.add_argument("--capacity", type=int, default=10000, help="frames kept in memory")
+    ap.add_argument("--csv", default=None, help="append every frame to this file")
+    ap.add_argument("--npy", default=None, help="save the rolling buffer here at the end")
+    args = ap.parse_args(argv)
+    if (args.port is None) == (args.sim is None):
+        ap.error("give a port or --sim")
+
+    decoder = Decoder()
+    rolling = Rolling(args.capacity)
+    out = open(args.csv, "w", newline="") if args.csv else None
+    writer = None
+    if out:
+        writer = csv.writer(out)
+        writer.writerow(CSV_COLUMNS)
+
+    def report(dec, roll):
+        print(status_line(dec, roll), file=sys.stderr, flush=True)
+
+    try:
+        if args.sim is not None:
+            def on_stream(fd, stop):
+                receive(fd, decoder, rolling, writer, stop=stop)
+            s = simulate(args.sim, parse_overrides(args.set), on_stream)
+            print("firmware   : %d frames sent, %d dropped in %.0f s simulated (%.1f s wall)"
+                  % (s["sent"], s["dropped"], s["sim_s"], s["wall_s"]))
+        else:
+            fd = open_port(args.port)
+            try:
+                receive(fd, decoder, rolling, writer, seconds=args.seconds, report=report)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.close(fd)
+    finally:
+        if out:
+            out.close()
+    print("receiver   : " + status_line(decoder, rolling))
+    if args.npy:
+        np.save(args.npy, rolling.view())
+
+
+if __name__ == "__main__":
+    main()
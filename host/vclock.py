@@ -0,0 +1,250 @@
+"""Virtual clock and MicroPython-compatible ``time`` stand-in.
+
+The controller code only ever talks to ``time.sleep``/``sleep_ms``/
+``sleep_us`` and the ``ticks_*`` family.  On the host those calls are
+routed to a :class:`VirtualClock` which advances simulated time
+instantly instead of blocking.  What is left of the wall time is the
+firmware's own Python and the simulated peripherals (see
+``host/run.py`` for what that comes to).
+
+Peripherals in :mod:`host.machine` also advance the clock by their
+modelled cost (ADC conversion time, I2C bus time) so that the
+``ticks_us`` deltas seen by the firmware stay meaningful.
+
+Threads started through :mod:`host.mpthread` (the ``_thread`` stand-in)
+each keep their own position on the clock and run in lockstep with the
+main thread: a thread that gets ahead of the main thread waits for it,
+and the main thread does not move time forward until every thread has
+caught up.  Work on the second core therefore overlaps the main loop in
+simulated time just as it does on the RP2040.
+
+What this costs on the host is the second core's work, not the
+lockstep.  A worker that samples back to back
+(``config.SENSE_WORKER_PAUSE_US = 0``) turns every conversion it makes
+into a Python call, about 240 000 per simulated second against some
+2 700 for the single-core loop, so a dual-core simulation runs at
+roughly real time (x100 single-core); the lockstep waits are only about
+2 000 per simulated second.  A worker pause of 1000 us gives about x3.5.
+
+Periodic and one-shot callbacks (``machine.Timer``) are registered with
+:meth:`VirtualClock.add_timer`.  Whenever the main thread moves time
+forward past a timer's deadline, time stops at the deadline, the
+callback runs like an interrupt, and the time the callback spends
+(ADC reads, ...) is added on top.  Callbacks do not nest.
+
+Everything else (``time.time``, ``perf_counter``, ``monotonic``, ...) is
+delegated to CPython's real ``time`` module so that library code which
+happens to import ``time`` keeps working.
+"""
+
+import sys
+import threading
+import types
+
+# MicroPython の ticks_* は 2**30 で一周する
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD >> 1
+
+
+class SimulationEnd(Exception):
+    """Raised from the clock when the configured end time is reached."""
+
+
+class VirtualClock:
+    """Monotonic simulated time in microseconds.
+
+    Args:
+        start_us: Initial simulated time.
+        end_us: Optional end of the simulation.  Advancing past it
+            raises :class:`SimulationEnd`, which is how the otherwise
+            endless ``main.main()`` loop is stopped on the host.
+    """
+
+    def __init__(self, start_us: int = 0, end_us=None):
+        self._now_us = int(start_us)
+        self.end_us = end_us
+        self.ended = False
+        # 追加スレッドの ident → そのスレッドの現在時刻 [us]
+        self._threads = {}
+        # 起動したがまだ登録していないスレッドの数
+        self._starting = 0
+        self._cond = threading.Condition()
+        # key → [期限 us, 周期 us (0 なら 1 回だけ), コールバック]
+        self._timers = {}
+        self._in_irq = False
+
+    def now_us(self) -> int:
+        if self._threads:
+            t = self._threads.get(threading.get_ident())
+            if t is not None:
+                return t
+        return self._now_us
+
+    def now_s(self) -> float:
+        return self.now_us() / 1_000_000
+
+    def advance_us(self, us) -> None:
+        """Move simulated time forward by ``us`` microseconds."""
+        if us <= 0:
+            return
+        us = int(us)
+        if self._threads or self._starting:
+            ident = threading.get_ident()
+            t = self._threads.get(ident)
+            if t is not None:
+                self._advance_thread(ident, t + us)
+                return
+        if self._timers and not self._in_irq:
+            self._run_timers(self._now_us + us)
+        else:
+            self._step(us)
+
+    def _step(self, us: int) -> None:
+        if self._threads or self._starting:
+            self._advance_main(us)
+            return
+        self._now_us += us
+        if self.end_us is not None and self._now_us >= self.end_us:
+            self.ended = True
+            raise SimulationEnd(self._now_us)
+
+    def _run_timers(self, target: int) -> None:
+        timers = self._timers
+        while timers:
+            key = None
+            due = target + 1
+            for k, entry in timers.items():
+                if entry[0] < due:
+                    key = k
+                    due = entry[0]
+            if key is None:
+                break
+            if due > self._now_us:
+                self._step(due - self._now_us)
+            entry = timers[key]
+            if entry[1]:
+                entry[0] = due + entry[1]
+            else:
+                del timers[key]
+            before = self._now_us
+            self._in_irq = True
+            try:
+                entry[2](key)
+            finally:
+                self._in_irq = False
+            # 割り込み処理にかかった時間だけ呼び出し元の待ちが延びる
+            target += self._now_us - before
+        if target > self._now_us:
+            self._step(target - self._now_us)
+
+    def add_timer(self, key, first_us: int, period_us: int, callback) -> None:
+        """Call ``callback(key)`` ``first_us`` from now, then every ``period_us``.
+
+        ``period_us`` of 0 makes it one-shot.  Re-adding ``key`` replaces it.
+        """
+        self._timers[key] = [self._now_us + max(1, int(first_us)), int(period_us), callback]
+
+    def remove_timer(self, key) -> None:
+        self._timers.pop(key, None)
+
+    def _advance_main(self, us: int) -> None:
+        with self._cond:
+            self._now_us += us
+            if self.end_us is not None and self._now_us >= self.end_us:
+                self.ended = True
+                self._cond.notify_all()
+                raise SimulationEnd(self._now_us)
+            self._cond.notify_all()
+            # 追加スレッドが全員ここまで追いつくのを待つ
+            while self._starting or any(t < self._now_us for t in self._threads.values()):
+                self._cond.wait()
+
+    def _advance_thread(self, ident, t: int) -> None:
+        self._threads[ident] = t
+        if t <= self._now_us and not self.ended:
+            return
+        with self._cond:
+            self._cond.notify_all()
+            while self._now_us < t and not self.ended:
+                self._cond.wait()
+        if self.ended:
+            raise SimulationEnd(t)
+
+    def thread_starting(self) -> None:
+        """Announce a thread that will call :meth:`thread_enter` shortly."""
+        with self._cond:
+            self._starting += 1
+
+    def thread_enter(self) -> None:
+        """Give the calling thread its own position, starting at main's time."""
+        with self._cond:
+            self._starting -= 1
+            self._threads[threading.get_ident()] = self._now_us
+            self._cond.notify_all()
+
+    def thread_exit(self) -> None:
+        with self._cond:
+            self._threads.pop(threading.get_ident(), None)
+            self._cond.notify_all()
+
+    def run_for(self, seconds: float) -> None:
+        """Set the end of the simulation ``seconds`` from now."""
+        self.end_us = self._now_us + int(seconds * 1_000_000)
+
+
+def ticks_add(ticks: int, delta: int) -> int:
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(ticks1: int, ticks2: int) -> int:
+    return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+
+def make_time_module(clock: VirtualClock, real_time=None) -> types.ModuleType:
+    """Build a module object that can be placed in ``sys.modules["time"]``.
+
+    Args:
+        clock: Clock the sleep/ticks functions operate on.
+        real_time: CPython ``time`` module used for everything else.
+    """
+    if real_time is None:
+        real_time = sys.modules["time"]
+
+    mod = types.ModuleType("time")
+    mod.__doc__ = "MicroPython time stand-in driven by host.vclock.VirtualClock"
+
+    def sleep(seconds):
+        clock.advance_us(seconds * 1_000_000)
+
+    def sleep_ms(ms):
+        clock.advance_us(ms * 1000)
+
+    def sleep_us(us):
+        clock.advance_us(us)
+
+    def ticks_ms():
+        return (clock.now_us() // 1000) & TICKS_MAX
+
+    def ticks_us():
+        return clock.now_us() & TICKS_MAX
+
+    def ticks_cpu():
+        return clock.now_us() & TICKS_MAX
+
+    mod.sleep = sleep
+    mod.sleep_ms = sleep_ms
+    mod.sleep_us = sleep_us
+    mod.ticks_ms = ticks_ms
+    mod.ticks_us = ticks_us
+    mod.ticks_cpu = ticks_cpu
+    mod.ticks_add = ticks_add
+    mod.ticks_diff = ticks_diff
+    mod.clock = clock
+    mod.real_time = real_time
+
+    def __getattr__(name):
+        return getattr(real_time, name)
+
+    mod.__getattr__ = __getattr__
+    return mod
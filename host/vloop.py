@@ -0,0 +1,63 @@
+"""asyncio event loop that runs on a :class:`host.vclock.VirtualClock`.
+
+``loop.time()`` reads the virtual clock, and when the loop would block
+waiting for the next timer the selector advances the clock by the
+timeout instead of sleeping, so ``main_async`` runs as fast as the host
+allows and stays in step with the ``time.ticks_*`` the firmware sees.
+Blocking calls inside tasks (``time.sleep_us`` in the LCD driver, ADC
+reads) advance the same clock.
+"""
+
+import asyncio
+import math
+import selectors
+
+from host.vclock import SimulationEnd
+
+
+class _VirtualSelector(selectors.SelectSelector):
+
+    def __init__(self, clock):
+        super().__init__()
+        self._clock = clock
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("virtual event loop has nothing left to wait for")
+        if timeout > 0:
+            self._clock.advance_us(math.ceil(timeout * 1_000_000))
+        return super().select(0)
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    """Selector event loop whose time is ``clock``."""
+
+    def __init__(self, clock):
+        super().__init__(_VirtualSelector(clock))
+        self._clock = clock
+
+    def time(self):
+        return self._clock.now_us() / 1_000_000
+
+
+def run(coro, clock):
+    """Run ``coro`` on a fresh virtual loop until it returns or time runs out.
+
+    :class:`host.SimulationEnd` from the clock ends the run quietly; the
+    remaining tasks are cancelled.
+    """
+    loop = VirtualEventLoop(clock)
+    try:
+        return loop.run_until_complete(coro)
+    except SimulationEnd:
+        return None
+    finally:
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            try:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            except SimulationEnd:
+                pass
+        loop.close()
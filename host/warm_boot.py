@@ -0,0 +1,114 @@
+"""Compare cold and warm boots on the simulated board.
+
+First the firmware runs with ``config.WARM_START`` for ``--learn``
+minutes so the warm-start table fills and is saved (to a temporary
+file, with a short ``WARM_SAVE_MS``).  Then the same reset happens
+twice, ``--gap`` minutes later: once with an empty table (cold) and
+once with the saved one (warm).  For each boot it reports the seeded
+duty, the time until the panel first delivers ``--level`` of the power
+available at the true MPP, and the tracking efficiency of the first
+``--seconds``.
+
+    python -m host.warm_boot
+    python -m host.warm_boot --set MPPT_STRATEGY="'po_variable'" --start 9
+"""
+
+import argparse
+import os
+import tempfile
+
+import host
+from host import run
+
+SAMPLE_MS = 100
+
+
+class Convergence:
+    """Notes when the plant first reaches ``level`` of the MPP power."""
+
+    def __init__(self, board, level):
+        self.board = board
+        self.level = level
+        self.t_s = None
+
+    def sample(self, key) -> None:
+        board = self.board
+        board.sync_plant()
+        plant = board.plant
+        if self.t_s is None and plant.mpp_power > 0.0 and plant.p_in >= self.level * plant.mpp_power:
+            self.t_s = board.clock.now_s()
+
+
+def boot(seconds, path, overrides=None, level=0.95, **board_kw) -> dict:
+    """Run one boot with the warm-start table at ``path``; returns the summary.
+
+    Adds ``converge_s`` (``None`` if ``level`` was never reached) and
+    ``seeded`` (the duty the startup sequence ramped to, 0 if none).
+    """
+    settings = {"WARM_START": True, "WARM_PATH": path}
+    if overrides:
+        settings.update(overrides)
+    saved = run.apply_overrides(settings)
+    board = run.build_board(**board_kw)
+    meter = Convergence(board, level)
+    board.clock.add_timer("warm_boot", SAMPLE_MS * 1000, SAMPLE_MS * 1000, meter.sample)
+    seeded = {}
+
+    def entry():
+        import warm_start
+        cls = warm_start.WarmStart
+
+        class Recording(cls):
+            def __init__(self, *args, **kw):
+                cls.__init__(self, *args, **kw)
+                seeded["warm"] = self
+        warm_start.WarmStart = Recording
+        import main
+        main.main()
+
+    try:
+        summary = run.simulate(board, seconds, entry)
+    finally:
+        run.restore_overrides(saved)
+        host.uninstall()
+    warm = seeded.get("warm")
+    summary["converge_s"] = meter.t_s
+    summary["seeded"] = warm.seeded if warm is not None else 0
+    summary["saves"] = warm.saves if warm is not None else 0
+    return summary
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--learn", type=float, default=10.0, help="minutes of the learning run")
+    ap.add_argument("--gap", type=float, default=5.0, help="minutes between learning and reset")
+    ap.add_argument("--seconds", type=float, default=60.0, help="simulated time after each reset")
+    ap.add_argument("--level", type=float, default=0.95, help="fraction of MPP power for convergence")
+    ap.add_argument("--profile", default="clear", help="irradiance profile")
+    ap.add_argument("--start", type=float, default=12.0, help="time of day of the learning run [h]")
+    ap.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                    help="override a config value (all runs)")
+    args = ap.parse_args(argv)
+    overrides = {"MPPT_STRATEGY": "inc_cond"}
+    overrides.update(run.parse_overrides(args.set))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "warm.bin")
+        learn = dict(overrides, WARM_SAVE_MS=30000)
+        s = boot(args.learn * 60, path, learn, args.level, profile=args.profile, start_h=args.start)
+        print("learning   : %.0f min, %d saves, tracking %.1f%%"
+              % (args.learn, s["saves"], 100 * s["tracking_eff"]))
+        if not os.path.exists(path):
+            raise SystemExit("warm_boot: the learning run saved no table")
+        reset_h = args.start + (args.learn + args.gap) / 60
+        for name, table in (("cold", os.path.join(tmp, "empty.bin")), ("warm", path)):
+            s = boot(args.seconds, table, overrides, args.level,
+                     profile=args.profile, start_h=reset_h)
+            converge = "%.1f s" % s["converge_s"] if s["converge_s"] is not None else "never"
+            print("%-10s : seed duty %5d, %d%% of MPP after %s, tracking %.1f%% over %.0f s"
+                  % (name, s["seeded"], 100 * args.level, converge,
+                     100 * s["tracking_eff"], args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,32 +7,55 @@ class LCDManager:
     - 生成と初期化を行う
     - 失敗しても例外を外に出さない
     - 一過性エラーから復帰を試す
+
+    auto_retry を False にすると write は再接続を試さない。その場合は
+    init_steps() を呼ぶ側（main_async の再接続タスクなど）が復帰させる。
     """
     def __init__(self, i2c_no, sda_pin, scl_pin, addr, retry_ms=5000):
         self._cfg = (i2c_no, sda_pin, scl_pin, addr)
         self._lcd = None
         self._retry_ms = retry_ms
         self._next_retry = 0
+        self.auto_retry = True
         self._init_lcd()
 
     @property
     def alive(self) -> bool:
         return self._lcd is not None
 
-    def _init_lcd(self) -> bool:
+    @property
+    def retry_ms(self) -> int:
+        return self._retry_ms
+
+    def busy_us(self) -> int:
+        """次の I2C 転送まで待つべき時間 [us]"""
+        if self._lcd is None:
+            return 0
+        return self._lcd.busy_us()
+
+    def init_steps(self):
+        """初期化を I2C 転送ごとに区切って進めるジェネレータ。
+
+        転送のたびに、次の転送まで待つべき時間 [us] を yield する。
+        最後まで進めば alive になる。
+        """
         try:
             lcd = so1602a.LCD(*self._cfg)
-            lcd.clear()
-            lcd.home()
-            lcd.on()
+            for step in (lcd.clear, lcd.home, lcd.on):
+                step()
+                yield lcd.busy_us()
             self._lcd = lcd
-            return True
         except Exception:
             self._lcd = None
-            return False
+
+    def _init_lcd(self) -> bool:
+        # 待ちは次の転送の直前に LCD ドライバ側で入る
+        for _ in self.init_steps():
+            pass
+        return self._lcd is not None
 
     def _maybe_retry(self):
-        if self._lcd is not None:
+        if self._lcd is not None or not self.auto_retry:
             return
         now = time.ticks_ms()
         if time.ticks_diff(now, self._next_retry) >= 0:
@@ -49,6 +72,133 @@ class LCDManager:
             self._lcd = None
             self._next_retry = time.ticks_add(time.ticks_ms(), self._retry_ms)
 
+# 表示行のバッファ（毎回作り直さない）
+LINE0 = bytearray(b"P:  0.0V I: 0.0A")
+LINE1 = bytearray(b"B:  0.0V D:    0")
+_WARN = b"WARN "
+_STOP = b"STOP "
+# 処理時間ページ（show_profile で有効）: ステージごとの平均 [us]
+# "S%4dF%4dM%4d" / "P%4dL%4d  [us]"（S: センサー F: 安全 M: MPPT P: PWM L: LCD）
+PROF0 = bytearray(b"S   0F   0M   0 ")
+PROF1 = bytearray(b"P   0L   0  [us]")
+_profile = None
+_page_len = 0
+_page_n = 0
+
+
+def put_int(buf, pos, width, n) -> None:
+    """n を buf[pos:pos+width] に右詰めで書く。入りきらなければ 9 で埋める。"""
+    neg = n < 0
+    if neg:
+        n = -n
+    end = pos + width
+    i = end - 1
+    while True:
+        buf[i] = 0x30 + n % 10
+        n //= 10
+        i -= 1
+        if n == 0 or i < pos:
+            break
+    if n or (neg and i < pos):
+        for k in range(pos, end):
+            buf[k] = 0x39
+        return
+    if neg:
+        buf[i] = 0x2D
+        i -= 1
+    while i >= pos:
+        buf[i] = 0x20
+        i -= 1
+
+
+def put_milli1(buf, pos, width, milli) -> None:
+    """mV / mA の整数を V / A の小数 1 桁で buf[pos:pos+width] に右詰めで書く（"%5.1f" 相当）。
+
+    ちょうど中間（x.x50）は切り上げる。以前の "%5.1f" は float にした値を丸めていたので、
+    中間の値は float の 2 進表現しだいでどちらにも丸まっていた（12.35 V → 12.3、12.55 V → 12.6）。
+    """
+    neg = milli < 0
+    if neg:
+        milli = -milli
+    x = (milli + 50) // 100
+    if x == 0:
+        neg = False
+    # 整数部は小数点と小数 1 桁の手前まで
+    put_int(buf, pos, width - 2, -(x // 10) if neg else x // 10)
+    if neg and x // 10 == 0:
+        # -0.x の符号は整数部に乗らないので自分で書く
+        buf[pos + width - 4] = 0x2D
+    buf[pos + width - 2] = 0x2E
+    buf[pos + width - 1] = 0x30 + x % 10
+
+
+def format_into(ctx, line0, line1) -> None:
+    """Write the two 16-character display lines for the current state.
+
+    ``line0`` / ``line1`` are 16-byte bytearrays, normally ``LINE0`` /
+    ``LINE1``; only the digits are rewritten, so nothing is allocated.
+    """
+    state = ctx.state
+    meas = state.meas
+    safety = state.safety
+
+    # "P:%5.1fV I:%4.1fA"
+    put_milli1(line0, 2, 5, meas.p_voltage_mv)
+    put_milli1(line0, 11, 4, meas.p_current_ma)
+    # "B:%5.1fV D:%5d"
+    line1[0] = 0x42
+    line1[1] = 0x3A
+    put_milli1(line1, 2, 5, meas.b_voltage_mv)
+    put_int(line1, 11, 5, state.mppts.c_step)
+    # Show safety status prefix if not normal (overwrites the first 5 cells)
+    if safety.status == "warning":
+        line1[0:5] = _WARN
+    elif safety.status == "shutdown":
+        line1[0:5] = _STOP
+
+
+def format_profile_into(probe, line0, line1) -> None:
+    """Write the mean time of each stage of ``probe`` (a ``TimeProbe``)."""
+    put_int(line0, 1, 4, probe.mean(0))
+    put_int(line0, 6, 4, probe.mean(1))
+    put_int(line0, 11, 4, probe.mean(2))
+    put_int(line1, 1, 4, probe.mean(3))
+    put_int(line1, 6, 4, probe.mean(4))
+
+
+def show_profile(probe, updates) -> None:
+    """Alternate the normal page with the stage times of ``probe``.
+
+    Each page stays for ``updates`` calls of :func:`update_lcd`;
+    ``probe=None`` switches the timing page off again.
+    """
+    global _profile, _page_len, _page_n
+    _profile = probe
+    _page_len = updates if updates > 0 else 1
+    _page_n = 0
+
+
+def _profile_page() -> bool:
+    global _page_n
+    _page_n += 1
+    if _page_n >= 2 * _page_len:
+        _page_n = 0
+    return _page_n >= _page_len
+
+
+def format_page(ctx) -> bool:
+    """Format the page to show next.
+
+    Returns True for the timing page (``PROF0`` / ``PROF1``), False for
+    the normal page (``LINE0`` / ``LINE1``).
+    """
+    if _profile is not None and _profile_page():
+        format_profile_into(_profile, PROF0, PROF1)
+        return True
+    format_into(ctx, LINE0, LINE1)
+    return False
+
+
 def update_lcd(ctx):
     """Update the LCD with current measurements and MPPT status.
 
@@ -57,26 +207,19 @@ def update_lcd(ctx):
     function does nothing.
     """
     hw_lcd = ctx.hw_io.lcd
-    state = ctx.state
 
     if hw_lcd is None or not hw_lcd.alive:
         return
-    meas = state.meas
-    mppt = state.mppts
-    safety = state.safety
-
-    # Format lines to fit 16 characters
-    line0 = f"P:{meas.p_voltage:5.1f}V I:{meas.p_current:4.1f}A"
-    line1 = f"B:{meas.b_voltage:5.1f}V D:{mppt.c_step:5d}"
-    # Show safety status prefix if not normal
-    if safety.status == "warning":
-        line1 = "WARN " + line1[-11:]
-    elif safety.status == "shutdown":
-        line1 = "STOP " + line1[-11:]
+    if format_page(ctx):
+        line0 = PROF0
+        line1 = PROF1
+    else:
+        line0 = LINE0
+        line1 = LINE1
 
     try:
-        hw_lcd.write(0, line0[:16])
-        hw_lcd.write(1, line1[:16])
+        hw_lcd.write(0, line0)
+        hw_lcd.write(1, line1)
     except Exception:
         # Fail silently on LCD errors
         pass
\ No newline at end of file
@@ -1,15 +1,95 @@
 import time
+import config
+from scheduler import Scheduler
 from context import factory_instance
 from sequence_first import handle_startup_sequence
 from sensor_ctrl import read_sensor_data
 from safety_ctrl import safety_check
 from mppt_ctrl import mppt_control_step
 from pwm_ctrl import pwm_control
-from lcd_ctrl import update_lcd
+from lcd_ctrl import update_lcd, show_profile
+
+# MPPT の直後の PWM 反映用。instrument で包まない（pwm ステージは control 側の 1 回だけ数える）
+apply_duty = pwm_control
+
+
+def control_task(ctx):
+    read_sensor_data(ctx)      # センサー読む
+    safety_check(ctx)          # 安全確認
+    pwm_control(ctx)           # PWM制御します
+
+
+def control_log_task(ctx):
+    control_task(ctx)
+    ctx.logger.accumulate(ctx)  # ロガーの周期平均に足す
+
+
+def mppt_task(ctx):
+    mppt_control_step(ctx)     # MPPT制御します
+    apply_duty(ctx)            # 決めた duty をすぐ反映
+
+
+def instrument(probe):
+    """各ステージを probe.wrap で包んで差し替える（計測モード）。
+
+    probe は AllocProbe / TimeProbe のどちらでもよく、重ねて呼べば入れ子になる。
+
+    build_scheduler より前に呼ぶこと。
+    """
+    global read_sensor_data, safety_check, mppt_control_step, pwm_control, update_lcd
+    read_sensor_data = probe.wrap(0, read_sensor_data)
+    safety_check = probe.wrap(1, safety_check)
+    mppt_control_step = probe.wrap(2, mppt_control_step)
+    pwm_control = probe.wrap(3, pwm_control)
+    update_lcd = probe.wrap(4, update_lcd)
+
+
+def setup_probes(ctx) -> None:
+    """config.PROFILE_STAGES / ALLOC_PROBE の計測を入れる（main_async も使う）。
+
+    結果は ctx.profile / ctx.probe に入る。
+    """
+    if config.PROFILE_STAGES:
+        # alloc_probe より内側に入れてこちらの確保も測られるようにする
+        from time_probe import TimeProbe
+        ctx.profile = TimeProbe()
+        instrument(ctx.profile)
+        if config.PROFILE_LCD_PAGE_MS:
+            show_profile(ctx.profile, config.PROFILE_LCD_PAGE_MS // config.SCHED_LCD_MS)
+    if config.ALLOC_PROBE:
+        from alloc_probe import AllocProbe
+        ctx.probe = AllocProbe()
+        instrument(ctx.probe)
+
+
+def build_scheduler(ctx) -> Scheduler:
+    """センサー/安全/PWM は速く、MPPT は中くらい、LCD はゆっくり回す"""
+    sched = Scheduler()
+    logger = getattr(ctx, "logger", None)
+    sched.add("control", control_task if logger is None else control_log_task,
+              config.SCHED_CONTROL_MS, ctx)
+    sched.add("mppt", mppt_task, config.SCHED_MPPT_MS, ctx, offset_ms=config.SCHED_CONTROL_MS // 2)
+    sched.add("lcd", update_lcd, config.SCHED_LCD_MS, ctx, offset_ms=config.SCHED_CONTROL_MS // 4)
+    if logger is not None:
+        sched.add("log", logger.record, logger.period_ms, ctx, offset_ms=logger.period_ms)
+        # 満杯のブロックの書き出し。制御周期の直後に 1 チャンクずつ
+        sched.add("log_write", logger.write_step, config.SCHED_CONTROL_MS, ctx,
+                  offset_ms=config.SCHED_CONTROL_MS // 8)
+    telemetry = getattr(ctx, "telemetry", None)
+    if telemetry is not None:
+        sched.add("telemetry", telemetry.send, config.TELEMETRY_MS, ctx,
+                  offset_ms=config.SCHED_CONTROL_MS * 3 // 4)
+    warm = getattr(ctx, "warm", None)
+    if warm is not None:
+        sched.add("warm", warm.update, config.WARM_SAMPLE_MS, ctx, offset_ms=config.WARM_SAMPLE_MS)
+    return sched
 
 
 def main():
     ctx = factory_instance.first_create()
+    if config.WARM_START:
+        from warm_start import WarmStart
+        ctx.warm = WarmStart()       # 起動シーケンスがここから duty の初期値を選ぶ
     started = handle_startup_sequence(ctx)
 
     if not started:
@@ -18,12 +98,17 @@ def main():
             update_lcd(ctx)
             time.sleep_ms(100)
 
-    while True:
-        read_sensor_data(ctx)      # センサー読む
-        safety_check(ctx)          # 安全確認
-        mppt_control_step(ctx)     # MPPT制御します
-        pwm_control(ctx)           # PWM制御します
-        update_lcd(ctx)            # LCD更新します。
-        time.sleep_ms(300)
+    if ctx.hw_io.sampler is not None:
+        ctx.hw_io.sampler.start()  # ここから測定は第 2 コア
+    if config.LOG_ENABLE:
+        from data_log import DataLogger
+        ctx.logger = DataLogger()
+    if config.TELEMETRY_MS:
+        from telemetry import Telemetry
+        ctx.telemetry = Telemetry()
+    setup_probes(ctx)
+    build_scheduler(ctx).run()
+
 
-main()
+if __name__ == "__main__":
+    main()
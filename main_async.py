@@ -0,0 +1,189 @@
+"""Cooperative (uasyncio) run mode, an alternative entry point to main.main().
+
+The control path (sensor -> safety -> PWM every ``SCHED_CONTROL_MS``,
+MPPT every ``SCHED_MPPT_MS``) runs in one task that never touches the
+LCD.  LCD refresh, LCD reconnect, telemetry (text lines with
+``ASYNC_TELEMETRY_MS``, binary frames with ``TELEMETRY_MS``) are separate tasks that
+give control back to the event loop after every row update or init
+command and wait out the display controller's busy time with
+``sleep_ms`` instead of spinning, so a dead or slow display costs the
+control task at most one row's I2C transfers of latency and never a
+whole re-initialisation.
+
+On the Pico::
+
+    import main_async
+    main_async.main()
+
+On the host the same coroutines run on a virtual-time event loop, see
+``host.vloop`` and ``python -m host.run --async``.
+"""
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+import time
+
+import config
+from context import factory_instance
+from sequence_first import handle_startup_sequence
+from pwm_ctrl import pwm_control
+from lcd_ctrl import LINE0, LINE1, PROF0, PROF1, format_page, update_lcd
+from main import control_task, control_log_task, mppt_task, setup_probes
+
+if hasattr(asyncio, "sleep_ms"):
+    sleep_ms = asyncio.sleep_ms
+else:
+    def sleep_ms(ms):
+        """CPython の asyncio には sleep_ms が無いので秒に直す"""
+        return asyncio.sleep(ms / 1000)
+
+
+async def _lcd_ready(hw_lcd) -> None:
+    """LCD コントローラの処理中は他のタスクに譲って待つ"""
+    us = hw_lcd.busy_us()
+    if us > 0:
+        await sleep_ms((us + 999) // 1000)
+
+
+async def control_loop(ctx) -> None:
+    """センサー/安全/PWM と MPPT。LCD は触らない"""
+    control = control_task if getattr(ctx, "logger", None) is None else control_log_task
+    due = time.ticks_ms()
+    mppt_due = time.ticks_add(due, config.SCHED_MPPT_MS)
+    while True:
+        control(ctx)
+        now = time.ticks_ms()
+        if time.ticks_diff(now, mppt_due) >= 0:
+            mppt_task(ctx)
+            mppt_due = time.ticks_add(mppt_due, config.SCHED_MPPT_MS)
+            if time.ticks_diff(now, mppt_due) >= 0:
+                mppt_due = time.ticks_add(now, config.SCHED_MPPT_MS)
+
+        # 処理時間を差し引いて次の周期まで待つ。遅れたら格子を今に合わせ直す
+        due = time.ticks_add(due, config.SCHED_CONTROL_MS)
+        wait = time.ticks_diff(due, time.ticks_ms())
+        if wait < 0:
+            due = time.ticks_ms()
+            wait = 0
+        await sleep_ms(wait)
+
+
+async def lcd_refresh(ctx) -> None:
+    """1 行書くごとに譲る（処理時間ページも update_lcd と同じく交互に出す）"""
+    hw_lcd = ctx.hw_io.lcd
+    while True:
+        if hw_lcd is not None and hw_lcd.alive:
+            if format_page(ctx):
+                line0 = PROF0
+                line1 = PROF1
+            else:
+                line0 = LINE0
+                line1 = LINE1
+            await _lcd_ready(hw_lcd)
+            hw_lcd.write(0, line0)
+            await sleep_ms(0)
+            await _lcd_ready(hw_lcd)
+            hw_lcd.write(1, line1)
+            await sleep_ms(0)
+        await sleep_ms(config.SCHED_LCD_MS)
+
+
+async def lcd_reconnect(ctx) -> None:
+    """切れた LCD を I2C 転送ごとに譲りながら初期化し直す"""
+    hw_lcd = ctx.hw_io.lcd
+    if hw_lcd is None:
+        return
+    hw_lcd.auto_retry = False
+    while True:
+        if not hw_lcd.alive:
+            for wait_us in hw_lcd.init_steps():
+                await sleep_ms((wait_us + 999) // 1000)
+        await sleep_ms(hw_lcd.retry_ms)
+
+
+async def telemetry(ctx) -> None:
+    """状態を 1 行ずつ print する（ASYNC_TELEMETRY_MS が 0 なら何もしない）"""
+    period = config.ASYNC_TELEMETRY_MS
+    if period <= 0:
+        return
+    state = ctx.state
+    while True:
+        meas = state.meas
+        print("%d,%.2f,%.2f,%.2f,%d,%s" % (
+            time.ticks_ms(), meas.p_voltage, meas.p_current, meas.b_voltage,
+            state.pwms.applied_duty_u16, state.safety.status))
+        await sleep_ms(period)
+
+
+async def telemetry_frames(ctx) -> None:
+    """バイナリテレメトリのフレームを周期ごとに送る（送れなければ捨てる）"""
+    sender = ctx.telemetry
+    while True:
+        sender.send(ctx)
+        await sleep_ms(config.TELEMETRY_MS)
+
+
+async def log_records(ctx) -> None:
+    """データロガーのレコードを周期ごとに書く。満杯のブロックは 1 チャンクずつ譲りながら書き出す"""
+    logger = ctx.logger
+    while True:
+        await sleep_ms(logger.period_ms)
+        logger.record(ctx)
+        while logger.writing:
+            logger.write_step()
+            await sleep_ms(config.SCHED_CONTROL_MS)
+
+
+async def warm_table(ctx) -> None:
+    """ウォームスタートの表に今の動作点を取り込む（書き込みは WarmStart が間引く）"""
+    warm = ctx.warm
+    while True:
+        await sleep_ms(config.WARM_SAMPLE_MS)
+        warm.update(ctx)
+
+
+async def start() -> None:
+    ctx = factory_instance.first_create()
+    if config.WARM_START:
+        from warm_start import WarmStart
+        ctx.warm = WarmStart()
+    started = handle_startup_sequence(ctx)
+
+    if not started:
+        while True:
+            pwm_control(ctx)
+            update_lcd(ctx)
+            await sleep_ms(100)
+
+    if ctx.hw_io.sampler is not None:
+        ctx.hw_io.sampler.start()
+    # CPython の asyncio はタスクを弱参照でしか持たないので、ここで参照を持ち続ける
+    tasks = [
+        asyncio.create_task(lcd_refresh(ctx)),
+        asyncio.create_task(lcd_reconnect(ctx)),
+        asyncio.create_task(telemetry(ctx)),
+    ]
+    if config.TELEMETRY_MS:
+        from telemetry import Telemetry
+        ctx.telemetry = Telemetry()
+        tasks.append(asyncio.create_task(telemetry_frames(ctx)))
+    if config.LOG_ENABLE:
+        from data_log import DataLogger
+        ctx.logger = DataLogger()
+        tasks.append(asyncio.create_task(log_records(ctx)))
+    if config.WARM_START:
+        tasks.append(asyncio.create_task(warm_table(ctx)))
+    # 計測は main.main() と同じ。LCD は lcd_refresh が行ごとに書くので lcd ステージは数えない
+    setup_probes(ctx)
+    await control_loop(ctx)
+
+
+def main():
+    asyncio.run(start())
+
+
+if __name__ == "__main__":
+    main()
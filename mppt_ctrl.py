@@ -1,14 +1,50 @@
 """MPPT control module.
 
-This module implements a simple hill-climbing MPPT (Maximum Power Point
-Tracking) algorithm.  At each control step, it compares the latest
-measured panel power with the previous measurement stored in state
-and adjusts the PWM duty (represented as ``c_step`` in the MpptState).
+This module implements MPPT (Maximum Power Point Tracking) as a set of
+interchangeable strategies.  At each control step the selected strategy
+looks at the latest measurements and the MPPT state and proposes a new
+PWM duty (represented as ``c_step`` in the MpptState).  The strategy is
+chosen by name with ``config.MPPT_STRATEGY``:
 
-The algorithm increases or decreases the duty by a fixed step size
-``config.MPPT_STEP``, and flips direction when the measured power
-decreases compared to the last cycle.  Duty values are constrained
-between ``config.MPPT_MIN_DUTY`` and ``config.MPPT_MAX_DUTY``.
+``"po_fixed"``
+    Hill climbing (Perturb & Observe) with a fixed step
+    ``config.MPPT_STEP``.  The duty keeps moving in the current
+    direction while power increases and flips direction when the
+    measured power decreases compared to the last cycle.  This is the
+    original algorithm.
+``"po_seek"``
+    ``"po_fixed"`` plus the low-power seek described below.
+``"po_variable"``
+    Perturb & Observe whose step scales with the measured slope
+    ``|dP / dDuty|``: large steps far from the MPP, small steps close
+    to it, clamped to ``MPPT_VS_MIN_STEP .. MPPT_VS_MAX_STEP``.
+``"inc_cond"``
+    Incremental Conductance.  Comparing the latest measurement with the
+    one taken at the previous MPPT step it compares ``dI/dV`` with
+    ``-I/V``; at the MPP the two are equal and the duty is held.
+
+All strategies except ``"po_fixed"`` move the duty up by
+``config.MPPT_VS_MAX_STEP`` while the panel delivers less than
+``config.MPPT_SEEK_POWER``: with a buck converter no current flows
+until the duty is high enough, and neither the power difference, the
+slope nor the conductance carries any information there.  At night
+this walks the duty up to ``config.MPPT_MAX_DUTY``.  ``"po_fixed"``
+stays the original algorithm, which only dithers around its duty
+there.
+
+All arithmetic is on the integer mV / mA / mW measurements, with the
+float tuning constants converted once in ``config`` (``*_MW``,
+``*_Q10``), so a control step allocates nothing on MicroPython.
+
+Further strategies can be added with :func:`register_strategy`.  A
+strategy receives ``(mppt, meas)`` and returns the proposed duty; it
+must not touch the hardware.  Duty values are constrained between
+``config.MPPT_MIN_DUTY`` and ``config.MPPT_MAX_DUTY`` here, after the
+strategy returns.
+
+When ``config.MPPT_SCAN`` is enabled, ``mppt_scan`` may take over the
+control step to sweep the duty for the global maximum (partial
+shading); the strategy then resumes from the best point found.
 
 The computed duty is stored in ``state.mppts.c_step``.  The actual
 application of this duty to the PWM hardware is handled separately in
@@ -16,6 +52,96 @@ application of this duty to the PWM hardware is handled separately in
 """
 
 import config
+import mppt_scan
+
+# 戦略名 → 関数 (mppt, meas) -> 新しい duty
+STRATEGIES = {}
+
+
+def register_strategy(name):
+    """Decorator that makes a strategy selectable via ``config.MPPT_STRATEGY``."""
+    def deco(fn):
+        STRATEGIES[name] = fn
+        return fn
+    return deco
+
+
+@register_strategy("po_fixed")
+def po_fixed(mppt, meas) -> int:
+    """Fixed-step hill climbing."""
+    # Compare with last power to decide direction
+    if meas.p_power_mw > mppt.last_power_mw:
+        # Continue in same direction
+        pass
+    else:
+        # Power decreased or unchanged; flip direction
+        mppt.direction *= -1
+    return mppt.c_step + config.MPPT_STEP * mppt.direction
+
+
+@register_strategy("po_seek")
+def po_seek(mppt, meas) -> int:
+    """Fixed-step hill climbing that first seeks the conducting duty range."""
+    if meas.p_power_mw < config.MPPT_SEEK_POWER_MW:
+        mppt.direction = 1
+        return mppt.c_step + config.MPPT_VS_MAX_STEP
+    return po_fixed(mppt, meas)
+
+
+@register_strategy("po_variable")
+def po_variable(mppt, meas) -> int:
+    """Hill climbing with a step proportional to ``|dP / dDuty|``."""
+    if meas.p_power_mw < config.MPPT_SEEK_POWER_MW:
+        mppt.direction = 1
+        return mppt.c_step + config.MPPT_VS_MAX_STEP
+
+    d_power = meas.p_power_mw - mppt.last_power_mw
+    d_duty = mppt.c_step - mppt.last_duty
+    if d_power <= 0:
+        mppt.direction *= -1
+
+    if d_duty == 0:
+        step = config.MPPT_VS_MIN_STEP
+    else:
+        step = config.MPPT_VS_GAIN_MW * abs(d_power) // abs(d_duty)
+        if step < config.MPPT_VS_MIN_STEP:
+            step = config.MPPT_VS_MIN_STEP
+        elif step > config.MPPT_VS_MAX_STEP:
+            step = config.MPPT_VS_MAX_STEP
+    return mppt.c_step + step * mppt.direction
+
+
+@register_strategy("inc_cond")
+def inc_cond(mppt, meas) -> int:
+    """Incremental Conductance against the previous MPPT step.
+
+    duty を上げるとパネル電圧は下がる（降圧コンバータ）。
+    dP/dV > 0 ならパネル電圧を上げたいので duty を下げる。
+    """
+    if meas.p_power_mw < config.MPPT_SEEK_POWER_MW:
+        mppt.direction = 1
+        return mppt.c_step + config.MPPT_VS_MAX_STEP
+
+    v = meas.p_voltage_mv
+    i = meas.p_current_ma
+    dv = v - mppt.last_voltage_mv
+    di = i - mppt.last_current_ma
+
+    if dv == 0:
+        if di == 0:
+            return mppt.c_step
+        # 日射の変化: 電流が増えたら MPP 電圧も上がる
+        mppt.direction = -1 if di > 0 else 1
+    else:
+        # dP/dV = I + V * dI/dV。割り算を避けて dV 倍した値で比べる:
+        # |dP/dV| <= eps * I  <=>  |I * dV + V * dI| <= eps * I * |dV|
+        s = i * dv + v * di
+        tol = (config.MPPT_IC_EPS_Q10 * i >> 10) * abs(dv)
+        if -tol <= s <= tol:
+            return mppt.c_step
+        # dP/dV の符号は s と dV の符号が同じなら正
+        mppt.direction = -1 if (s > 0) == (dv > 0) else 1
+    return mppt.c_step + config.MPPT_STEP * mppt.direction
 
 
 def mppt_control_step(ctx) -> None:
@@ -30,11 +156,12 @@ def mppt_control_step(ctx) -> None:
         - If the safety status is "shutdown", the MPPT algorithm is
           suspended and ``c_step`` is left unchanged (the duty will
           ultimately be forced to zero by PWM control).
-        - Otherwise, compare the current panel power with the stored
-          ``last_power``.  If the power has increased, continue to
-          adjust the duty in the current ``direction``; if the power
-          has decreased, invert the direction and adjust.
-        - Update ``last_power`` with the current measured power.
+        - If a global scan is enabled and due (or running), let
+          ``mppt_scan`` command the next sweep point instead.
+        - Otherwise, run the strategy selected by
+          ``config.MPPT_STRATEGY`` to get the next duty.
+        - Update ``last_power_mw`` / ``last_duty`` / ``last_voltage_mv``
+          / ``last_current_ma`` with the current values.
         - Clamp ``c_step`` within the configured min/max duty range.
     """
     state = ctx.state
@@ -44,21 +171,15 @@ def mppt_control_step(ctx) -> None:
 
     # Do not adjust duty when in shutdown; leave mppt.c_step as-is
     if safety.status == "shutdown":
+        mppt_scan.abort(mppt)
         return
 
-    current_power = meas.p_power
-
-    # Compare with last power to decide direction
-    if current_power > mppt.last_power:
-        # Continue in same direction
-        delta = config.MPPT_STEP * mppt.direction
-    else:
-        # Power decreased or unchanged; flip direction
-        mppt.direction *= -1
-        delta = config.MPPT_STEP * mppt.direction
+    if config.MPPT_SCAN and mppt_scan.scan_step(ctx):
+        mppt.last_voltage_mv = meas.p_voltage_mv
+        mppt.last_current_ma = meas.p_current_ma
+        return
 
-    # Compute new duty
-    new_duty = mppt.c_step + delta
+    new_duty = STRATEGIES[config.MPPT_STRATEGY](mppt, meas)
 
     # Clamp to configured bounds
     if new_duty < config.MPPT_MIN_DUTY:
@@ -67,5 +188,8 @@ def mppt_control_step(ctx) -> None:
         new_duty = config.MPPT_MAX_DUTY
 
     # Store results
+    mppt.last_duty = mppt.c_step
     mppt.c_step = int(new_duty)
-    mppt.last_power = current_power
\ No newline at end of file
+    mppt.last_power_mw = meas.p_power_mw
+    mppt.last_voltage_mv = meas.p_voltage_mv
+    mppt.last_current_ma = meas.p_current_ma
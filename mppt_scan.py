@@ -0,0 +1,163 @@
+"""Global MPP scan.
+
+With part of the array shaded the bypass diodes give the P-V curve
+several local maxima, and the local strategies in ``mppt_ctrl`` settle
+on whichever one they reach first.  This module sweeps the duty across
+``config.MPPT_MIN_DUTY .. config.MPPT_MAX_DUTY`` to find the global
+maximum and then hands control back to the local strategy at the best
+point.
+
+A scan is started when ``config.MPPT_SCAN`` is enabled and
+
+- ``config.MPPT_SCAN_INTERVAL_MS`` has passed since the last scan, or
+- the power has dropped by more than ``config.MPPT_SCAN_DROP`` below
+  its running average, and at least ``config.MPPT_SCAN_MIN_GAP_MS``
+  has passed since the last scan.
+
+The sweep does not block the main loop: every control step measures
+the point commanded in the previous step and commands the next one,
+so sensing, safety and PWM keep running at their normal rate.  First
+``config.MPPT_SCAN_COARSE`` points are spread evenly over the whole
+range; then ``config.MPPT_SCAN_FINE`` points are placed between the
+coarse neighbours of the best coarse point.  Every measured
+``(applied duty, power)`` pair is kept in ``state.mppts.scan`` so the
+last P-duty curve can be displayed or logged.
+
+The duty commanded by the scan goes through ``pwm_ctrl.pwm_control``
+like any other, so the safety overrides apply unchanged.  The scan only
+starts while the safety status is "normal" and is abandoned as soon as
+it is not; control then resumes from the best point measured so far.
+The operating point at the start of the scan counts as a candidate, so
+a scan never hands off to a point worse than the one it left.
+"""
+
+import time
+
+import config
+from context.system_state import ScanState
+
+# 電力の移動平均の重み 1/2^_REF_SHIFT
+_REF_SHIFT = 3
+
+
+def _coarse_point(k: int) -> int:
+    n = config.MPPT_SCAN_COARSE
+    if n < 2:
+        return config.MPPT_MIN_DUTY
+    return config.MPPT_MIN_DUTY + (config.MPPT_MAX_DUTY - config.MPPT_MIN_DUTY) * k // (n - 1)
+
+
+def _fine_point(scan, k: int) -> int:
+    return scan.fine_lo + (scan.fine_hi - scan.fine_lo) * (k + 1) // (config.MPPT_SCAN_FINE + 1)
+
+
+def _due(scan, meas, now_ms: int) -> bool:
+    if scan.last_scan_ms is None:
+        return True
+    since = time.ticks_diff(now_ms, scan.last_scan_ms)
+    if since >= config.MPPT_SCAN_INTERVAL_MS:
+        return True
+    return (config.MPPT_SCAN_KEEP_Q10 < 1024 and since >= config.MPPT_SCAN_MIN_GAP_MS
+            and (meas.p_power_mw << 10) < scan.ref_power * config.MPPT_SCAN_KEEP_Q10)
+
+
+def _start(scan, duty: int, power: int, now_ms: int) -> None:
+    scan.phase = ScanState.COARSE
+    scan.index = 0
+    scan.pending = False
+    scan.count = 0
+    # 今の動作点も候補にしておく
+    scan.best_duty = duty
+    scan.best_power = power
+    scan.last_scan_ms = now_ms
+    scan.scans += 1
+
+
+def _record(scan, duty: int, power: int) -> None:
+    i = scan.count
+    if i < len(scan.duty):
+        scan.duty[i] = duty
+        scan.power[i] = power
+        scan.count = i + 1
+    if power > scan.best_power:
+        scan.best_power = power
+        scan.best_duty = duty
+
+
+def _next_point(scan):
+    """Next duty to command, or ``None`` when the sweep is complete."""
+    if scan.phase == ScanState.COARSE:
+        if scan.index < config.MPPT_SCAN_COARSE:
+            scan.index += 1
+            return _coarse_point(scan.index - 1)
+        # 最良点の両隣の粗い点の間を細かく掃引する
+        n = config.MPPT_SCAN_COARSE
+        span = config.MPPT_MAX_DUTY - config.MPPT_MIN_DUTY
+        if n > 1:
+            span //= n - 1
+        lo = scan.best_duty - span
+        hi = scan.best_duty + span
+        scan.fine_lo = lo if lo > config.MPPT_MIN_DUTY else config.MPPT_MIN_DUTY
+        scan.fine_hi = hi if hi < config.MPPT_MAX_DUTY else config.MPPT_MAX_DUTY
+        scan.phase = ScanState.FINE
+        scan.index = 0
+    if scan.phase == ScanState.FINE and scan.index < config.MPPT_SCAN_FINE:
+        scan.index += 1
+        return _fine_point(scan, scan.index - 1)
+    return None
+
+
+def _hand_off(mppt) -> None:
+    scan = mppt.scan
+    scan.phase = ScanState.IDLE
+    scan.pending = False
+    scan.ref_power = scan.best_power
+    mppt.c_step = scan.best_duty
+    # 山登りは最良点から、前回値なしの状態で再開する
+    mppt.last_duty = scan.best_duty
+    mppt.last_power_mw = scan.best_power
+
+
+def abort(mppt) -> None:
+    """Abandon a running scan and resume from the best point so far."""
+    if mppt.scan.phase != ScanState.IDLE:
+        mppt.scan.aborts += 1
+        _hand_off(mppt)
+
+
+def scan_step(ctx) -> bool:
+    """Advance the global scan by one control step.
+
+    Args:
+        ctx: Context with ``state.meas``, ``state.mppts``,
+            ``state.pwms`` and ``state.safety``.
+
+    Returns:
+        True if the scan set ``state.mppts.c_step`` this step and the
+        local strategy must not run; False otherwise.
+    """
+    state = ctx.state
+    mppt = state.mppts
+    meas = state.meas
+    scan = mppt.scan
+    now = time.ticks_ms()
+
+    if scan.phase == ScanState.IDLE:
+        if state.safety.status != "normal" or not _due(scan, meas, now):
+            scan.ref_power += (meas.p_power_mw - scan.ref_power) >> _REF_SHIFT
+            return False
+        _start(scan, state.pwms.applied_duty_u16, meas.p_power_mw, now)
+    elif state.safety.status != "normal":
+        abort(mppt)
+        return True
+    elif scan.pending:
+        # 前の周期で指令した点が今回の測定値
+        _record(scan, state.pwms.applied_duty_u16, meas.p_power_mw)
+
+    duty = _next_point(scan)
+    if duty is None:
+        _hand_off(mppt)
+        return True
+    mppt.c_step = duty
+    scan.pending = True
+    return True
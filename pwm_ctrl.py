@@ -21,8 +21,9 @@ def pwm_control(ctx) -> None:
     mppt = state.mppts
 
     target = mppt.c_step
-    # Safety overrides
-    if safety.status == "shutdown":
+    trip = ctx.hw_io.trip
+    # Safety overrides (the timer trip may have latched since the last safety check)
+    if safety.status == "shutdown" or (trip is not None and trip.tripped):
         target = 0
     elif safety.status == "warning" and target > state.pwms.applied_duty_u16:
         target = state.pwms.applied_duty_u16
@@ -8,10 +8,18 @@ forced to zero and no further increases should occur.  If only a few
 violations are observed, the status is set to "warning" to inhibit
 duty increases but still allow decreases.
 
+The timer-driven hard-limit trip (``fast_trip``) cuts the PWM on its
+own within milliseconds; once it has latched, this check reports
+"shutdown" until the averaged values have been within the limits for
+``config.TRIP_RESET_COUNT`` consecutive checks, then clears the latch.
+If the fault is still there the trip latches again at once.
+
 The thresholds and maximum consecutive violation count are defined in
-``config``.  For simplicity, only battery voltage and panel current
-are monitored here.  Future development may add additional safety
-checks (e.g. battery under-voltage, temperature).
+``config``; the measurements are integer mV / mA, so the comparison
+uses the pre-scaled ``config.I_LIMIT_MA`` / ``config.BV_LIMIT_MV``.
+For simplicity, only battery voltage and panel current are monitored
+here.  Future development may add additional safety checks (e.g.
+battery under-voltage, temperature).
 """
 
 import config
@@ -25,6 +33,11 @@ def safety_check(ctx) -> None:
             ``safety`` attributes.
 
     Behavior:
+        - If the timer trip in ``ctx.hw_io.trip`` has latched, sets
+          "shutdown" and records the cause in ``safety.trip_cause``;
+          after ``config.TRIP_RESET_COUNT`` consecutive checks within
+          the limits, resets the trip and carries on with the checks
+          below.
         - Increments consecutive violation counters if the measured
           value exceeds the configured limit; resets counters when
           back within limits.
@@ -38,14 +51,29 @@ def safety_check(ctx) -> None:
     meas = state.meas
     safety = state.safety
 
+    trip = ctx.hw_io.trip
+    if trip is not None and trip.tripped:
+        # 遮断中は duty 0。平均値がリミット内のまま一定回数続いたら解除する
+        if meas.p_current_ma <= config.I_LIMIT_MA and meas.b_voltage_mv <= config.BV_LIMIT_MV:
+            safety.trip_clear_count += 1
+        else:
+            safety.trip_clear_count = 0
+        if safety.trip_clear_count < config.TRIP_RESET_COUNT:
+            safety.trip_cause = trip.cause
+            safety.status = "shutdown"
+            return
+        trip.reset()
+        safety.trip_clear_count = 0
+        safety.trip_cause = 0
+
     # Over-current check (panel current)
-    if meas.p_current > config.I_LIMIT:
+    if meas.p_current_ma > config.I_LIMIT_MA:
         safety.overcurrent_count += 1
     else:
         safety.overcurrent_count = 0
 
     # Over-voltage check (battery voltage)
-    if meas.b_voltage > config.BV_LIMIT:
+    if meas.b_voltage_mv > config.BV_LIMIT_MV:
         safety.overvoltage_count += 1
     else:
         safety.overvoltage_count = 0
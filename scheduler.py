@@ -0,0 +1,132 @@
+"""Multi-rate deadline scheduler.
+
+Each task is a function called with a fixed argument (the context) at
+its own period.  Deadlines are kept on a fixed grid built with
+``time.ticks_add``: a task released at ``due`` is next due at
+``due + period`` no matter how long it ran, so the rate does not drift
+with execution time the way ``work(); sleep_ms(period)`` does.
+
+When several tasks are due the one with the earliest deadline runs
+first (ties go to the task added first), so a slow task such as the
+LCD delays the fast ones by at most one execution of itself.  Between
+deadlines the scheduler sleeps until the next one.
+
+Per-task counters (all in microseconds where applicable):
+
+``runs``
+    Number of executions.
+``late_us`` / ``late_max_us``
+    Start delay behind the deadline, last and worst (the jitter).
+``exec_us`` / ``exec_max_us``
+    Execution time, last and worst.
+``overruns``
+    Deadlines that were skipped because the task was still more than
+    a whole period behind.  The grid then jumps forward instead of
+    running the task back to back to catch up.
+"""
+
+import time
+
+
+class Task:
+    """One periodic task and its timing counters."""
+
+    __slots__ = ("name", "fn", "arg", "period_us", "due", "runs", "overruns",
+                 "late_us", "late_max_us", "exec_us", "exec_max_us")
+
+    def __init__(self, name, fn, arg, period_us, due):
+        self.name = name
+        self.fn = fn
+        self.arg = arg
+        self.period_us = period_us
+        self.due = due
+        self.runs = 0
+        self.overruns = 0
+        self.late_us = 0
+        self.late_max_us = 0
+        self.exec_us = 0
+        self.exec_max_us = 0
+
+    def reset_stats(self) -> None:
+        self.runs = 0
+        self.overruns = 0
+        self.late_max_us = 0
+        self.exec_max_us = 0
+
+
+class Scheduler:
+    """Earliest-deadline-first runner for a handful of periodic tasks."""
+
+    def __init__(self):
+        self.tasks = []
+
+    def add(self, name, fn, period_ms, arg=None, offset_ms=0) -> Task:
+        """Register ``fn(arg)`` to run every ``period_ms``.
+
+        ``offset_ms`` shifts the first release, which spreads tasks with
+        a common period over the cycle.
+        """
+        due = time.ticks_add(time.ticks_us(), offset_ms * 1000)
+        task = Task(name, fn, arg, period_ms * 1000, due)
+        self.tasks.append(task)
+        return task
+
+    def task(self, name):
+        for t in self.tasks:
+            if t.name == name:
+                return t
+        return None
+
+    def _next(self):
+        best = None
+        for t in self.tasks:
+            if best is None or time.ticks_diff(t.due, best.due) < 0:
+                best = t
+        return best
+
+    def run_once(self) -> bool:
+        """Run the earliest task if it is due.  Returns True if one ran."""
+        t = self._next()
+        if t is None:
+            return False
+        start = time.ticks_us()
+        late = time.ticks_diff(start, t.due)
+        if late < 0:
+            return False
+
+        t.fn(t.arg)
+        end = time.ticks_us()
+
+        t.runs += 1
+        t.late_us = late
+        if late > t.late_max_us:
+            t.late_max_us = late
+        took = time.ticks_diff(end, start)
+        t.exec_us = took
+        if took > t.exec_max_us:
+            t.exec_max_us = took
+
+        due = time.ticks_add(t.due, t.period_us)
+        # 1 周期以上遅れていたら追いかけずに次の格子点へ飛ばす
+        while time.ticks_diff(end, due) >= t.period_us:
+            due = time.ticks_add(due, t.period_us)
+            t.overruns += 1
+        t.due = due
+        return True
+
+    def wait(self) -> None:
+        """Sleep until the next deadline."""
+        t = self._next()
+        if t is None:
+            return
+        wait = time.ticks_diff(t.due, time.ticks_us())
+        if wait > 2000:
+            time.sleep_ms(wait // 1000)
+        elif wait > 0:
+            time.sleep_us(wait)
+
+    def run(self) -> None:
+        """Run the tasks forever."""
+        while True:
+            if not self.run_once():
+                self.wait()
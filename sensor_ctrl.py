@@ -5,110 +5,500 @@ and conversion to obtain physical quantities (panel voltage, panel
 current, battery voltage), updates the system state with these values,
 computes derived power, and stores a history of recent measurements.
 
-The measurement procedure follows the design document:
+The measurement procedure follows the design document, but the
+channels are now declared in ``config.SENSE_CHANNELS`` instead of being
+hard-coded loops.  Each entry gives the ``Measurements`` attribute to
+fill, the ADC pin, the sample count, how many of the lowest/highest
+samples to drop, and a linear conversion ``value = avg * scale -
+offset``:
 
 * Panel voltage (PV) and battery voltage (BV) are sampled 26 times.
-  The samples are sorted, the lowest 5 and highest 5 values are
-  discarded to reduce noise (trimmed mean), and the remaining 16
-  values are averaged.  The averaged raw value is scaled by a factor
-  to convert to volts.
-* Panel current (PI) is sampled 84 times.  The samples are sorted,
-  the lowest 10 and highest 10 values are discarded, and the
-  remaining 64 values are averaged.  The averaged raw value is
-  scaled by a factor to convert to amperes.  A constant offset
-  ``P_CURRENT_REV`` is subtracted to correct for sensor bias.
+  The lowest 5 and highest 5 values are discarded to reduce noise
+  (trimmed mean), and the remaining 16 values are averaged.
+* Panel current (PI) is sampled 84 times.  The lowest 10 and highest
+  10 values are discarded and the remaining 64 values are averaged.
+  A constant offset ``P_CURRENT_REV`` is subtracted to correct for
+  sensor bias.
 
 These sample counts and trimming parameters can be tuned; they are
 chosen to reject outliers and noise in the ADC readings.
+
+Values are integers in millivolts / milliamps and the derived power in
+milliwatts.  The float ``scale`` of each channel is turned into a
+fixed-point multiplier ``scale_q / 2**shift`` once, with the largest
+``shift`` that keeps ``65535 * scale_q`` a MicroPython small int, so
+the conversion is one multiply and one shift and allocates nothing.
+One millivolt/milliamp is finer than a step of the 12-bit converter
+(about 20 mV / 4 mA with the standard dividers), so no resolution is
+lost.
+
+With ``config.SENSE_DUAL_CORE`` the sampling runs on the second core
+(see ``sensor_dual``) and :func:`read_sensor_data` only picks up the
+newest complete result.
+
+The samples are read into the channel's ``array('H')`` in
+``MeasureBuffer`` and trimmed in the same pass, over this cycle's
+samples only and without sorting: only the values to be dropped are
+tracked (``MeasureBuffer.low`` / ``high``) and taken off the total.
+All working state is in that buffer, so two acquisitions into
+different buffers do not share anything but the channels.
+
+With ``config.SENSE_ADAPTIVE`` the sample count of each channel follows
+its measured noise: the range between the trim thresholds gives a
+robust per-sample noise estimate for free, and the count is set so the
+standard error of the mean meets the channel's target, within the
+bounds in ``config.SENSE_ADAPT``.  The chosen count and the noise
+estimate are published in ``Measurements.sample_count`` / ``noise``.
+
+The whole acquisition has a time budget (``config.SENSE_BUDGET_US``).
+The engine learns the cost of one sample; when the configured counts
+would not fit, every channel is scaled down proportionally for that
+cycle.  Cycles that still run over are counted in ``overruns``.
 """
 
+import math
+import time
+
+import calibration
 import config
 
 
+class SampleChannel:
+    """1 チャネル分のサンプリング設定と ADC インスタンス。
+
+    Attributes:
+        name: ``Measurements`` attribute the converted value goes to.
+        adc: ADC object.
+        read: ``adc.read_u16``, bound once.
+        count: Configured number of samples per cycle.
+        drop_low / drop_high: Samples discarded at each end (for ``count``
+            samples; scaled with the actual count).
+        scale / offset: ``value = avg * scale - offset``.
+        floor: Converted values below this are clamped (``None``: no clamp).
+        scale_q / shift / offset_i / floor_i: Integer form of the conversion,
+            ``value = ((raw * scale_q + round) >> shift) - offset_i``.
+        lut: Calibration table (``calibration.build_table``) used instead
+            of ``scale`` / ``offset`` when set.
+        temp_coeff_q8 / temp_ref_dc / temp_corr: Temperature drift of the
+            offset and the correction for the last temperature reading,
+            subtracted from every converted value.
+        n: Samples actually taken in the last cycle.
+        raw: Trimmed mean of the last cycle in ADC counts.
+        n_min / n_max / target: Adaptive oversampling bounds and the
+            wanted standard error of the mean [ADC counts].
+        noise: Estimated per-sample noise (standard deviation) [ADC counts].
+        want: Sample count chosen by adaptive oversampling.
+    """
+
+    __slots__ = ("name", "adc", "read", "count", "drop_low", "drop_high",
+                 "scale", "offset", "floor", "scale_q", "shift", "round", "offset_i", "floor_i",
+                 "lut", "temp_coeff_q8", "temp_ref_dc", "temp_corr",
+                 "n", "raw",
+                 "n_min", "n_max", "target", "noise", "want", "_noise_x16", "_inv2z_x256")
+
+    def __init__(self, name, adc, count, drop_low, drop_high, scale, offset=0.0, floor=0.0):
+        if drop_low + drop_high >= count:
+            raise ValueError("SampleChannel: nothing left after trimming " + name)
+        self.name = name
+        self.adc = adc
+        # 束縛メソッドは取り出すたびに確保されるので、ここで 1 回だけ作っておく
+        self.read = adc.read_u16
+        self.count = count
+        self.drop_low = drop_low
+        self.drop_high = drop_high
+        self.scale = scale
+        self.offset = offset
+        self.floor = floor
+        self.scale_q, self.shift = _fixed_scale(scale)
+        self.round = (1 << self.shift) >> 1
+        self.offset_i = int(offset + (0.5 if offset >= 0 else -0.5))
+        self.floor_i = None if floor is None else int(floor)
+        self.lut = None
+        self.temp_coeff_q8 = 0
+        self.temp_ref_dc = 0
+        self.temp_corr = 0
+        self.n = count
+        self.raw = 0
+
+        self.n_min = count
+        self.n_max = count
+        self.target = 0
+        self.noise = 0
+        self.want = count
+        self._noise_x16 = 0
+        # トリム境界の幅 → 標準偏差 の換算係数（正規分布を仮定, 256 倍）
+        self._inv2z_x256 = 0
+        if drop_low and drop_high:
+            p = (drop_low + drop_high) * 0.5 / (count + 1)
+            self._inv2z_x256 = int(256.0 / (2.0 * _z_upper(p)) + 0.5)
+
+    def set_calibration(self, points) -> None:
+        """Convert with the curve through ``points`` ((raw, value), ...)."""
+        self.lut = calibration.build_table(points)
+
+    def set_temp_coeff(self, coeff: float, ref_c: float) -> None:
+        """Offset drift ``coeff`` [mV or mA / degC] around ``ref_c`` [degC]."""
+        self.temp_coeff_q8 = int(coeff * 25.6 + (0.5 if coeff >= 0 else -0.5))
+        self.temp_ref_dc = int(ref_c * 10 + 0.5)
+
+    def convert(self, raw: int) -> int:
+        """Raw count → mV / mA, as ``AdcChannels.acquire`` does."""
+        if self.lut is None:
+            value = ((raw * self.scale_q + self.round) >> self.shift) - self.offset_i
+        else:
+            value = calibration.convert(self.lut, raw)
+        value -= self.temp_corr
+        if self.floor_i is not None and value < self.floor_i:
+            value = self.floor_i
+        return value
+
+    def set_adaptive(self, n_min: int, n_max: int, target: int) -> None:
+        """Enable adaptive oversampling between ``n_min`` and ``n_max`` samples."""
+        self.n_min = n_min
+        self.n_max = n_max
+        self.target = target
+
+    def adapt(self, spread: int) -> None:
+        """Update the noise estimate from the last trim range and pick ``want``.
+
+        ``spread`` is the distance between the largest dropped-low and
+        the smallest dropped-high sample, an inter-quantile range that
+        ignores the outliers trimming removes.  The count is chosen so
+        that the standard error of the kept samples' mean meets
+        ``target``: ``kept = (noise / target) ** 2``.
+        """
+        if not self._inv2z_x256 or not self.target:
+            return
+        sigma_x16 = (spread * self._inv2z_x256) >> 4
+        if self._noise_x16 == 0:
+            self._noise_x16 = sigma_x16
+        else:
+            self._noise_x16 = (3 * self._noise_x16 + sigma_x16) >> 2
+        self.noise = self._noise_x16 >> 4
+
+        kept_nominal = self.count - self.drop_low - self.drop_high
+        t2 = self.target * self.target * kept_nominal
+        want = ((self._noise_x16 * self._noise_x16 >> 8) * self.count + t2 - 1) // t2
+        if want < self.n_min:
+            want = self.n_min
+        elif want > self.n_max:
+            want = self.n_max
+        self.want = want
+
+
 class AdcChannels:
     """
-    センサー用ADCのPINインスタンスを生成して保持するだけのクラス
+    センサー用ADCのPINインスタンスを生成して保持し、まとめてサンプリングするクラス
 
     Attributes:
+        channels: ``SampleChannel`` list in acquisition order
         battery: ADC object for battery voltage
         panel_v: ADC object for panel voltage
         panel_i: ADC object for panel current
+        budget_us: Time budget for one acquisition
+        last_us / max_us: Duration of the last / longest acquisition
+        overruns: Acquisitions that exceeded ``budget_us``
+        scaled: Acquisitions whose counts were reduced to fit the budget
     """
 
-    def __init__(self):
+    def __init__(self, specs=None, budget_us=None):
         from machine import ADC, Pin  # type: ignore
-        self.battery = ADC(Pin(config.ADC_PIN_BATTERY))
-        self.panel_v = ADC(Pin(config.ADC_PIN_PANEL_V))
-        self.panel_i = ADC(Pin(config.ADC_PIN_PANEL_I))
+        if specs is None:
+            specs = config.SENSE_CHANNELS
+        if budget_us is None:
+            budget_us = config.SENSE_BUDGET_US
+
+        adcs = {}
+        self.channels = []
+        for spec in specs:
+            pin = spec[1]
+            adc = adcs.get(pin)
+            if adc is None:
+                # 26 未満はチャネル番号（4 = 内蔵温度センサ）
+                adc = adcs[pin] = ADC(pin) if pin < 26 else ADC(Pin(pin))
+            self.channels.append(SampleChannel(spec[0], adc, *spec[2:]))
+
+        # 適応オーバーサンプリング
+        self.adaptive = config.SENSE_ADAPTIVE
+        for ch in self.channels:
+            bounds = config.SENSE_ADAPT.get(ch.name)
+            if bounds is not None:
+                ch.set_adaptive(*bounds)
+
+        # 多点校正と温度によるオフセットの補正（calibration.py）
+        self.temp_adc = None
+        self.temp_dc = 0
+        self._temp_due = 0
+        for ch in self.channels:
+            points = config.SENSE_CALIBRATION.get(ch.name)
+            if points is not None:
+                ch.set_calibration(points)
+            coeff = config.SENSE_TEMP_COEFF.get(ch.name)
+            if coeff is not None:
+                ch.set_temp_coeff(*coeff)
+                if self.temp_adc is None:
+                    self.temp_adc = adcs.get(4) or ADC(4)
+        if self.temp_adc is not None:
+            self.update_temperature()
+
+        self.battery = adcs.get(config.ADC_PIN_BATTERY)
+        self.panel_v = adcs.get(config.ADC_PIN_PANEL_V)
+        self.panel_i = adcs.get(config.ADC_PIN_PANEL_I)
+
+        self.budget_us = budget_us
+        # 1 サンプルあたりの時間 [us] の推定値（16 倍した固定小数点）
+        self._us_per_sample_x16 = 0
+        self.last_us = 0
+        self.max_us = 0
+        self.overruns = 0
+        self.scaled = 0
+        self.cycles = 0
+
+    def channel(self, name):
+        for ch in self.channels:
+            if ch.name == name:
+                return ch
+        return None
+
+    def update_temperature(self) -> None:
+        """Read the die temperature and work out each channel's offset correction."""
+        read = self.temp_adc.read_u16
+        total = 0
+        for _ in range(8):
+            total += read()
+        self.temp_dc = calibration.temp_decicelsius(total >> 3)
+        for ch in self.channels:
+            if ch.temp_coeff_q8:
+                ch.temp_corr = calibration.temp_correction(ch.temp_coeff_q8, ch.temp_ref_dc,
+                                                           self.temp_dc)
+        self._temp_due = config.SENSE_TEMP_EVERY
+
+    def planned_samples(self) -> int:
+        total = 0
+        for ch in self.channels:
+            total += ch.want if self.adaptive else ch.count
+        return total
+
+    def acquire(self, buffer, meas, limit=0) -> None:
+        """Sample every channel into ``buffer`` and store values on ``meas``.
 
+        ``limit`` caps the total number of samples (0 = no cap); the
+        channels are scaled down proportionally, like for the budget.
+        """
+        planned = self.planned_samples()
+        # 予算に収まらなければ全チャネルを同じ割合で減らす
+        est_x16 = planned * self._us_per_sample_x16
+        budget_x16 = self.budget_us << 4
+        if est_x16 > budget_x16:
+            num = budget_x16
+            den = est_x16
+            self.scaled += 1
+        else:
+            num = 1
+            den = 1
+        if limit and planned * num > limit * den:
+            num = limit
+            den = planned
 
-def _trimmed_mean(buffer: list, drop_low: int, drop_high: int, shift: int) -> int:
-    """Compute a trimmed mean of the sorted buffer.
+        if self.temp_adc is not None:
+            self._temp_due -= 1
+            if self._temp_due <= 0:
+                self.update_temperature()
+
+        adaptive = self.adaptive
+        t0 = time.ticks_us()
+        taken = 0
+        for ch in self.channels:
+            n = (ch.want if adaptive else ch.count) * num // den
+            dl = ch.drop_low * n // ch.count
+            dh = ch.drop_high * n // ch.count
+            if n <= dl + dh:
+                n = dl + dh + 1
+            ch.n = n
+            low = buffer.low[ch.name]
+            high = buffer.high[ch.name]
+            ch.raw = _read_trimmed(ch.read, buffer.buffers[ch.name], n, dl, dh, low, high)
+            if adaptive and dl and dh:
+                ch.adapt(_trim_spread(low, high, dl, dh))
+            setattr(meas, ch.name, ch.convert(ch.raw))
+            meas.sample_count[ch.name] = n
+            meas.noise[ch.name] = ch.noise
+            taken += n
+        elapsed = time.ticks_diff(time.ticks_us(), t0)
+
+        self.cycles += 1
+        self.last_us = elapsed
+        if elapsed > self.max_us:
+            self.max_us = elapsed
+        if elapsed > self.budget_us:
+            self.overruns += 1
+        # 指数移動平均で 1 サンプルの時間を学習する
+        sample_x16 = (elapsed << 4) // taken
+        if self._us_per_sample_x16 == 0:
+            self._us_per_sample_x16 = sample_x16
+        else:
+            self._us_per_sample_x16 = (3 * self._us_per_sample_x16 + sample_x16) >> 2
+
+
+# MicroPython の small int の上限（これを超えると多倍長整数が確保される）
+_SMALL_INT = 1 << 30
+
+
+def _fixed_scale(scale: float):
+    """Return ``(scale_q, shift)`` with ``scale_q / 2**shift`` close to ``scale``.
+
+    ``shift`` is the largest (at most 16) for which ``65535 * scale_q``
+    stays below the small-int limit.
+    """
+    shift = 16
+    while shift > 0 and int(scale * (1 << shift) + 0.5) * 65535 >= _SMALL_INT:
+        shift -= 1
+    return int(scale * (1 << shift) + 0.5), shift
+
+
+def _z_upper(p: float) -> float:
+    """Standard normal quantile z with upper-tail probability ``p``.
+
+    Abramowitz & Stegun 26.2.23 (error < 4.5e-4), 0 < p <= 0.5.
+    """
+    t = math.sqrt(-2.0 * math.log(p))
+    return t - (2.515517 + 0.802853 * t + 0.010328 * t * t) / (
+        1.0 + 1.432788 * t + 0.189269 * t * t + 0.001308 * t * t * t)
+
+
+# どの ADC の値よりも大きい値（上側の候補がまだないときの閾値）
+_ABOVE_ADC = 1 << 16
+
+
+def _read_trimmed(read, buffer, count: int, drop_low: int, drop_high: int, low, high) -> int:
+    """Read ``count`` samples into ``buffer`` and return their trimmed mean.
+
+    No sort: ``low`` keeps the ``drop_low`` smallest and ``high`` the
+    ``drop_high`` largest samples seen so far.  The first ``drop_low +
+    drop_high`` samples are split between the two (swapping while the
+    largest of ``low`` is above the smallest of ``high``); after that a
+    sample is compared with the two thresholds only.  A sample below the
+    largest of ``low`` replaces it, and the value it pushes out goes on
+    as the candidate for ``high``.  The kept sum is the total minus
+    both, the same integer as sorting and summing the middle.
 
     Args:
-        buffer: List of raw ADC values.
+        read: Callable returning one raw sample (e.g. ``ADC.read_u16``).
+        buffer: At least ``count`` entries; gets the samples in read order.
+        count: Number of samples (more than ``drop_low + drop_high``).
         drop_low: Number of smallest values to drop.
         drop_high: Number of largest values to drop.
-        shift: Right shift amount to divide the sum (equivalent to dividing by 2**shift).
+        low / high: At least ``drop_low`` / ``drop_high`` entries of
+            scratch; left holding the dropped values for :func:`_trim_spread`.
 
     Returns:
         Averaged value as an integer.
     """
-    # sort in-place
-    buffer.sort()
-    # sum the middle portion
     total = 0
-    for i in range(drop_low, len(buffer) - drop_high):
-        total += buffer[i]
-    return total >> shift
+    m = drop_low + drop_high
+    for i in range(m):
+        x = read()
+        buffer[i] = x
+        total += x
+        if i < drop_low:
+            low[i] = x
+        else:
+            high[i - drop_low] = x
+
+    # low の最大値の位置 / high の最小値の位置。捨てない側はどのサンプルとも比べて外れる値にする
+    lo_i = _largest(low, drop_low)
+    lo_thr = low[lo_i] if drop_low else -1
+    hi_i = _smallest(high, drop_high)
+    hi_thr = high[hi_i] if drop_high else _ABOVE_ADC
+    while lo_thr > hi_thr:
+        low[lo_i] = hi_thr
+        high[hi_i] = lo_thr
+        lo_i = _largest(low, drop_low)
+        lo_thr = low[lo_i]
+        hi_i = _smallest(high, drop_high)
+        hi_thr = high[hi_i]
+
+    for i in range(m, count):
+        x = read()
+        buffer[i] = x
+        total += x
+        if x < lo_thr:
+            # 押し出された low の最大値が上側の候補になる
+            low[lo_i] = x
+            x = lo_thr
+            lo_i = _largest(low, drop_low)
+            lo_thr = low[lo_i]
+        if x > hi_thr:
+            high[hi_i] = x
+            hi_i = _smallest(high, drop_high)
+            hi_thr = high[hi_i]
+
+    for j in range(drop_low):
+        total -= low[j]
+    for j in range(drop_high):
+        total -= high[j]
+    return total // (count - m)
+
+
+def _largest(values, n: int) -> int:
+    """Index of the largest of the first ``n`` ``values`` (0 if ``n`` is 0)."""
+    k = 0
+    for j in range(1, n):
+        if values[j] > values[k]:
+            k = j
+    return k
+
 
+def _smallest(values, n: int) -> int:
+    """Index of the smallest of the first ``n`` ``values`` (0 if ``n`` is 0)."""
+    k = 0
+    for j in range(1, n):
+        if values[j] < values[k]:
+            k = j
+    return k
 
-def read_sensor_data(ctx) -> None:
+
+def _trim_spread(low, high, drop_low: int, drop_high: int) -> int:
+    """Distance between the largest dropped-low and smallest dropped-high sample.
+
+    ``low`` / ``high`` as left by :func:`_read_trimmed`; both drops must be non-zero.
+    """
+    return high[_smallest(high, drop_high)] - low[_largest(low, drop_low)]
+
+
+def read_sensor_data(ctx, samples=0) -> None:
     """Read ADC values, compute physical units and update system state.
 
-    This function reads raw ADC samples from the hardware through
-    ``ctx.hw_io.adc``, computes trimmed means to mitigate noise,
-    converts them to volts and amps using factors derived from the
-    hardware configuration, updates ``ctx.state.meas`` fields, and
+    This function samples every channel in ``ctx.hw_io.adc`` into the
+    buffers of ``ctx.buffer``, converts the trimmed means to mV / mA,
+    updates ``ctx.state.meas`` fields, derives panel power in mW and
     appends the current snapshot to the measurement history.
 
+    When the dual-core sampler is running the values come from its
+    newest complete bank instead; if it has not completed a new one
+    since the last call, ``meas`` and the history are left unchanged.
+    If the sampler's worker has failed or stalled, this read and the
+    following ones sample on this core again.
+
     Args:
         ctx: The context containing ``state``, ``buffer``, and ``hw_io``.
+        samples: Cap on the total ADC samples of this read (0 = the
+            configured counts), for a quick, noisier read such as the
+            adaptive start-up ramp.  Ignored for the dual-core sampler.
     """
-    state = ctx.state
-    meas = state.meas
-    adc = ctx.hw_io.adc
-    buffer = ctx.buffer
-
-    # Precompute conversion factors. 3.3 V reference, scaled by resistor ratios.
-    pv_factor = (3.3 * config.P_VOLT_RT) / 65535.0
-    pi_factor = (3.3 * config.P_CURRENT) / 65535.0
-    bv_factor = (3.3 * config.B_VOLT_RT) / 65535.0
-
-    # Read panel voltage (26 samples, drop 5 low and 5 high) -> average of 16 values
-    for i in range(26):
-        buffer.pv_buffer[i] = adc.panel_v.read_u16()
-    pv_avg = _trimmed_mean(buffer.pv_buffer, drop_low=5, drop_high=5, shift=4)  # divide by 16
-    # Convert to volts
-    meas.p_voltage = pv_avg * pv_factor
-
-    # Read panel current (84 samples, drop 10 low and 10 high) -> average of 64 values
-    for i in range(84):
-        buffer.pi_buffer[i] = adc.panel_i.read_u16()
-    pi_avg = _trimmed_mean(buffer.pi_buffer, drop_low=10, drop_high=10, shift=6)  # divide by 64
-    # Convert to amps and subtract offset
-    meas.p_current = (pi_avg * pi_factor) - config.P_CURRENT_REV
-    if meas.p_current < 0:
-        meas.p_current = 0.0  # clamp negative currents to zero
-
-    # Read battery voltage (26 samples, drop 5 low and 5 high) -> average of 16 values
-    for i in range(26):
-        buffer.bv_buffer[i] = adc.battery.read_u16()
-    bv_avg = _trimmed_mean(buffer.bv_buffer, drop_low=5, drop_high=5, shift=4)
-    meas.b_voltage = bv_avg * bv_factor
-
-    # Derived power
-    meas.p_power = meas.p_voltage * meas.p_current
+    meas = ctx.state.meas
+    sampler = ctx.hw_io.sampler
+    fresh = False
+    if sampler is not None and sampler.running:
+        fresh = sampler.read_into(meas)
+        if not fresh and sampler.running:
+            return
+    if not fresh:
+        # 2 コア測定を使わないか、第 2 コアのワーカーが止まった
+        ctx.hw_io.adc.acquire(ctx.buffer, meas, samples)
+
+    # Derived power [mW]。22 V * 8 A でも積は small int に収まる
+    meas.p_power_mw = (meas.p_voltage_mv * meas.p_current_ma + 500) // 1000
 
     # Push to history for MPPT or safety algorithms
-    meas.push_history()
\ No newline at end of file
+    meas.push_history()
@@ -0,0 +1,170 @@
+"""Dual-core acquisition: ADC sampling on core 1 with a double-buffered handoff.
+
+When ``config.SENSE_DUAL_CORE`` is enabled, a ``_thread`` worker (which
+MicroPython on the RP2040 runs on the second core) calls
+``AdcChannels.acquire`` over and over, alternating between two
+:class:`SampleBank` objects.  Each bank has its own ``MeasureBuffer``
+and its own copy of the channel values, so the worker never writes
+anything the control loop reads while it is being read.
+
+The handoff is lock-free.  Each bank carries a sequence counter that is
+odd while the worker is filling it and even once it is complete, and
+``latest`` names the bank completed last.  :meth:`DualCoreSampler.read_into`
+copies the latest bank into ``Measurements`` and checks that the
+counter did not change during the copy; if it did, the worker has
+started refilling that bank and the copy is retried from the other one.
+The control loop therefore never waits for the ADC: it always gets the
+newest complete set of values in the time it takes to copy them.
+
+Only the worker may call ``AdcChannels.acquire`` while it runs (the
+channels keep the last raw value, the noise estimate and the learned
+sample time), so startup measurements happen before
+:meth:`DualCoreSampler.start`.
+
+If the worker raises, it stores the exception in ``error`` and clears
+``running``.  A worker that hangs stops completing banks: after
+``config.SENSE_STALE_LIMIT`` reads in a row without a new bank
+:meth:`DualCoreSampler.read_into` sets ``stalled`` and clears
+``running`` too.  Either way ``sensor_ctrl.read_sensor_data`` goes back
+to sampling on core 0.
+
+On the host simulator every conversion of the worker is simulated, so
+with ``config.SENSE_WORKER_PAUSE_US = 0`` a run goes at about real time
+(see ``host/vclock.py``)::
+
+    python -m host.run --hours 0.1 --set SENSE_DUAL_CORE=True --set SENSE_WORKER_PAUSE_US=1000
+"""
+
+import _thread
+import time
+
+import config
+from context.system_buffer import MeasureBuffer
+
+# コピー中に書き換えられたときにやり直す回数
+_READ_RETRIES = 3
+
+
+class SampleBank:
+    """ワーカーが 1 回分の測定を書き込む面。
+
+    属性名は Measurements と同じなので AdcChannels.acquire にそのまま渡せる。
+    """
+
+    def __init__(self, specs=None):
+        if specs is None:
+            specs = config.SENSE_CHANNELS
+        self.names = tuple(spec[0] for spec in specs)
+        self.buffer = MeasureBuffer(specs)
+        # 奇数: 書き込み中 / 偶数: 完成
+        self.seq = 0
+        self.stamp_us = 0
+        self.sample_count = {}
+        self.noise = {}
+        for name in self.names:
+            setattr(self, name, 0)
+            self.sample_count[name] = 0
+            self.noise[name] = 0
+
+
+class DualCoreSampler:
+    """Runs ``adc.acquire`` on core 1 and hands results to core 0.
+
+    Counters: ``banks_done`` (completed acquisitions), ``torn`` (copies
+    retried because the worker overtook the reader) and ``stale`` (reads
+    that found no bank newer than the previous read).  ``error`` is the
+    exception that ended the worker and ``stalled`` tells that the reader
+    gave up on it (both mean ``running`` is False).
+    """
+
+    def __init__(self, adc, specs=None, pause_us=None):
+        self.adc = adc
+        self.banks = (SampleBank(specs), SampleBank(specs))
+        self.pause_us = config.SENSE_WORKER_PAUSE_US if pause_us is None else pause_us
+        # 最後に完成した面の番号（まだ無ければ -1）
+        self.latest = -1
+        self.running = False
+        self.banks_done = 0
+        self.torn = 0
+        self.stale = 0
+        self.error = None
+        self.stalled = False
+        # 新しい面が無かった読み出しの連続回数
+        self._stale_run = 0
+        # 前回読んだ面とその seq
+        self._read_bank = -1
+        self._read_seq = -1
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        _thread.start_new_thread(self._worker, ())
+
+    def stop(self) -> None:
+        """Ask the worker to finish after its current bank."""
+        self.running = False
+
+    def _worker(self) -> None:
+        adc = self.adc
+        w = 0
+        try:
+            while self.running:
+                bank = self.banks[w]
+                bank.seq += 1
+                adc.acquire(bank.buffer, bank)
+                bank.stamp_us = time.ticks_us()
+                bank.seq += 1
+                self.latest = w
+                self.banks_done += 1
+                w ^= 1
+                if self.pause_us > 0:
+                    time.sleep_us(self.pause_us)
+        except Exception as e:
+            # 第 2 コアの例外は誰にも見えないので残しておき、測定を第 1 コアに戻す
+            self.error = e
+        finally:
+            self.running = False
+
+    def read_into(self, meas) -> bool:
+        """Copy the newest complete bank into ``meas``.
+
+        Returns:
+            True if ``meas`` now holds a set of values not returned
+            before; False if there is no new bank (``meas`` unchanged).
+            After ``config.SENSE_STALE_LIMIT`` such reads in a row the
+            worker is given up (``stalled``, ``running`` cleared).
+        """
+        for _ in range(_READ_RETRIES):
+            b = self.latest
+            if b < 0:
+                self._no_new_bank()
+                return False
+            bank = self.banks[b]
+            seq = bank.seq
+            if seq & 1:
+                # 書き直しが始まっている。latest はもう別の面を指している
+                self.torn += 1
+                continue
+            if b == self._read_bank and seq == self._read_seq:
+                self.stale += 1
+                self._no_new_bank()
+                return False
+            for name in bank.names:
+                setattr(meas, name, getattr(bank, name))
+                meas.sample_count[name] = bank.sample_count[name]
+                meas.noise[name] = bank.noise[name]
+            if bank.seq == seq:
+                self._read_bank = b
+                self._read_seq = seq
+                self._stale_run = 0
+                return True
+            self.torn += 1
+        return False
+
+    def _no_new_bank(self) -> None:
+        self._stale_run += 1
+        if self._stale_run >= config.SENSE_STALE_LIMIT:
+            # seq が進まない: ワーカーが止まっている。終わっていれば次の面の後で抜ける
+            self.stalled = True
+            self.running = False
@@ -1,10 +1,160 @@
 import time
+
+import config
+import fast_trip
 from sensor_ctrl import read_sensor_data
 from safety_ctrl import safety_check
 from pwm_ctrl import pwm_control
 from lcd_ctrl import update_lcd
 
 
+def _shutdown_reason(safety) -> str:
+    """遮断の原因: "OVERCURR" / "OVERVOLT"（タイマー遮断の原因を優先）"""
+    if safety.trip_cause == fast_trip.CAUSE_OVERCURRENT:
+        return "OVERCURR"
+    if safety.trip_cause == fast_trip.CAUSE_OVERVOLTAGE:
+        return "OVERVOLT"
+    if safety.overcurrent_count >= safety.overvoltage_count:
+        return "OVERCURR"
+    return "OVERVOLT"
+
+
+def _show_error(ctx, reason) -> None:
+    """原因とその値を LCD に出す"""
+    hw_lcd = ctx.hw_io.lcd
+    if hw_lcd and hw_lcd.alive:
+        meas = ctx.state.meas
+        try:
+            if reason == "OVERCURR":
+                hw_lcd.write(0, f"I:{meas.p_current:4.1f}A")
+            else:
+                hw_lcd.write(0, f"B:{meas.b_voltage:4.1f}V")
+            hw_lcd.write(1, "ERR:" + reason)
+        except Exception:
+            pass
+
+
+def _linear(change: int, predicted: int, noise: int) -> bool:
+    err = change - predicted
+    if err < 0:
+        err = -err
+    if predicted < 0:
+        predicted = -predicted
+    return err <= noise + ((predicted * config.STARTUP_LINEAR_TOL_Q8) >> 8)
+
+
+def _startup_target() -> int:
+    """適応ランプの終点。MPPT の探索範囲の下端より手前では止めない"""
+    target = config.STARTUP_TARGET
+    if target is None or target < config.MPPT_MIN_DUTY:
+        return config.MPPT_MIN_DUTY
+    return target
+
+
+def _ramp_adaptive(ctx, target=None) -> bool:
+    """Raise the duty from ``c_step`` to ``target`` following the response.
+
+    ``target`` defaults to ``config.STARTUP_TARGET``, at least
+    ``config.MPPT_MIN_DUTY``.
+
+    After each step a quick reduced-sample read (``STARTUP_FAST_SAMPLES``)
+    and a safety check.  The change of panel voltage and current is
+    compared with the previous step's, scaled to the new step size: while
+    they match (the plant responds linearly, or not at all) the step
+    doubles up to ``STARTUP_STEP_MAX``, otherwise it halves down to
+    ``STARTUP_STEP_MIN``.  Near the battery voltage / current limits
+    (``STARTUP_MARGIN``) or with a safety warning the minimum step is
+    used.  Once power flows and stops changing for
+    ``STARTUP_SETTLE_STEPS`` steps the ramp ends early and MPPT takes
+    over.  The LCD is refreshed at the scheduler's LCD period only.
+
+    Returns False on a safety shutdown.
+    """
+    state = ctx.state
+    meas = state.meas
+    safety = state.safety
+    if target is None:
+        target = _startup_target()
+    step_min = config.STARTUP_STEP_MIN
+    step_max = config.STARTUP_STEP_MAX
+
+    duty = state.mppts.c_step
+    step = step_min
+    # 直前の刻みとそのときの変化量（最初は「応答なし」を予測する）
+    last_step = 1
+    last_dv = 0
+    last_di = 0
+    settled = 0
+    v = meas.p_voltage_mv
+    i = meas.p_current_ma
+    p = meas.p_power_mw
+    lcd_at = time.ticks_ms()
+    while duty < target:
+        near = (meas.b_voltage_mv >= config.STARTUP_BV_MARGIN_MV
+                or meas.p_current_ma >= config.STARTUP_I_MARGIN_MA
+                or safety.status != "normal")
+        if near:
+            step = step_min
+        if step > target - duty:
+            step = target - duty
+        duty += step
+        state.mppts.c_step = duty
+        pwm_control(ctx)
+        time.sleep_ms(config.STARTUP_SETTLE_MS)
+        read_sensor_data(ctx, config.STARTUP_FAST_SAMPLES)
+        safety_check(ctx)
+        if safety.status == "shutdown":
+            return False
+
+        dv = meas.p_voltage_mv - v
+        di = meas.p_current_ma - i
+        dp = meas.p_power_mw - p
+        v = meas.p_voltage_mv
+        i = meas.p_current_ma
+        p = meas.p_power_mw
+        linear = (_linear(dv, last_dv * step // last_step, config.STARTUP_NOISE_MV)
+                  and _linear(di, last_di * step // last_step, config.STARTUP_NOISE_MA))
+        last_step = step
+        last_dv = dv
+        last_di = di
+        if not linear:
+            step = max(step >> 1, step_min)
+        elif not near:
+            step = min(step << 1, step_max)
+
+        if dp < 0:
+            dp = -dp
+        if p >= config.MPPT_SEEK_POWER_MW and dp <= (p * config.STARTUP_SETTLE_POWER_Q8) >> 8:
+            settled += 1
+            if settled >= config.STARTUP_SETTLE_STEPS:
+                break
+        else:
+            settled = 0
+
+        now = time.ticks_ms()
+        if time.ticks_diff(now, lcd_at) >= config.SCHED_LCD_MS:
+            update_lcd(ctx)
+            lcd_at = now
+
+    # MPPT はフルサンプルの測定から始める
+    read_sensor_data(ctx)
+    safety_check(ctx)
+    return safety.status != "shutdown"
+
+
+def _start_mppt(ctx, seed: int) -> None:
+    """ウォームスタートしたら MPPT の「前回値」を今の点にしておく"""
+    if not seed:
+        return
+    state = ctx.state
+    mppt = state.mppts
+    meas = state.meas
+    mppt.last_duty = mppt.c_step
+    mppt.last_power_mw = meas.p_power_mw
+    mppt.last_voltage_mv = meas.p_voltage_mv
+    mppt.last_current_ma = meas.p_current_ma
+
+
 def handle_startup_sequence(ctx) -> bool:
     """Perform startup procedure.  Returns True on success.
 
@@ -12,6 +162,12 @@ def handle_startup_sequence(ctx) -> bool:
     measurement and safety check, and gradually ramps up the duty cycle
     while monitoring for safety faults.  If a fault is detected, the
     procedure displays an error message and aborts.
+
+    The ramp follows ``config.STARTUP_STAGES``, or with
+    ``config.STARTUP_MODE = "adaptive"`` the measured response
+    (:func:`_ramp_adaptive`).  With a warm-start table (``ctx.warm``,
+    see ``warm_start``) the ramp continues up to the duty learned for
+    the measured battery and open-circuit voltage, and MPPT starts there.
     """
     hw_lcd = ctx.hw_io.lcd
     state = ctx.state
@@ -29,37 +185,36 @@ def handle_startup_sequence(ctx) -> bool:
     safety_check(ctx)
     if state.safety.status == "shutdown":
         # Display error on LCD
-        if hw_lcd and hw_lcd.alive:
-            try:
-                hw_lcd.write(0, f"B:{state.meas.b_voltage:4.1f}V")
-                hw_lcd.write(1, "ERR:OVERVOLT")
-            except Exception:
-                pass
+        _show_error(ctx, _shutdown_reason(state.safety))
         return False
 
+    # duty 0 で測った電圧は開放電圧なので、ここでウォームスタートの値を選ぶ
+    warm = getattr(ctx, "warm", None)
+    seed = 0
+    if warm is not None:
+        seed = warm.seed(state.meas.b_voltage_mv, state.meas.p_voltage_mv)
+        warm.seeded = seed
+
     # Ensure duty starts at zero
     state.mppts.c_step = 0
     pwm_control(ctx)
 
-    # Ramp duty in stages; this mirrors the design document loosely
-    stages = [
-        (0, 5000, 500, 0.06),   # 0→5000 in steps of 500, 60 ms delay
-        (5000, 10000, 500, 0.10),  # 5000→10000 in steps of 500, 100 ms delay
-        (10000, 13000, 200, 0.09), # 10000→13000 in steps of 200, 90 ms delay
-    ]
-    for start, end, step, delay in stages:
+    if config.STARTUP_MODE == "adaptive":
+        if not _ramp_adaptive(ctx, max(_startup_target(), seed)):
+            _show_error(ctx, _shutdown_reason(state.safety))
+            return False
+        _start_mppt(ctx, seed)
+        return True
+
+    # Ramp duty in stages (config.STARTUP_STAGES); this mirrors the design document loosely
+    for start, end, step, delay in config.STARTUP_STAGES:
         for duty in range(start, end + 1, step):
             state.mppts.c_step = duty
             pwm_control(ctx)
             read_sensor_data(ctx)
             safety_check(ctx)
             if state.safety.status == "shutdown":
-                if hw_lcd and hw_lcd.alive:
-                    try:
-                        hw_lcd.write(0, f"B:{state.meas.b_voltage:4.1f}V")
-                        hw_lcd.write(1, "ERR:OVERVOLT")
-                    except Exception:
-                        pass
+                _show_error(ctx, _shutdown_reason(state.safety))
                 return False
             # Optionally update LCD with progress
             update_lcd(ctx)
@@ -67,4 +222,9 @@ def handle_startup_sequence(ctx) -> bool:
 
     # Final delay to settle
     time.sleep(0.1)
+    if seed > state.mppts.c_step:
+        if not _ramp_adaptive(ctx, seed):
+            _show_error(ctx, _shutdown_reason(state.safety))
+            return False
+    _start_mppt(ctx, seed)
     return True
\ No newline at end of file
@@ -1,4 +1,5 @@
 import time
+from array import array
 from machine import Pin, I2C
 
 _CMD_DATA = 0x40
@@ -6,6 +7,27 @@ _CMD_COMMD = 0x00
 _CMD_DISPLAY_ON = 0x0c
 _CMD_CLEAR_DISPLAY = 0x01
 _CMD_RETURN_HOME = 0x02
+# Co=1: 続く 1 バイトだけコマンド、その後にまた制御バイトが来る
+_CTRL_COMMD_ONE = 0x80
+
+# 命令の実行時間 [us]
+_CLEAR_US = 2000
+_HOME_US = 2000
+_CMD_US = 40
+_DATA_US = 45
+
+# 転送バッファの先頭 (制御バイト, アドレス設定, 制御バイト)
+_HDR = 3
+# これ以下の隙間なら転送を分けずに書き直す
+_MERGE_GAP = 4
+
+_COLS = 16
+# 各行の先頭 DDRAM アドレス
+_ROW_ADDR = (0x00, 0x20)
+# 表示できない文字コード（影の初期値に使う）
+_UNKNOWN = 0x00
+# 変換済み文字列キャッシュの件数
+_CACHE_SIZE = 8
 
 _SUJI_HAN = u"0123456789"
 _SUJI_ZEN = u"０１２３４５６７８９"
@@ -17,289 +39,323 @@ _KANA_HAN = u"ｱｲｳｴｵｶｷｸｹｺｻｼｽｾｿﾀﾁﾂﾃﾄﾅﾆ
 _KANA_ZEN = u"アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワヲンァィゥェォャュョッ゛゜ガギグゲゴザジズゼゾダヂヅデドバビブベボパピプペポ"
 _HIRA_ZEN = u"あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをんぁぃぅぇぉゃゅょっ゛゜がぎぐげござじずぜぞだぢづでどばびぶべぼぱぴぷぺぽ"
 
-_CHAR_TABLE = {
-    u'†': [0x11],
-    u'§': [0x12],
-    u'¶': [0x13],
-    u'Γ': [0x14],
-    u'Δ': [0x15],
-    u'θ': [0x16],
-    u'Λ': [0x17],
-    u'Ξ': [0x18],
-    u'Π': [0x19],
-    u'Σ': [0x1a],
-    u'Φ': [0x1c],
-    u'Ψ': [0x1d],
-    u'Ω': [0x1e],
-    u'α': [0x1f],
-
-    u' ': [0x20],
-    u'!': [0x21],
-    u'"': [0x22],
-    u'#': [0x23],
-    u'$': [0x24],
-    u'%': [0x25],
-    u'&': [0x26],
-    u"'": [0x27],
-    u'(': [0x28],
-    u')': [0x29],
-    u'*': [0x2a],
-    u'+': [0x2b],
-    u',': [0x2c],
-    u'-': [0x2d],
-    u'.': [0x2e],
-    u'/': [0x2f],
-
-    u'0': [0x30],
-    u'1': [0x31],
-    u'2': [0x32],
-    u'3': [0x33],
-    u'4': [0x34],
-    u'5': [0x35],
-    u'6': [0x36],
-    u'7': [0x37],
-    u'8': [0x38],
-    u'9': [0x39],
-    u':': [0x3a],
-    u';': [0x3b],
-    u'<': [0x3c],
-    u'=': [0x3d],
-    u'>': [0x3e],
-    u'?': [0x3f],
-
-    u'@': [0x40],
-    u'A': [0x41],
-    u'B': [0x42],
-    u'C': [0x43],
-    u'D': [0x44],
-    u'E': [0x45],
-    u'F': [0x46],
-    u'G': [0x47],
-    u'H': [0x48],
-    u'I': [0x49],
-    u'J': [0x4a],
-    u'K': [0x4b],
-    u'L': [0x4c],
-    u'M': [0x4d],
-    u'N': [0x4e],
-    u'O': [0x4f],
-
-    u'P': [0x50],
-    u'Q': [0x51],
-    u'R': [0x52],
-    u'S': [0x53],
-    u'T': [0x54],
-    u'U': [0x55],
-    u'V': [0x56],
-    u'W': [0x57],
-    u'X': [0x58],
-    u'Y': [0x59],
-    u'Z': [0x5a],
-    u'[': [0x5b],
-    u'¥': [0x5c],
-    u']': [0x5d],
-    u'^': [0x5e],
-    u'_': [0x5f],
-
-    u'`': [0x60],
-    u'a': [0x61],
-    u'b': [0x62],
-    u'c': [0x63],
-    u'd': [0x64],
-    u'e': [0x65],
-    u'f': [0x66],
-    u'g': [0x67],
-    u'h': [0x68],
-    u'i': [0x69],
-    u'j': [0x6a],
-    u'k': [0x6b],
-    u'l': [0x6c],
-    u'm': [0x6d],
-    u'n': [0x6e],
-    u'o': [0x6f],
-
-    u'p': [0x70],
-    u'q': [0x71],
-    u'r': [0x72],
-    u's': [0x73],
-    u't': [0x74],
-    u'u': [0x75],
-    u'v': [0x76],
-    u'w': [0x77],
-    u'x': [0x78],
-    u'y': [0x79],
-    u'z': [0x7a],
-    u'{': [0x7b],
-    u'|': [0x7c],
-    u'}': [0x7d],
-    u'→': [0x7e],
-    u'←': [0x7f],
-
-    u'。': [0xa1],
-    u'「': [0xa2],
-    u'」': [0xa3],
-    u'、': [0xa4],
-    u'・': [0xa5],
-    
-    u'ヲ': [0xa6],
-    u"ァ": [0xa7],
-    u'ィ': [0xa8],
-    u'ゥ': [0xa9],
-    u'ェ': [0xaa],
-    u'ォ': [0xab],
-    u'ャ': [0xac],
-    u'ュ': [0xad],
-    u'ョ': [0xae],
-    u'ッ': [0xaf],
-
-    u'ー': [0xb0],
-    u'ア': [0xb1],
-    u'イ': [0xb2],
-    u'ウ': [0xb3],
-    u'エ': [0xb4],
-    u'オ': [0xb5],
-    u'カ': [0xb6],
-    u'キ': [0xb7],
-    u'ク': [0xb8],
-    u'ケ': [0xb9],
-    u'コ': [0xba],
-    u'サ': [0xbb],
-    u'シ': [0xbc],
-    u'ス': [0xbd],
-    u'セ': [0xbe],
-    u'ソ': [0xbf],
-
-    u'タ': [0xc0],
-    u'チ': [0xc1],
-    u'ツ': [0xc2],
-    u'テ': [0xc3],
-    u'ト': [0xc4],
-    u'ナ': [0xc5],
-    u'ニ': [0xc6],
-    u'ヌ': [0xc7],
-    u'ネ': [0xc8],
-    u'ノ': [0xc9],
-    u'ハ': [0xca],
-    u'ヒ': [0xcb],
-    u'フ': [0xcc],
-    u'ヘ': [0xcd],
-    u'ホ': [0xce],
-    u'マ': [0xcf],
-
-    u'ミ': [0xd0],
-    u'ム': [0xd1],
-    u'メ': [0xd2],
-    u'モ': [0xd3],
-    u'ヤ': [0xd4],
-    u'ユ': [0xd5],
-    u'ヨ': [0xd6],
-    u'ラ': [0xd7],
-    u'リ': [0xd8],
-    u'ル': [0xd9],
-    u'レ': [0xda],
-    u'ロ': [0xdb],
-    u'ワ': [0xdc],
-    u'ン': [0xdd],
-    u'゛': [0xde],
-    u'゜': [0xdf],
-
-    u'ガ': [0xb6, 0xde],
-    u'ギ': [0xb7, 0xde],
-    u'グ': [0xb8, 0xde],
-    u'ゲ': [0xb9, 0xde],
-    u'ゴ': [0xba, 0xde],
-    u'ザ': [0xbb, 0xde],
-    u'ジ': [0xbc, 0xde],
-    u'ズ': [0xbd, 0xde],
-    u'ゼ': [0xbe, 0xde],
-    u'ゾ': [0xbf, 0xde],
-    u'ダ': [0xc0, 0xde],
-    u'ヂ': [0xc1, 0xde],
-    u'ヅ': [0xc2, 0xde],
-    u'デ': [0xc3, 0xde],
-    u'ド': [0xc4, 0xde],
-    u'バ': [0xca, 0xde],
-    u'ビ': [0xcb, 0xde],
-    u'ブ': [0xcc, 0xde],
-    u'ベ': [0xcd, 0xde],
-    u'ボ': [0xce, 0xde],
-    u'パ': [0xca, 0xdf],
-    u'ピ': [0xcb, 0xdf],
-    u'プ': [0xcc, 0xdf],
-    u'ペ': [0xcd, 0xdf],
-    u'ポ': [0xce, 0xdf],
-    
-    u'＇':[0xf0],
-    u'"':[0xf1],
-    u'°':[0xf2],
-    u'×': [0xf7],
-    u'÷': [0xf8],
-    u'≧': [0xf9],
-    u'≦': [0xfa],
-    u'≪': [0xfb],
-    u'≫': [0xfc],
-    u'≠': [0xfd],
-    u'√': [0xfe],
-    u'￣': [0xff],
-}
+# 文字コード表。(文字列, 先頭コード) で、文字列の i 文字目がコード 先頭+i。
+# 後の行が優先（'"' は 0xf1 になる。旧 _CHAR_TABLE の辞書リテラルと同じ）。
+_CHAR_RUNS = (
+    (u"†§¶ΓΔθΛΞΠΣ", 0x11),
+    (u"ΦΨΩα", 0x1c),
+    (u" !\"#$%&'()*+,-./0123456789:;<=>?"
+     u"@ABCDEFGHIJKLMNOPQRSTUVWXYZ[¥]^_"
+     u"`abcdefghijklmnopqrstuvwxyz{|}→←", 0x20),
+    (u"。「」、・ヲァィゥェォャュョッ"
+     u"ーアイウエオカキクケコサシスセソ"
+     u"タチツテトナニヌネノハヒフヘホマ"
+     u"ミムメモヤユヨラリルレロワン゛゜", 0xa1),
+    (u"＇\"°", 0xf0),
+    (u"×÷≧≦≪≫≠√￣", 0xf7),
+)
+# 濁点・半濁点付きカナは (元のカナ, 濁点/半濁点) の 2 バイト
+_DAKU_ZEN = u"ガギグゲゴザジズゼゾダヂヅデドバビブベボ"
+_DAKU_BASE = u"カキクケコサシスセソタチツテトハヒフヘホ"
+_HANDAKU_ZEN = u"パピプペポ"
+_HANDAKU_BASE = u"ハヒフヘホ"
+
+# 全角/ひらがな/半角カナ → 変換先の文字。前の組ほど優先。
+_ALIASES = (
+    (_SUJI_ZEN, _SUJI_HAN),
+    (_ALPH_ZEN, _ALPH_HAN),
+    (_KIGO_ZEN, _KIGO_HAN),
+    (_HIRA_ZEN, _KANA_ZEN),
+    (_KANA_HAN, _KANA_ZEN),
+)
+
+# 0x20..0x7f の文字は表引きだけで済ませる（0 は表示できない文字）
+_ASCII = bytearray(0x60)
+# それ以外は コードポイント昇順の _XCP と、対応する値 _XVAL
+# (下位バイト = 1 文字目, 上位バイト = 2 文字目 or 0)
+_XCP = array("H")
+_XVAL = array("H")
+
+
+def _build_tables():
+    """_CHAR_RUNS と _ALIASES を畳み込んで _ASCII / _XCP / _XVAL を作る。"""
+    direct = {}
+    for chars, first in _CHAR_RUNS:
+        for i in range(len(chars)):
+            direct[chars[i]] = first + i
+    for i in range(len(_DAKU_ZEN)):
+        direct[_DAKU_ZEN[i]] = direct[_DAKU_BASE[i]] | 0xde00
+    for i in range(len(_HANDAKU_ZEN)):
+        direct[_HANDAKU_ZEN[i]] = direct[_HANDAKU_BASE[i]] | 0xdf00
+
+    folded = dict(direct)
+    # 優先度の低い組から上書きする。変換先が表に無い文字は表示しない。
+    for i in range(len(_ALIASES) - 1, -1, -1):
+        src, dst = _ALIASES[i]
+        for k in range(len(src)):
+            value = direct.get(dst[k], 0)
+            if value:
+                folded[src[k]] = value
+            else:
+                folded.pop(src[k], None)
+
+    ext = []
+    for c, value in folded.items():
+        cp = ord(c)
+        if 0x20 <= cp < 0x80:
+            _ASCII[cp - 0x20] = value
+        else:
+            ext.append((cp, value))
+    ext.sort()
+    for cp, value in ext:
+        _XCP.append(cp)
+        _XVAL.append(value)
+
+
+_build_tables()
+# 変換表に畳み込んだので元の文字列は捨てる
+del _CHAR_RUNS, _DAKU_ZEN, _DAKU_BASE, _HANDAKU_ZEN, _HANDAKU_BASE, _ALIASES
+del _SUJI_HAN, _SUJI_ZEN, _ALPH_HAN, _ALPH_ZEN, _KIGO_HAN, _KIGO_ZEN
+del _KANA_HAN, _KANA_ZEN, _HIRA_ZEN
+
+
+def _lookup(cp):
+    """コードポイントを文字コード (2 バイト分を詰めた値) に変換。無ければ 0。"""
+    if 0x20 <= cp < 0x80:
+        return _ASCII[cp - 0x20]
+    lo = 0
+    hi = len(_XCP)
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        if _XCP[mid] < cp:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < len(_XCP) and _XCP[lo] == cp:
+        return _XVAL[lo]
+    return 0
+
+
+def encode(da, line):
+    """文字列を文字コードに変換して line に詰め、残りを空白で埋める。
+
+    表示できない文字は飛ばす。16 セルを超えた分は捨てる。
+    """
+    n = 0
+    cols = len(line)
+    for c in da:
+        value = _lookup(ord(c))
+        if not value:
+            continue
+        if n >= cols:
+            break
+        line[n] = value & 0xFF
+        n += 1
+        value >>= 8
+        if value:
+            if n >= cols:
+                break
+            line[n] = value
+            n += 1
+    while n < cols:
+        line[n] = 0x20
+        n += 1
+
+
+def encode_ascii(src, line):
+    """ASCII のバイト列を文字コードに変換して line に詰める（確保なし）。
+
+    表示できない文字は空白にする。足りない分は空白、はみ出た分は捨てる。
+    """
+    n = len(src)
+    for i in range(len(line)):
+        b = src[i] if i < n else 0x20
+        v = _ASCII[b - 0x20] if 0x20 <= b < 0x80 else 0
+        line[i] = v if v else 0x20
+
+
+class _EncodeCache:
+    """変換済みの行を覚えておく小さな LRU キャッシュ。
+
+    固定の文言 ("System Booting..", "STOP " など) や変化しない表示を
+    毎回変換し直さないためのもの。値のバッファは最初に確保して使い回す。
+    """
+
+    def __init__(self, size):
+        self._slots = {}
+        self._keys = [None] * size
+        self._bufs = [bytearray(_COLS) for _ in range(size)]
+        self._stamp = [0] * size
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, da):
+        self._clock = (self._clock + 1) & 0x3FFFFFFF
+        slot = self._slots.get(da)
+        if slot is not None:
+            self._stamp[slot] = self._clock
+            self.hits += 1
+            return self._bufs[slot]
+        self.misses += 1
+        # 一番長く使っていない枠を使い回す
+        stamp = self._stamp
+        slot = 0
+        for i in range(1, len(stamp)):
+            if stamp[i] < stamp[slot]:
+                slot = i
+        old = self._keys[slot]
+        if old is not None:
+            del self._slots[old]
+        buf = self._bufs[slot]
+        encode(da, buf)
+        self._keys[slot] = da
+        self._slots[da] = slot
+        stamp[slot] = self._clock
+        return buf
+
+
+_cache = _EncodeCache(_CACHE_SIZE)
+
 
 class LCD():
+    """SO1602A ドライバ。
+
+    表示内容の影 (shadow) を 2 行分持っていて、``write`` では前回から
+    変わったセルだけを送る。変化したセルのまとまりごとに
+    「DDRAM アドレス設定 + 連続データ (制御バイト 0x40)」を 1 回の
+    I2C 転送で送る。
+
+    固定の sleep_ms(1) は使わず、コントローラの実行時間ぶんだけ
+    次の転送を待つ。200kHz では 1 バイトの転送 (45us) が 1 文字の
+    書き込み時間より長いので、連続データの途中で待つ必要はない。
+    """
+
     def __init__(self, i2c_no, sda_pin, scl_pin, slave_addr):
         self._slave_addr = slave_addr
         self._i2c = I2C(i2c_no, sda=Pin(sda_pin), scl=Pin(scl_pin), freq=200000)
+        # 画面に出ている文字コード。_UNKNOWN は「不明なので必ず書く」印
+        self._shadow = bytearray([_UNKNOWN]) * (_COLS * 2)
+        # DDRAM アドレスカウンタ（不明なら None）
+        self._cursor = None
+        # 送信バッファ: [0x80, 0x80|addr, 0x40, data * 16]
+        self._buf = bytearray(_HDR + _COLS)
+        self._buf[2] = _CMD_DATA
+        mv = memoryview(self._buf)
+        # 長さ別のビューを先に作っておき、送信のたびに確保しない
+        self._views = [mv[:n] for n in range(_HDR + _COLS + 1)]
+        self._data_views = [mv[_HDR - 1:_HDR + n] for n in range(_COLS + 1)]
+        self._one = bytearray(1)
+        # bytes/bytearray で渡された行の変換先
+        self._line = bytearray(_COLS)
+        # この時刻 (ticks_us) まではコントローラが処理中
+        self._ready_at = time.ticks_us()
+
+    def _wait_ready(self):
+        d = time.ticks_diff(self._ready_at, time.ticks_us())
+        if d > 0:
+            time.sleep_us(d)
+
+    def busy_us(self):
+        """コントローラがあと何 us 処理中か（0 なら次の転送をすぐ送れる）。"""
+        d = time.ticks_diff(self._ready_at, time.ticks_us())
+        return d if d > 0 else 0
+
+    def _busy_for(self, us):
+        self._ready_at = time.ticks_add(time.ticks_us(), us)
 
     def writeData(self, data):
-        self._i2c.writeto_mem(self._slave_addr, _CMD_DATA, bytes([data & 0xFF]))
-        time.sleep_ms(1)
+        self._wait_ready()
+        self._one[0] = data & 0xFF
+        self._i2c.writeto_mem(self._slave_addr, _CMD_DATA, self._one)
+        self._busy_for(_DATA_US)
+        if self._cursor is not None:
+            self._cursor += 1
 
     def writeCommd(self, commd):
-        self._i2c.writeto_mem(self._slave_addr, _CMD_COMMD, bytes([commd & 0xFF]))
-        time.sleep_ms(1)
+        self._wait_ready()
+        self._one[0] = commd & 0xFF
+        self._i2c.writeto_mem(self._slave_addr, _CMD_COMMD, self._one)
+        self._busy_for(_CMD_US)
+        if commd & 0x80:
+            self._cursor = commd & 0x7F
 
     def clear(self):
         self.writeCommd(_CMD_CLEAR_DISPLAY)
-        time.sleep_ms(10)
+        self._busy_for(_CLEAR_US)
+        for i in range(len(self._shadow)):
+            self._shadow[i] = 0x20
+        self._cursor = 0
 
     def home(self):
         self.writeCommd(_CMD_RETURN_HOME)
-        time.sleep_ms(1)
+        self._busy_for(_HOME_US)
+        self._cursor = 0
 
     def on(self):
         self.writeCommd(_CMD_DISPLAY_ON)
-        time.sleep_ms(1)
+
+    def invalidate(self):
+        """影を捨てて、次の write で全セルを書き直させる。"""
+        for i in range(len(self._shadow)):
+            self._shadow[i] = _UNKNOWN
+        self._cursor = None
 
     def write(self, L, da):
-        if type(da) is int :
+        """L 行目に da を表示する。
+
+        str は変換キャッシュを通す。bytes/bytearray は ASCII として
+        その場で変換するので、呼ぶ側がバッファを使い回せば何も確保しない。
+        """
+        row = 0 if L == 0 else 1
+        t = type(da)
+        if t is bytearray or t is bytes:
+            encode_ascii(da, self._line)
+            self._flush(row, self._line)
+            return
+        if t is int:
             da = str(da)
-        ab = len(da)
-        for i in range(16-ab):
-            da += " "
-        if L == 0:
-            self.writeCommd(0x80)
+        self._flush(row, _cache.get(da))
+
+    def _flush(self, row, line):
+        """影と比べて変わったセルだけ送る。
+
+        変化したセル同士の間が _MERGE_GAP セル以下なら、間の変わって
+        いないセルも書き直して 1 回の転送にまとめる（転送を分けると
+        START/アドレス/制御バイトのぶん余計にかかるため）。
+        """
+        shadow = self._shadow
+        base = row * _COLS
+        col = 0
+        while col < _COLS:
+            if shadow[base + col] == line[col]:
+                col += 1
+                continue
+            start = col
+            end = col
+            col += 1
+            while col < _COLS and col - end <= _MERGE_GAP + 1:
+                if shadow[base + col] != line[col]:
+                    end = col
+                col += 1
+            self._send_run(_ROW_ADDR[row] + start, line, start, end + 1)
+            for k in range(start, end + 1):
+                shadow[base + k] = line[k]
+            col = end + 1
+
+    def _send_run(self, pos, line, start, stop):
+        """line[start:stop] を DDRAM の pos から 1 回の転送で書く。"""
+        buf = self._buf
+        n = stop - start
+        for k in range(n):
+            buf[_HDR + k] = line[start + k]
+        self._wait_ready()
+        if self._cursor == pos:
+            # カーソルが既にそこにあればアドレス設定は省く
+            self._i2c.writeto(self._slave_addr, self._data_views[n])
         else:
-            self.writeCommd(0X20+0x80)
-        for c in da:
-            # 全角数字を半角に変換
-            if c in _SUJI_ZEN:
-                index = _SUJI_ZEN.index(c)
-                c = _SUJI_HAN[index]
-            # 全角アルファベットを半角に変換
-            elif c in _ALPH_ZEN:
-                index = _ALPH_ZEN.index(c)
-                c = _ALPH_HAN[index]
-            # 全角記号を半角に変換
-            elif c in _KIGO_ZEN:
-                index = _KIGO_ZEN.index(c)
-                c = _KIGO_HAN[index]
-            # ひらがなを全角カタカナに変換
-            elif c in _HIRA_ZEN:
-                index = _HIRA_ZEN.index(c)
-                c = _KANA_ZEN[index]
-            # 半角カタカナを全角カタカナに変換
-            elif c in _KANA_HAN:
-                index = _KANA_HAN.index(c)
-                c = _KANA_ZEN[index]
-            # 文字を番号に変換
-            if c in _CHAR_TABLE:
-                for number in _CHAR_TABLE[c]:
-                    self.writeData(number)
+            buf[0] = _CTRL_COMMD_ONE
+            buf[1] = 0x80 | pos
+            self._i2c.writeto(self._slave_addr, self._views[_HDR + n])
+        self._busy_for(_DATA_US)
+        self._cursor = pos + n
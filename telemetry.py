@@ -0,0 +1,195 @@
+"""Binary telemetry frames over USB serial.
+
+With ``config.TELEMETRY_MS`` set, ``main`` sends one fixed-size frame
+per period to ``sys.stdout`` (the USB CDC port on the Pico) instead of
+anything ``print`` would have to format.  A frame is packed with
+``struct.pack_into`` into a preallocated buffer:
+
+====  ==============  ===================================================
+type  field           meaning
+====  ==============  ===================================================
+2s    sync            ``b"\\xa5\\x5a"``
+B     version         :data:`VERSION`
+B     seq             frame counter (wraps at 256; gaps = lost frames)
+I     ticks_ms        ``time.ticks_ms()`` when the frame was packed
+H     p_voltage_mv    panel voltage [mV]
+H     p_current_ma    panel current [mA]
+H     b_voltage_mv    battery voltage [mV]
+I     p_power_mw      panel power [mW]
+H     duty            applied PWM duty
+H     c_step          duty requested by MPPT
+b     direction       MPPT direction (-1 / 1)
+B     status          safety status (0 normal, 1 warning, 2 shutdown)
+B     trip_cause      ``safety.trip_cause``
+x
+H     overcurrent     ``safety.overcurrent_count``
+H     overvoltage     ``safety.overvoltage_count``
+H     dropped         frames dropped so far (saturates)
+5H    *_us            last time of each stage from ``ctx.profile``
+                      (``config.PROFILE_STAGES``), 0 without it
+I     crc32           CRC-32 of everything after the sync bytes
+====  ==============  ===================================================
+
+Sending never waits for the host.  Before writing, the port is polled
+for ``POLLOUT`` with a zero timeout; if it cannot take data (nobody
+reading, buffer full) the frame is dropped and counted.  ``POLLOUT``
+only means some room, not room for a whole frame, so ``write`` may take
+part of it: the rest is written first thing next period, before a new
+frame is packed, so a frame on the wire is never cut short by the
+next one (that period's frame is dropped if the rest does not fit
+either).  Text from
+``print`` shares the port; the receiver finds frames by sync bytes and
+CRC and skips everything else.  ``check_frame`` decodes a frame; see
+``host/telemetry_rx.py`` for the receiver.
+
+The CRC value is the only object a frame creates on MicroPython (it
+does not fit a small int), plus the view of the rest after a partial
+write; everything else is written in place.
+"""
+
+import struct
+import sys
+import time
+
+try:
+    from binascii import crc32
+except ImportError:  # 古い MicroPython
+    from ubinascii import crc32
+
+try:
+    import select
+except ImportError:
+    try:
+        import uselect as select
+    except ImportError:
+        select = None
+
+SYNC = b"\xa5\x5a"
+VERSION = 1
+FRAME = "<2sBBIHHHIHHbBBxHHH5HI"
+FRAME_SIZE = 46
+FIELDS = ("seq", "ticks_ms", "p_voltage_mv", "p_current_ma", "b_voltage_mv", "p_power_mw",
+          "duty", "c_step", "direction", "status", "trip_cause",
+          "overcurrent", "overvoltage", "dropped",
+          "sensor_us", "safety_us", "mppt_us", "pwm_us", "lcd_us")
+_STATUS_CODES = {"normal": 0, "warning": 1, "shutdown": 2}
+
+
+def _u16(x) -> int:
+    if x < 0:
+        return 0
+    if x > 65535:
+        return 65535
+    return x
+
+
+def check_frame(buf, offset=0):
+    """Return the field tuple (``FIELDS``) of a valid frame at ``offset``, else ``None``."""
+    if len(buf) - offset < FRAME_SIZE:
+        return None
+    values = struct.unpack_from(FRAME, buf, offset)
+    if values[0] != SYNC or values[1] != VERSION:
+        return None
+    mv = memoryview(buf)
+    if crc32(mv[offset + 2:offset + FRAME_SIZE - 4]) & 0xFFFFFFFF != values[-1]:
+        return None
+    return values[2:-1]
+
+
+class Telemetry:
+    """Packs and sends telemetry frames without blocking.
+
+    Args:
+        stream: Binary stream to write to (default ``sys.stdout.buffer``,
+            or ``sys.stdout`` where there is no ``buffer``).
+    """
+
+    def __init__(self, stream=None):
+        if stream is None:
+            stream = getattr(sys.stdout, "buffer", sys.stdout)
+        self.stream = stream
+        self._frame = bytearray(FRAME_SIZE)
+        self._view = memoryview(self._frame)
+        self._body = self._view[2:FRAME_SIZE - 4]
+        # 書けたバイト数（0 なら書きかけのフレームは無い）
+        self._pos = 0
+        self.seq = 0
+        self.sent = 0
+        self.dropped = 0
+        self._ready = None
+        if select is not None:
+            try:
+                poll = select.poll()
+                poll.register(stream, select.POLLOUT)
+            except (AttributeError, OSError, TypeError, ValueError):
+                poll = None
+            if poll is not None:
+                # MicroPython の ipoll は結果のリストを作らない
+                self._ready = getattr(poll, "ipoll", poll.poll)
+
+    def writable(self) -> bool:
+        if self._ready is None:
+            return True
+        for _, event in self._ready(0):
+            if event & select.POLLOUT:
+                return True
+        return False
+
+    def pack(self, ctx) -> None:
+        """Pack the current state into the frame buffer."""
+        state = ctx.state
+        meas = state.meas
+        safety = state.safety
+        profile = getattr(ctx, "profile", None)
+        if profile is not None:
+            last = profile.last
+            t0 = _u16(last[0])
+            t1 = _u16(last[1])
+            t2 = _u16(last[2])
+            t3 = _u16(last[3])
+            t4 = _u16(last[4])
+        else:
+            t0 = t1 = t2 = t3 = t4 = 0
+        pw = meas.p_power_mw
+        struct.pack_into(FRAME, self._frame, 0, SYNC, VERSION, self.seq, time.ticks_ms(),
+                         _u16(meas.p_voltage_mv), _u16(meas.p_current_ma), _u16(meas.b_voltage_mv),
+                         pw if pw > 0 else 0,
+                         _u16(state.pwms.applied_duty_u16), _u16(state.mppts.c_step),
+                         state.mppts.direction, _STATUS_CODES.get(safety.status, 2),
+                         safety.trip_cause,
+                         _u16(safety.overcurrent_count), _u16(safety.overvoltage_count),
+                         _u16(self.dropped), t0, t1, t2, t3, t4, 0)
+        struct.pack_into("<I", self._frame, FRAME_SIZE - 4, crc32(self._body) & 0xFFFFFFFF)
+
+    def send(self, ctx) -> None:
+        """Send one frame, or drop it if the port cannot take it right now."""
+        self.seq = (self.seq + 1) & 0xFF
+        if self._pos:
+            # 前のフレームが途中までしか書けていない。新しいフレームより先に残りを書き切る
+            if not self.writable() or not self._write_rest():
+                self.dropped += 1
+                return
+        if not self.writable():
+            self.dropped += 1
+            return
+        self.pack(ctx)
+        if not self._write_rest() and not self._pos:
+            # 1 バイトも書けなかった。途中まで書けた分は次の周期に続きを書く
+            self.dropped += 1
+
+    def _write_rest(self) -> bool:
+        """Write what is left of the frame; True once all of it is out."""
+        pos = self._pos
+        try:
+            n = self.stream.write(self._view[pos:] if pos else self._frame)
+        except OSError:
+            n = 0
+        # None / 0 は書けなかった（ノンブロッキングのストリーム）
+        if n:
+            pos += n
+        if pos >= FRAME_SIZE:
+            self._pos = 0
+            self.sent += 1
+            return True
+        self._pos = pos
+        return False
@@ -0,0 +1,133 @@
+"""Execution time profiling per control-loop stage.
+
+With ``config.PROFILE_STAGES`` enabled, ``main`` wraps every stage
+(sensor, safety, MPPT, PWM, LCD) with :meth:`TimeProbe.wrap`, which
+times each run with ``time.ticks_us``.  Per stage the probe keeps, in
+preallocated arrays indexed like ``names``:
+
+* ``last``, ``min`` and ``max`` execution time [us] and the mean
+  ``total // runs``.  When ``total`` reaches 2^29 both are halved, so
+  the numbers stay small ints; after long uptimes the mean therefore
+  weighs recent runs more.
+* a histogram over ``config.PROFILE_BUCKETS_US`` in ``hist`` (row per
+  stage): bin ``k`` counts runs shorter than ``edges[k]`` and not
+  shorter than ``edges[k - 1]``, the last bin everything longer.
+
+Recording a run is two ``ticks_us`` calls and a few small-int array
+updates, so it allocates nothing and can stay enabled in the field.
+When the option is off nothing is wrapped and the loop pays nothing.
+
+:meth:`TimeProbe.dump` prints the table (``ctx.profile.dump()`` from
+the REPL); with ``config.PROFILE_LCD_PAGE_MS`` the LCD alternates
+between the normal page and the stage means (``lcd_ctrl.show_profile``).
+
+On the host the clock is virtual: the sensor and LCD stages take the
+time the board models for ADC reads and I2C transfers, pure computation
+takes none.  See ``host/profile_stages.py``.
+"""
+
+import time
+from array import array
+
+import config
+
+# main の各ステージ（alloc_probe と同じ順）
+STAGES = ("sensor", "safety", "mppt", "pwm", "lcd")
+
+# total がこれに達したら total と runs を半分にする
+_TOTAL_LIMIT = 0x20000000
+_MIN_INIT = 0x3FFFFFFF
+
+
+class TimeProbe:
+    """Per-stage execution time counters and histograms.
+
+    Args:
+        names: Stage names; ``wrap(i, fn)`` records into slot ``i``.
+        edges: Histogram bin edges [us], ascending.
+    """
+
+    def __init__(self, names=STAGES, edges=None):
+        if edges is None:
+            edges = config.PROFILE_BUCKETS_US
+        n = len(names)
+        self.names = names
+        self.edges = array("i", edges)
+        self.bins = len(edges) + 1
+        self.last = array("i", bytes(4 * n))
+        self.min = array("i", bytes(4 * n))
+        self.max = array("i", bytes(4 * n))
+        self.total = array("i", bytes(4 * n))
+        self.runs = array("i", bytes(4 * n))
+        self.hist = array("i", bytes(4 * n * self.bins))
+        self._mark = 0
+        self.reset()
+
+    def reset(self) -> None:
+        for i in range(len(self.names)):
+            self.last[i] = 0
+            self.min[i] = _MIN_INIT
+            self.max[i] = 0
+            self.total[i] = 0
+            self.runs[i] = 0
+        for k in range(len(self.hist)):
+            self.hist[k] = 0
+
+    def start(self) -> None:
+        self._mark = time.ticks_us()
+
+    def stop(self, i: int) -> None:
+        us = time.ticks_diff(time.ticks_us(), self._mark)
+        self.last[i] = us
+        if us < self.min[i]:
+            self.min[i] = us
+        if us > self.max[i]:
+            self.max[i] = us
+        total = self.total[i] + us
+        runs = self.runs[i] + 1
+        if total >= _TOTAL_LIMIT:
+            total >>= 1
+            runs = (runs + 1) >> 1
+        self.total[i] = total
+        self.runs[i] = runs
+        edges = self.edges
+        k = 0
+        n = len(edges)
+        while k < n and us >= edges[k]:
+            k += 1
+        self.hist[i * self.bins + k] += 1
+
+    def wrap(self, i: int, fn):
+        """Return ``fn`` wrapped so that its execution time goes to slot ``i``."""
+        def timed(ctx):
+            self.start()
+            fn(ctx)
+            self.stop(i)
+        return timed
+
+    def mean(self, i: int) -> int:
+        runs = self.runs[i]
+        return self.total[i] // runs if runs else 0
+
+    def count(self, i: int) -> int:
+        """Runs recorded in the histogram of stage ``i``."""
+        base = i * self.bins
+        n = 0
+        for k in range(self.bins):
+            n += self.hist[base + k]
+        return n
+
+    def dump(self) -> None:
+        print("stage     last    min   mean    max   runs  [us]")
+        for i in range(len(self.names)):
+            runs = self.count(i)
+            lo = self.min[i] if runs else 0
+            print("%-7s %6d %6d %6d %6d %6d" % (self.names[i], self.last[i], lo, self.mean(i),
+                                                self.max[i], runs))
+        head = "".join("%7s" % ("<%d" % e) for e in self.edges)
+        print("histogram" + head + "%8s" % (">=%d" % self.edges[-1]))
+        for i in range(len(self.names)):
+            base = i * self.bins
+            print("%-9s" % self.names[i] + "".join("%7d" % self.hist[base + k]
+                                                   for k in range(self.bins - 1))
+                  + "%8d" % self.hist[base + self.bins - 1])
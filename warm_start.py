@@ -0,0 +1,191 @@
+"""Warm start: remember the MPP duty and start from it after a reset.
+
+With ``config.WARM_START`` the controller keeps a small table of the
+duty it settled on while tracking, one cell per battery voltage band
+(``config.WARM_BV_BANDS_MV``) and MPP voltage band
+(``config.WARM_PV_BANDS_MV``); the duty at the MPP of a buck charger is
+mostly a function of these two.  Every ``config.WARM_SAMPLE_MS``
+:meth:`WarmStart.update` blends the applied duty into the cell of the
+present operating point (``new = (3 * old + duty) / 4``), but only while
+the safety status is normal, no global scan is running and the panel
+delivers at least ``config.MPPT_SEEK_POWER``.
+
+The table lives in RAM as one ``array('H')`` (0 = no entry yet) and is
+written to ``config.WARM_PATH`` only when a cell has moved by
+``config.WARM_MIN_CHANGE`` or more since the last save, and then at most
+every ``config.WARM_SAVE_MS`` (10 minutes by default: a few kilobytes a
+day, nothing for littlefs wear levelling).  The time since the last
+save is added up from the ``ticks_ms`` difference of each update, so it
+does not go wrong after ``ticks_ms``'s half period (about 6 days).  A
+write goes to a temporary file that is renamed over the old one, and
+the file carries a CRC-32 and a checksum of the band layout, so a power
+cut during the write or changed bands leave the old table or an empty
+one, never a torn one.  Keeping the old table relies on the rename
+replacing the file in one step, which littlefs (the Pico's default
+filesystem) does; on FAT, MicroPython removes the old file first, so a
+power cut there can leave no table, which only costs the warm start.
+
+At boot the duty is still 0, so the panel voltage measured by the
+startup sequence is the open-circuit voltage; the MPP voltage band is
+estimated as ``Voc * config.WARM_VMP_RATIO``.  :meth:`WarmStart.seed`
+returns the duty of that cell or, if it is empty, of the nearest filled
+one, and ``sequence_first`` ramps up to it instead of leaving the hill
+climber to find the MPP from ``MPPT_MIN_DUTY``.
+"""
+
+import os
+import struct
+import time
+from array import array
+
+try:
+    from binascii import crc32
+except ImportError:  # 古い MicroPython
+    from ubinascii import crc32
+
+import config
+from context.system_state import ScanState
+
+MAGIC = b"MPW1"
+# magic, バッテリー電圧のバンド数, パネル電圧のバンド数, 予備, バンド区切りの CRC-32
+HEADER = "<4sBBHI"
+HEADER_SIZE = 12
+
+
+def band(edges, x: int) -> int:
+    """Index of the band of ``x``: the number of ``edges`` not above it."""
+    k = 0
+    n = len(edges)
+    while k < n and x >= edges[k]:
+        k += 1
+    return k
+
+
+class WarmStart:
+    """Table of learned MPP duties, persisted to flash.
+
+    Args:
+        path / bv_edges / pv_edges / save_ms: Default to the
+            ``config.WARM_*`` values.
+    """
+
+    def __init__(self, path=None, bv_edges=None, pv_edges=None, save_ms=None):
+        self.path = config.WARM_PATH if path is None else path
+        self.bv_edges = config.WARM_BV_BANDS_MV if bv_edges is None else bv_edges
+        self.pv_edges = config.WARM_PV_BANDS_MV if pv_edges is None else pv_edges
+        self.save_ms = config.WARM_SAVE_MS if save_ms is None else save_ms
+        self.rows = len(self.bv_edges) + 1
+        self.cols = len(self.pv_edges) + 1
+        n = self.rows * self.cols
+        self.duty = array("H", bytes(2 * n))
+        # フラッシュにある値（変化量の判定用）
+        self._saved = array("H", bytes(2 * n))
+        self._file = bytearray(HEADER_SIZE + 2 * n + 4)
+        self._layout = crc32(bytes(array("H", tuple(self.bv_edges) + tuple(self.pv_edges))))
+        self.dirty = False
+        self.saves = 0
+        self.write_errors = 0
+        # 今回の起動で使った値（sequence_first が入れる。0 なら使っていない）
+        self.seeded = 0
+        # 前回の保存からの経過 [ms]（save_ms で頭打ち）と、それを足した時刻
+        self._since_ms = 0
+        self._last_ms = time.ticks_ms()
+        self.loaded = self.load()
+
+    def index(self, b_voltage_mv: int, p_voltage_mv: int) -> int:
+        return band(self.bv_edges, b_voltage_mv) * self.cols + band(self.pv_edges, p_voltage_mv)
+
+    def load(self) -> bool:
+        """Read the table from flash; returns False (table empty) if it is missing or invalid."""
+        buf = self._file
+        try:
+            with open(self.path, "rb") as f:
+                n = f.readinto(buf)
+                extra = f.read(1)
+        except OSError:
+            return False
+        if n != len(buf) or extra:
+            return False
+        magic, rows, cols, _, layout = struct.unpack_from(HEADER, buf, 0)
+        if magic != MAGIC or rows != self.rows or cols != self.cols or layout != self._layout:
+            return False
+        body = len(buf) - 4
+        if crc32(memoryview(buf)[0:body]) & 0xFFFFFFFF != struct.unpack_from("<I", buf, body)[0]:
+            return False
+        for k in range(len(self.duty)):
+            d = struct.unpack_from("<H", buf, HEADER_SIZE + 2 * k)[0]
+            self.duty[k] = d
+            self._saved[k] = d
+        return True
+
+    def save(self) -> bool:
+        """Write the table: temporary file, then rename over the old one."""
+        buf = self._file
+        struct.pack_into(HEADER, buf, 0, MAGIC, self.rows, self.cols, 0, self._layout)
+        for k in range(len(self.duty)):
+            struct.pack_into("<H", buf, HEADER_SIZE + 2 * k, self.duty[k])
+        body = len(buf) - 4
+        struct.pack_into("<I", buf, body, crc32(memoryview(buf)[0:body]) & 0xFFFFFFFF)
+        tmp = self.path + ".tmp"
+        self._since_ms = 0
+        try:
+            with open(tmp, "wb") as f:
+                f.write(buf)
+            # littlefs の rename は置き換えまで含めて不可分（FAT では先に消すので不可分ではない）
+            os.rename(tmp, self.path)
+        except OSError:
+            # 失敗しても次の書き込みは save_ms 後（フラッシュを叩き続けない）
+            self.write_errors += 1
+            return False
+        for k in range(len(self.duty)):
+            self._saved[k] = self.duty[k]
+        self.dirty = False
+        self.saves += 1
+        return True
+
+    def update(self, ctx) -> None:
+        """Blend the present operating point into the table; save when due."""
+        state = ctx.state
+        meas = state.meas
+        if (state.safety.status == "normal" and state.mppts.scan.phase == ScanState.IDLE
+                and meas.p_power_mw >= config.MPPT_SEEK_POWER_MW):
+            k = self.index(meas.b_voltage_mv, meas.p_voltage_mv)
+            duty = state.pwms.applied_duty_u16
+            old = self.duty[k]
+            new = duty if old == 0 else (3 * old + duty + 2) >> 2
+            self.duty[k] = new
+            change = new - self._saved[k]
+            if change < 0:
+                change = -change
+            if change >= config.WARM_MIN_CHANGE:
+                self.dirty = True
+        now = time.ticks_ms()
+        if self._since_ms < self.save_ms:
+            self._since_ms += time.ticks_diff(now, self._last_ms)
+        self._last_ms = now
+        if self.dirty and self._since_ms >= self.save_ms:
+            self.save()
+
+    def seed(self, b_voltage_mv: int, voc_mv: int) -> int:
+        """Duty to start from for this battery voltage and open-circuit voltage, 0 if none."""
+        vmp = (voc_mv * config.WARM_VMP_RATIO_Q8) >> 8
+        row = band(self.bv_edges, b_voltage_mv)
+        col = band(self.pv_edges, vmp)
+        best = 0
+        best_dist = 0
+        for r in range(self.rows):
+            for c in range(self.cols):
+                d = self.duty[r * self.cols + c]
+                if d == 0:
+                    continue
+                dist = (r - row if r > row else row - r) + (c - col if c > col else col - c)
+                if best == 0 or dist < best_dist:
+                    best = d
+                    best_dist = dist
+        if best == 0:
+            return 0
+        if best < config.MPPT_MIN_DUTY:
+            return config.MPPT_MIN_DUTY
+        if best > config.MPPT_MAX_DUTY:
+            return config.MPPT_MAX_DUTY
+        return best